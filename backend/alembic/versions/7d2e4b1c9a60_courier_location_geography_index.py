@@ -0,0 +1,26 @@
+"""courier location geography index
+
+Revision ID: 7d2e4b1c9a60
+Revises: b50b2ff93c85
+Create Date: 2026-10-18 09:31:12.502771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e4b1c9a60'
+down_revision: Union[str, None] = 'b50b2ff93c85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Expression index matching CRUDCourier.get_nearest_couriers (radius in meters + KNN order)
+    op.execute('CREATE INDEX IF NOT EXISTS idx_couriers_location_geog ON couriers USING gist (geography(location))')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS idx_couriers_location_geog')
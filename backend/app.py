@@ -86,7 +86,7 @@ def create_app():
              "origins": cors_origins,
              "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
              "allow_headers": ["Content-Type", "Authorization", "X-API-Key"],
-             "expose_headers": ["Content-Type", "Authorization"],
+             "expose_headers": ["Content-Type", "Authorization", "X-Total-Count", "X-Next-Cursor"],
              "supports_credentials": True,
              "max_age": 3600
          }},
@@ -143,6 +143,22 @@ def create_app():
     with app.app_context():
         db.create_all()
         print("Database tables initialized!")
+
+    # Per-request query counts / N+1 detection (GET /api/admin/perf)
+    from utils.query_stats import init_query_stats
+    init_query_stats(app)
+
+    # Address autocomplete index (built in the background, then kept current on commit)
+    from utils.address_index import address_index
+    address_index.warm(app)
+
+    # Daily stats rollups and the dashboard snapshot: register their commit hooks
+    import utils.daily_rollup  # noqa: F401
+    import utils.dashboard_cache  # noqa: F401
+
+    # Audit hash chain key: complain at startup, not on the first audit write
+    from utils.audit_chain import AuditChain
+    AuditChain.enabled()
     
     # HTML Templates routes
     @app.route('/')
@@ -164,45 +180,29 @@ def create_app():
     
     # Row-Level Security: Inject User ID into DB Session
     from flask import request
-    from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
     from sqlalchemy import text
+    from utils.identity import current_identity
     
     @app.before_request
     def set_db_context():
         # Only inject context for API routes requiring DB access
-        if request.path.startswith('/api/'):
+        if request.path.startswith('/api/') and db.engine.dialect.name == 'postgresql':
             try:
-                # IMPORTANT: We are temporarily catching all errors here because
-                # flask_jwt_extended might raise errors if not fully configured 
-                # (e.g. missing JWTManager(app))
-                try:
-                    verify_jwt_in_request(optional=True)
-                    identity = get_jwt_identity()
-                except Exception as e:
-                    # If JWT verification fails (e.g. not configured), treat as anonymous
-                    identity = None
-                    # print(f"DEBUG: JWT Verification Warning: {e}")
+                # Cached per token; on a miss the User is loaded once and shared with token_required
+                identity = current_identity()
 
-                if identity and 'postgresql' in str(db.engine.url):
-                    # Fetch user to check role (adds 1 query overhead but ensures security)
-                    from models import User 
-                    user = User.query.get(int(identity))
-                    
-                    if user and user.user_type == 'admin':
-                        db.session.execute(text("SET LOCAL app.is_admin = 'true'"))
-                    else:
-                        db.session.execute(text("SET LOCAL app.is_admin = 'false'"))
-
-                    db.session.execute(text(f"SET LOCAL app.current_user_id = '{identity}'"))
-                elif 'postgresql' in str(db.engine.url):
+                if identity:
+                    is_admin = 'true' if identity.user_type == 'admin' else 'false'
+                    db.session.execute(text(f"SET LOCAL app.is_admin = '{is_admin}'"))
+                    db.session.execute(text(f"SET LOCAL app.current_user_id = '{int(identity.user_id)}'"))
+                else:
                     # Anonymous
                     db.session.execute(text("SET LOCAL app.current_user_id = '-1'"))
                     db.session.execute(text("SET LOCAL app.is_admin = 'false'"))
                     
             except Exception as e:
                 db.session.rollback()
-                # print(f"DEBUG: DB Context Error: {e}")
-                pass
+                app.logger.warning(f"DB context error: {e}")
     
     # Create database tables & Auto-Seed
     with app.app_context():
@@ -270,6 +270,71 @@ def create_app():
         print(f"🔑 Key: {full_key}")
         print("⚠️  SAVE THIS KEY! It cannot be retrieved later.")
 
+    @app.cli.command("allocate-pending")
+    @click.option("--limit", default=None, type=int, help="Max deliveries to allocate in this batch.")
+    def allocate_pending(limit):
+        """Globally assign all pending deliveries that have no courier."""
+        from utils.batch_allocation import BatchAllocationEngine
+        assigned = BatchAllocationEngine.allocate_pending(limit=limit)
+        print(f"Assigned {len(assigned)} deliveries")
+
+    @app.cli.command("compact-tracking")
+    @click.option("--limit", default=500, type=int, help="Max deliveries to compact in this run.")
+    def compact_tracking(limit):
+        """Roll up closed deliveries' GPS breadcrumbs into compressed segments."""
+        from utils.track_storage import TrackStorage
+        deliveries, points = TrackStorage.compact_closed(limit=limit)
+        print(f"Compacted {points} points from {deliveries} deliveries")
+
+    @app.cli.command("purge-route-cache")
+    def purge_route_cache():
+        """Delete expired entries from the persistent route cache."""
+        from utils.route_cache import route_cache
+        print(f"Purged {route_cache.purge_expired()} expired routes")
+
+    @app.cli.command("geocode-addresses")
+    @click.option("--limit", default=None, type=int, help="Max Address rows to look at.")
+    def geocode_addresses(limit):
+        """Backfill lat/lng for Address rows that have none (respects the geocoder rate limit)."""
+        from utils.geocoding import geocoder
+        updated, lookups = geocoder.backfill_addresses(limit=limit)
+        print(f"Geocoded {updated} addresses with {lookups} lookups")
+
+    @app.cli.command("dedup-addresses")
+    def dedup_addresses():
+        """Merge duplicate addresses and pickup/delivery points, rewriting foreign keys."""
+        from utils.address_dedup import address_dedup
+        merged = address_dedup.compact()
+        print(f"Merged {merged['addresses']} addresses, {merged['pickup_points']} pickup points "
+              f"and {merged['delivery_points']} delivery points")
+
+    @app.cli.command("rollup-stats")
+    def rollup_stats():
+        """Rebuild the daily order/revenue/courier rollup tables from scratch."""
+        from utils.daily_rollup import daily_rollup
+        print(f"Rebuilt daily rollups for {daily_rollup.rebuild()} days")
+
+    @app.cli.command("verify-audit")
+    @click.option("--from", "start_seq", default=None, type=int,
+                  help="First seq to verify (resumes from the nearest checkpoint; default: oldest retained row).")
+    @click.option("--to", "end_seq", default=None, type=int, help="Last seq to verify (default: chain head).")
+    def verify_audit(start_seq, end_seq):
+        """Verify the audit log hash chain and report throughput."""
+        from utils.audit_chain import AuditChain
+        result = AuditChain.verify(db.session, start_seq=start_seq, end_seq=end_seq)
+        status = "OK" if result['ok'] else f"BROKEN at seq {result['first_bad_seq']}: {result['error']}"
+        print(f"{status} - {result['rows']} rows from seq {result['checked_from']} "
+              f"in {result['seconds']}s ({result['rows_per_sec']} rows/sec)")
+
+    @app.cli.command("archive-partitions")
+    def archive_partitions():
+        """Create upcoming monthly partitions; export expired months to NDJSON.gz and drop them."""
+        from utils.partitions import partition_manager
+        result = partition_manager.run()
+        for item in result['archived']:
+            print(f"Archived {item['rows']} rows of {item['table']} for {item['month']} to {item['path']}")
+        print(f"Created {len(result['created'])} partitions, archived {len(result['archived'])} months")
+
     @app.cli.command("seed-perf")
     def seed_performance():
         """Generates 10k users and orders for stress testing."""
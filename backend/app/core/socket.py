@@ -1,14 +1,27 @@
 import socketio
 import asyncio
-from typing import Any
+import redis
+from typing import Any, Dict, Optional
+from app.core.config import settings
 from app.core.db import SessionLocal
 from app.crud.courier import courier as crud_courier
 from app.crud.user import user as crud_user
-from app.schemas.courier import CourierUpdate
+from utils.live_locations import LiveLocationStore
+from utils.location_buffer import LocationWriteBuffer
 
 # Allow all origins for now
 sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
 
+# Live positions go to the Redis GEO set shared with the Go realtime-engine
+live_locations = LiveLocationStore(
+    redis.Redis(host=settings.REDIS_HOST, port=int(settings.REDIS_PORT), decode_responses=True)
+)
+
+# user_id -> courier_id, so pings don't hit the DB just to resolve the courier
+_courier_ids: Dict[int, int] = {}
+
+_flush_task: Optional[asyncio.Task] = None
+
 @sio.event
 async def connect(sid, environ):
     print(f"Client connected: {sid}")
@@ -55,22 +68,48 @@ async def update_location(sid, data):
         await sio.emit('courier_location', data, room=f"tracking_courier_{user_id}")
         await sio.emit('courier_location', data, room="admin_tracking")
 
-        # Update DB (Sync operation - potentially blocking, be careful in heavy load)
         # Ideally verify user identity via token in connect, but for MVP trust the ID or rely on handshake auth
-        # For now, let's just update the DB
-        
-        # We need to run this in a thread to avoid blocking the async event loop
-        await asyncio.to_thread(update_db_location, user_id, lat, lng)
+        # We need to run these in a thread to avoid blocking the async event loop
+        courier_id = await asyncio.to_thread(get_courier_id, user_id)
+        if courier_id is None:
+            return
+
+        # Redis is updated right away; a Redis outage must not stop the DB write
+        try:
+            await asyncio.to_thread(live_locations.update, courier_id, lat, lng)
+        except Exception as e:
+            print(f"Live location store error: {e}")
+
+        # The DB write is buffered and flushed in batches
+        db_location_buffer.add(courier_id, lat, lng)
+        ensure_location_flusher()
         
     except Exception as e:
         print(f"Error updating location: {e}")
 
-def update_db_location(user_id: int, lat: float, lng: float):
+def get_courier_id(user_id: int) -> Optional[int]:
+    courier_id = _courier_ids.get(user_id)
+    if courier_id is None:
+        with SessionLocal() as db:
+            courier = crud_courier.get_by_user_id(db, user_id=user_id)
+            if not courier:
+                return None
+            courier_id = _courier_ids[user_id] = courier.id
+    return courier_id
+
+def write_db_locations(positions, tracking):
     with SessionLocal() as db:
-        courier = crud_courier.get_by_user_id(db, user_id=user_id)
-        if courier:
-            crud_courier.update(db, db_obj=courier, obj_in=CourierUpdate(
-                current_latitude=lat,
-                current_longitude=lng,
-                is_online=True # Implicitly online if sending updates
-            ))
+        crud_courier.bulk_update_locations(db, positions)
+
+# Write-behind buffer: one bulk UPDATE per interval instead of a commit per ping
+db_location_buffer = LocationWriteBuffer(write_db_locations)
+
+async def flush_locations_forever():
+    while True:
+        await asyncio.sleep(db_location_buffer.FLUSH_INTERVAL_SECONDS)
+        await asyncio.to_thread(db_location_buffer.flush)
+
+def ensure_location_flusher():
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.get_running_loop().create_task(flush_locations_forever())
@@ -1,9 +1,9 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, update
 from app.models.courier import Courier
 from app.schemas.courier import CourierCreate, CourierUpdate
-from geoalchemy2.elements import WKTElement
+from geoalchemy2 import Geography
 
 class CRUDCourier:
     def get(self, db: Session, id: int):
@@ -62,24 +62,42 @@ class CRUDCourier:
         db.refresh(db_obj)
         return db_obj
 
+    def bulk_update_locations(self, db: Session, positions: Dict[int, Tuple[float, float]]) -> None:
+        """
+        Write a batch of coalesced GPS positions {courier_id: (lat, lng)} with a
+        single executemany UPDATE, keeping the PostGIS point in sync.
+        """
+        if not positions:
+            return
+        couriers = Courier.__table__
+        stmt = update(couriers).where(couriers.c.id == bindparam('b_id')).values(
+            current_latitude=bindparam('b_lat'),
+            current_longitude=bindparam('b_lng'),
+            location=bindparam('b_location', type_=couriers.c.location.type),
+            is_online=True,  # Implicitly online if sending updates
+            last_seen=func.now(),
+        )
+        db.execute(stmt, [
+            {'b_id': courier_id, 'b_lat': lat, 'b_lng': lng, 'b_location': f"SRID=4326;POINT({lng} {lat})"}
+            for courier_id, (lat, lng) in positions.items()
+        ])
+        db.commit()
+
     def get_nearest_couriers(self, db: Session, lat: float, lng: float, radius_km: float = 10.0, limit: int = 5) -> List[Courier]:
         """
         Find nearest available and online couriers within a radius.
+        Filters and orders on geography(location) in meters, which is served by
+        the idx_couriers_location_geog expression GiST index.
         """
-        point = WKTElement(f'POINT({lng} {lat})', srid=4326)
-        
+        point = func.ST_GeogFromText(f'SRID=4326;POINT({lng} {lat})', type_=Geography)
+        location = func.geography(Courier.location, type_=Geography)
+
         return db.query(Courier).filter(
             Courier.is_available == True,
             Courier.is_online == True,
-            func.ST_DWithin(Courier.location, point, radius_km * 1000) # Radius in meters (if using geography type) or degrees? 
-            # PostGIS Geometry type in 4326 uses degrees for ST_DWithin if logic is not cast to geography.
-            # Usually better to cast to Geography for meters: ST_DWithin(geom::geography, point::geography, meters)
-        ).filter(
-             # Alternative: use ST_DistanceSphere or cast to geography
-             func.ST_DistanceSphere(Courier.location, point) <= radius_km * 1000
+            func.ST_DWithin(location, point, radius_km * 1000)
         ).order_by(
-            # Order by distance
-            func.ST_DistanceSphere(Courier.location, point)
+            location.op('<->')(point)
         ).limit(limit).all()
 
 courier = CRUDCourier()
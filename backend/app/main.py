@@ -34,3 +34,10 @@ def root():
 from app.core.socket import sio
 import socketio
 application = socketio.ASGIApp(sio, app)
+
+
+@app.on_event("shutdown")
+def flush_location_buffer():
+    # Don't lose the last buffered GPS positions on shutdown
+    from app.core.socket import db_location_buffer
+    db_location_buffer.flush()
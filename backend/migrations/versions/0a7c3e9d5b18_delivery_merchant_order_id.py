@@ -0,0 +1,28 @@
+"""Merchant order id on deliveries (external API idempotency)
+
+Revision ID: 0a7c3e9d5b18
+Revises: f19d5c3a7e62
+Create Date: 2026-10-18 18:02:47.930561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7c3e9d5b18'
+down_revision = 'f19d5c3a7e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('merchant_order_id', sa.String(length=100), nullable=True))
+        batch_op.create_unique_constraint('uq_deliveries_merchant_order_id', ['merchant_order_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_deliveries_merchant_order_id', type_='unique')
+        batch_op.drop_column('merchant_order_id')
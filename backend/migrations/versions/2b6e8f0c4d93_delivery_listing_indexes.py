@@ -0,0 +1,29 @@
+"""Indexes for keyset-paginated order listings
+
+Revision ID: 2b6e8f0c4d93
+Revises: 0a7c3e9d5b18
+Create Date: 2026-10-18 19:15:36.274810
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2b6e8f0c4d93'
+down_revision = '0a7c3e9d5b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.create_index('idx_delivery_created_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('idx_delivery_customer_created', ['customer_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('idx_delivery_courier_created', ['courier_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.drop_index('idx_delivery_courier_created')
+        batch_op.drop_index('idx_delivery_customer_created')
+        batch_op.drop_index('idx_delivery_created_id')
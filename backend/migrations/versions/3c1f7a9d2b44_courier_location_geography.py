@@ -0,0 +1,50 @@
+"""Courier location geography column
+
+Revision ID: 3c1f7a9d2b44
+Revises: 9eb0c06c006c
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f7a9d2b44'
+down_revision = '9eb0c06c006c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite dev databases keep the EWKT as plain text (see Courier.location_geog)
+        with op.batch_alter_table('couriers', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('location_geog', sa.Text(), nullable=True))
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+
+    with op.batch_alter_table('couriers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('location_geog', geoalchemy2.types.Geography(geometry_type='POINT', srid=4326, spatial_index=False, from_text='ST_GeogFromText', name='geography'), nullable=True))
+
+    # Backfill from the existing lat/lng columns
+    op.execute("""
+        UPDATE couriers
+        SET location_geog = ST_SetSRID(ST_MakePoint(current_location_lng, current_location_lat), 4326)::geography
+        WHERE current_location_lat IS NOT NULL AND current_location_lng IS NOT NULL
+    """)
+
+    op.create_index('idx_courier_location_geog', 'couriers', ['location_geog'], unique=False, postgresql_using='gist')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('couriers', schema=None) as batch_op:
+            batch_op.drop_column('location_geog')
+        return
+
+    op.drop_index('idx_courier_location_geog', table_name='couriers', postgresql_using='gist')
+    with op.batch_alter_table('couriers', schema=None) as batch_op:
+        batch_op.drop_column('location_geog')
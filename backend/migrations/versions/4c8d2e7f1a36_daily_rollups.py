@@ -0,0 +1,65 @@
+"""Daily order/revenue/courier rollup tables
+
+Revision ID: 4c8d2e7f1a36
+Revises: 2b6e8f0c4d93
+Create Date: 2026-10-18 20:41:07.512309
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8d2e7f1a36'
+down_revision = '2b6e8f0c4d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty: the first read (or `flask rollup-stats`) rebuilds them
+    op.create_table('daily_order_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('invoiced_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('day', 'status')
+    )
+    with op.batch_alter_table('daily_order_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_order_stats_refreshed_at'), ['refreshed_at'], unique=False)
+
+    op.create_table('daily_revenue_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('invoices', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'status')
+    )
+    op.create_table('daily_courier_stats',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('courier_id', sa.Integer(), nullable=False),
+        sa.Column('deliveries', sa.Integer(), nullable=False),
+        sa.Column('delivered', sa.Integer(), nullable=False),
+        sa.Column('fees', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], ),
+        sa.PrimaryKeyConstraint('day', 'courier_id')
+    )
+
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.create_index('idx_delivery_updated', ['updated_at'], unique=False)
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_invoices_issue_date'), ['issue_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_invoices_issue_date'))
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.drop_index('idx_delivery_updated')
+
+    op.drop_table('daily_courier_stats')
+    op.drop_table('daily_revenue_stats')
+    with op.batch_alter_table('daily_order_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_order_stats_refreshed_at'))
+    op.drop_table('daily_order_stats')
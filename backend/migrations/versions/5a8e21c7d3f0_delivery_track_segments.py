@@ -0,0 +1,43 @@
+"""Compacted delivery track segments
+
+Revision ID: 5a8e21c7d3f0
+Revises: 3c1f7a9d2b44
+Create Date: 2026-10-18 11:40:02.513377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8e21c7d3f0'
+down_revision = '3c1f7a9d2b44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('delivery_track_segments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('delivery_id', sa.Integer(), nullable=False),
+    sa.Column('courier_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('point_count', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('ended_at', sa.DateTime(), nullable=False),
+    sa.Column('encoding', sa.SmallInteger(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], ),
+    sa.ForeignKeyConstraint(['delivery_id'], ['deliveries.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('delivery_id', 'seq', name='uq_track_segment_delivery_seq')
+    )
+    with op.batch_alter_table('delivery_track_segments', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_delivery_track_segments_delivery_id'), ['delivery_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_track_segments', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_delivery_track_segments_delivery_id'))
+
+    op.drop_table('delivery_track_segments')
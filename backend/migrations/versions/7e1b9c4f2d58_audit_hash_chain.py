@@ -0,0 +1,42 @@
+"""Hash-chain audit_logs and add signed checkpoints
+
+Revision ID: 7e1b9c4f2d58
+Revises: 4c8d2e7f1a36
+Create Date: 2026-10-18 22:03:44.901276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1b9c4f2d58'
+down_revision = '4c8d2e7f1a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows stay unchained (seq NULL); the chain starts with the next entry
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('prev_digest', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('digest', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_audit_logs_seq', ['seq'])
+
+    op.create_table('audit_checkpoints',
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('signature', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('seq')
+    )
+
+
+def downgrade():
+    op.drop_table('audit_checkpoints')
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_audit_logs_seq', type_='unique')
+        batch_op.drop_column('digest')
+        batch_op.drop_column('prev_digest')
+        batch_op.drop_column('seq')
@@ -0,0 +1,91 @@
+"""Monthly partitions for audit_logs and delivery_tracking (Postgres), timestamp indexes
+
+Revision ID: 8f3a6c1d9e27
+Revises: 7e1b9c4f2d58
+Create Date: 2026-10-18 23:41:09.117530
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a6c1d9e27'
+down_revision = '7e1b9c4f2d58'
+branch_labels = None
+depends_on = None
+
+
+# table -> (foreign keys, extra indexes); mirrors models.AuditLog / models.DeliveryTracking
+PARTITIONED = {
+    'audit_logs': (
+        ['FOREIGN KEY (user_id) REFERENCES users (id)'],
+        ['CREATE INDEX ix_audit_logs_seq ON audit_logs (seq)'],
+    ),
+    'delivery_tracking': (
+        ['FOREIGN KEY (delivery_id) REFERENCES deliveries (id)',
+         'FOREIGN KEY (courier_id) REFERENCES couriers (id)'],
+        [],
+    ),
+}
+MONTHS_AHEAD = 2
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_audit_logs_timestamp', 'audit_logs', ['timestamp'], unique=False)
+        op.create_index('ix_delivery_tracking_timestamp', 'delivery_tracking', ['timestamp'], unique=False)
+        return
+
+    for table, (foreign_keys, indexes) in PARTITIONED.items():
+        old = f'{table}_unpartitioned'
+        op.execute(f'ALTER TABLE {table} RENAME TO {old}')
+        # The partition key is part of the primary key, so it can't be NULL
+        op.execute(f'''UPDATE {old} SET "timestamp" = '1970-01-01' WHERE "timestamp" IS NULL''')
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "timestamp" SET NOT NULL')
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        op.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")')
+        for foreign_key in foreign_keys:
+            op.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+        op.execute(f'CREATE INDEX ix_{table}_timestamp ON {table} ("timestamp")')
+        for index in indexes:
+            op.execute(index)
+
+        # One partition per month from the oldest row through MONTHS_AHEAD months from now
+        op.execute(f'''
+            DO $$
+            DECLARE m date;
+            BEGIN
+                FOR m IN SELECT generate_series(
+                    date_trunc('month', COALESCE((SELECT min("timestamp") FROM {old}), now() AT TIME ZONE 'utc')),
+                    date_trunc('month', now() AT TIME ZONE 'utc') + interval '{MONTHS_AHEAD} months',
+                    interval '1 month')::date
+                LOOP
+                    EXECUTE format('CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                                   '{table}_p' || to_char(m, 'YYYYMM'), m, (m + interval '1 month')::date);
+                END LOOP;
+            END $$
+        ''')
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+        op.execute(f'DROP TABLE {old}')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_delivery_tracking_timestamp', table_name='delivery_tracking')
+        op.drop_index('ix_audit_logs_timestamp', table_name='audit_logs')
+        return
+
+    for table, (foreign_keys, indexes) in PARTITIONED.items():
+        old = f'{table}_partitioned'
+        op.execute(f'ALTER TABLE {table} RENAME TO {old}')
+        op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)')
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        op.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id)')
+        for foreign_key in foreign_keys:
+            op.execute(f'ALTER TABLE {table} ADD {foreign_key}')
+        op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+        op.execute(f'DROP TABLE {old}')
+    op.execute('ALTER TABLE audit_logs ADD CONSTRAINT uq_audit_logs_seq UNIQUE (seq)')
@@ -0,0 +1,39 @@
+"""Scope merchant_order_id to the merchant's API key
+
+Revision ID: 9d4b7e2c6a10
+Revises: 8f3a6c1d9e27
+Create Date: 2026-10-19 10:12:36.482905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b7e2c6a10'
+down_revision = '8f3a6c1d9e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('api_key_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_deliveries_api_key_id_api_keys', 'api_keys', ['api_key_id'], ['id'])
+        batch_op.drop_constraint('uq_deliveries_merchant_order_id', type_='unique')
+
+    # Existing orders came in with the shared key (api_key_id NULL)
+    op.create_index('uq_delivery_merchant_order', 'deliveries', ['api_key_id', 'merchant_order_id'], unique=True,
+                    postgresql_where=sa.text('api_key_id IS NOT NULL'), sqlite_where=sa.text('api_key_id IS NOT NULL'))
+    op.create_index('uq_delivery_shared_merchant_order', 'deliveries', ['merchant_order_id'], unique=True,
+                    postgresql_where=sa.text('api_key_id IS NULL'), sqlite_where=sa.text('api_key_id IS NULL'))
+
+
+def downgrade():
+    op.drop_index('uq_delivery_shared_merchant_order', table_name='deliveries')
+    op.drop_index('uq_delivery_merchant_order', table_name='deliveries')
+
+    with op.batch_alter_table('deliveries', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_deliveries_merchant_order_id', ['merchant_order_id'])
+        batch_op.drop_constraint('fk_deliveries_api_key_id_api_keys', type_='foreignkey')
+        batch_op.drop_column('api_key_id')
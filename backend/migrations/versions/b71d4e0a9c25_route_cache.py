@@ -0,0 +1,36 @@
+"""Route cache table
+
+Revision ID: b71d4e0a9c25
+Revises: 5a8e21c7d3f0
+Create Date: 2026-10-18 13:05:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d4e0a9c25'
+down_revision = '5a8e21c7d3f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('route_cache',
+    sa.Column('key', sa.String(length=40), nullable=False),
+    sa.Column('distance_km', sa.Float(), nullable=False),
+    sa.Column('duration_min', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('route_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_route_cache_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('route_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_route_cache_expires_at'))
+
+    op.drop_table('route_cache')
@@ -0,0 +1,32 @@
+"""Trigram index for address autocomplete (Postgres only)
+
+Revision ID: e6c2b8f41a9d
+Revises: d4a93f6b1e07
+Create Date: 2026-10-18 15:08:12.402117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6c2b8f41a9d'
+down_revision = 'd4a93f6b1e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Must match the expression used by routes.addresses._autocomplete_trgm
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_addresses_full_trgm ON addresses "
+        "USING gin ((street || ' ' || building_number || ', ' || city) gin_trgm_ops)"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_addresses_full_trgm')
@@ -0,0 +1,41 @@
+"""Address dedup hash and point address indexes
+
+Revision ID: f19d5c3a7e62
+Revises: e6c2b8f41a9d
+Create Date: 2026-10-18 16:41:05.118294
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f19d5c3a7e62'
+down_revision = 'e6c2b8f41a9d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('address_hash', sa.String(length=40), nullable=True))
+        batch_op.create_index(batch_op.f('ix_addresses_address_hash'), ['address_hash'], unique=False)
+
+    with op.batch_alter_table('pickup_points', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pickup_points_address_id'), ['address_id'], unique=False)
+
+    with op.batch_alter_table('delivery_points', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_delivery_points_address_id'), ['address_id'], unique=False)
+    # Existing rows get their hash (and are merged) by `flask dedup-addresses`
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_points', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_delivery_points_address_id'))
+
+    with op.batch_alter_table('pickup_points', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pickup_points_address_id'))
+
+    with op.batch_alter_table('addresses', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_addresses_address_hash'))
+        batch_op.drop_column('address_hash')
@@ -1,7 +1,7 @@
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
-from geoalchemy2 import Geometry
+from geoalchemy2 import Geometry, Geography
 
 # ============================================================================
 # Shared Enums
@@ -131,9 +131,12 @@ class Courier(db.Model):
     max_capacity = db.Column(db.Integer, default=10)  # מקסימום משלוחים בו-זמנית
     current_location_lat = db.Column(db.Float, nullable=True)
     current_location_lng = db.Column(db.Float, nullable=True)
-    # PostGIS Field: Point(lng, lat)
-    # location_geom = db.Column(Geometry(geometry_type='POINT', srid=4326), nullable=True)
-    # location_geom = db.Column(Geometry(geometry_type='POINT', srid=4326), nullable=True)
+    # PostGIS Field: geography Point(lng, lat), kept in sync with the lat/lng columns.
+    # Stored as plain text on SQLite so local dev works without SpatiaLite.
+    location_geog = db.deferred(db.Column(
+        Geography(geometry_type='POINT', srid=4326, spatial_index=False).with_variant(db.Text(), 'sqlite'),
+        nullable=True
+    ))
     is_available = db.Column(db.Boolean, default=True)
     
     # Compliance & Onboarding
@@ -159,19 +162,41 @@ class Courier(db.Model):
     # Relationships
     deliveries = db.relationship('Delivery', backref='courier', lazy='dynamic')
     tracking = db.relationship('DeliveryTracking', backref='courier', lazy='dynamic', cascade='all, delete-orphan')
+    track_segments = db.relationship('DeliveryTrackSegment', backref='courier', lazy='dynamic', cascade='all, delete-orphan')
     ratings = db.relationship('Rating', backref='courier', lazy='dynamic', cascade='all, delete-orphan')
     documents = db.relationship('CourierDocument', backref='courier', lazy='dynamic', cascade='all, delete-orphan')
     
     __table_args__ = (
         db.Index('idx_courier_available', 'is_available'),
         db.Index('idx_courier_location', 'current_location_lat', 'current_location_lng'),
+        db.Index('idx_courier_location_geog', 'location_geog', postgresql_using='gist'),
         {'extend_existing': True}
     )
 
+    @staticmethod
+    def location_ewkt(lat, lng):
+        """EWKT for the location_geog column (None when the position is unknown)."""
+        if lat is None or lng is None:
+            return None
+        return f'SRID=4326;POINT({lng} {lat})'
+
     def __repr__(self):
         return f'<Courier {self.full_name}>'
 
 
+@db.event.listens_for(Courier, 'before_insert')
+def _set_courier_location_geog(mapper, connection, target):
+    target.location_geog = Courier.location_ewkt(target.current_location_lat, target.current_location_lng)
+
+
+@db.event.listens_for(Courier, 'before_update')
+def _sync_courier_location_geog(mapper, connection, target):
+    # Every ORM write path keeps the geography column in step with lat/lng
+    attrs = db.inspect(target).attrs
+    if attrs.current_location_lat.history.has_changes() or attrs.current_location_lng.history.has_changes():
+        _set_courier_location_geog(mapper, connection, target)
+
+
 # ============================================================================
 # Address Model
 # ============================================================================
@@ -194,16 +219,42 @@ class Address(db.Model):
     # PostGIS Field: Point(lng, lat)
     # geom = db.Column(Geometry(geometry_type='POINT', srid=4326), nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    # Dedup key: normalized address fields + rounded coordinates (see utils.address_dedup)
+    address_hash = db.Column(db.String(40), nullable=True, index=True)
     
     # Relationships
     user = db.relationship('User', backref=db.backref('addresses', lazy='dynamic'))
     pickup_points = db.relationship('PickupPoint', backref='address', lazy='dynamic', cascade='all, delete-orphan')
     delivery_points = db.relationship('DeliveryPoint', backref='address', lazy='dynamic', cascade='all, delete-orphan')
     
+    COORD_DECIMALS = 4  # ~11m: the same building geocoded twice lands in the same bucket
+
+    @staticmethod
+    def fingerprint(street, building_number, city, apartment=None, floor=None, entrance=None,
+                    latitude=None, longitude=None, user_id=None):
+        """Canonical hash of an address; equal for spelling variants of the same place"""
+        import hashlib
+        from utils.geocoding import normalize_address
+        coords = '' if latitude is None or longitude is None else \
+            f"{round(float(latitude), Address.COORD_DECIMALS)},{round(float(longitude), Address.COORD_DECIMALS)}"
+        parts = [normalize_address(p) for p in (street, building_number, city, apartment, floor, entrance)]
+        parts += [coords, str(user_id or '')]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def compute_hash(self):
+        return Address.fingerprint(self.street, self.building_number, self.city, self.apartment, self.floor,
+                                   self.entrance, self.latitude, self.longitude, self.user_id)
+
     def __repr__(self):
         return f'<Address {self.street} {self.building_number}, {self.city}>'
 
 
+@db.event.listens_for(Address, 'before_insert')
+@db.event.listens_for(Address, 'before_update')
+def _set_address_hash(mapper, connection, target):
+    target.address_hash = target.compute_hash()
+
+
 # ============================================================================
 # Pickup Point Model
 # ============================================================================
@@ -213,7 +264,7 @@ class PickupPoint(db.Model):
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    address_id = db.Column(db.Integer, db.ForeignKey('addresses.id'), nullable=False)
+    address_id = db.Column(db.Integer, db.ForeignKey('addresses.id'), nullable=False, index=True)
     contact_name = db.Column(db.String(100), nullable=False)
     contact_phone = db.Column(db.String(20), nullable=False)
     business_name = db.Column(db.String(100), nullable=True)
@@ -236,7 +287,7 @@ class DeliveryPoint(db.Model):
     __table_args__ = {'extend_existing': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    address_id = db.Column(db.Integer, db.ForeignKey('addresses.id'), nullable=False)
+    address_id = db.Column(db.Integer, db.ForeignKey('addresses.id'), nullable=False, index=True)
     recipient_name = db.Column(db.String(100), nullable=False)
     recipient_phone = db.Column(db.String(20), nullable=False)
     delivery_instructions = db.Column(db.Text, nullable=True)
@@ -298,6 +349,8 @@ class Delivery(db.Model):
     biometric_verification_required = db.Column(db.Boolean, default=False)
 
     tracking_number = db.Column(db.String(100), unique=True, nullable=True) # External/Barcode
+    merchant_order_id = db.Column(db.String(100), nullable=True) # External API idempotency key, per merchant
+    api_key_id = db.Column(db.Integer, db.ForeignKey('api_keys.id'), nullable=True) # Merchant key that sent it (None: shared key)
     
     # Proof of Delivery (POD)
     pod_signature_path = db.Column(db.String(255), nullable=True)
@@ -317,6 +370,7 @@ class Delivery(db.Model):
     status_history = db.relationship('DeliveryStatus', backref='delivery', lazy='dynamic', cascade='all, delete-orphan', order_by='DeliveryStatus.timestamp.desc()')
     invoice = db.relationship('Invoice', backref='delivery', uselist=False, cascade='all, delete-orphan')
     tracking = db.relationship('DeliveryTracking', backref='delivery', lazy='dynamic', cascade='all, delete-orphan')
+    track_segments = db.relationship('DeliveryTrackSegment', backref='delivery', lazy='dynamic', cascade='all, delete-orphan', order_by='DeliveryTrackSegment.seq')
     rating = db.relationship('Rating', backref='delivery', uselist=False, cascade='all, delete-orphan')
     notifications = db.relationship('Notification', backref='delivery', lazy='dynamic', cascade='all, delete-orphan')
     
@@ -324,6 +378,17 @@ class Delivery(db.Model):
         db.Index('idx_delivery_status', 'status'),
         db.Index('idx_delivery_created', 'created_at'),
         db.Index('idx_delivery_courier_status', 'courier_id', 'status'),
+        # Keyset pagination of order listings (created_at DESC, id DESC), per role scope
+        db.Index('idx_delivery_created_id', 'created_at', 'id'),
+        db.Index('idx_delivery_customer_created', 'customer_id', 'created_at', 'id'),
+        db.Index('idx_delivery_courier_created', 'courier_id', 'created_at', 'id'),
+        # Daily rollups pick up rows changed since their last refresh
+        db.Index('idx_delivery_updated', 'updated_at'),
+        # merchant_order_id is unique per merchant key; orders sent with the shared key share one namespace
+        db.Index('uq_delivery_merchant_order', 'api_key_id', 'merchant_order_id', unique=True,
+                 postgresql_where=db.text('api_key_id IS NOT NULL'), sqlite_where=db.text('api_key_id IS NOT NULL')),
+        db.Index('uq_delivery_shared_merchant_order', 'merchant_order_id', unique=True,
+                 postgresql_where=db.text('api_key_id IS NULL'), sqlite_where=db.text('api_key_id IS NULL')),
         {'extend_existing': True}
     )
 
@@ -388,7 +453,7 @@ class Invoice(db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
     delivery_id = db.Column(db.Integer, db.ForeignKey('deliveries.id'), nullable=False, unique=True)
     
-    issue_date = db.Column(db.DateTime, default=datetime.utcnow)
+    issue_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     due_date = db.Column(db.DateTime, nullable=True)
     
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)
@@ -443,12 +508,35 @@ class DeliveryTracking(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     speed = db.Column(db.Float, nullable=True)  # km/h
     heading = db.Column(db.Float, nullable=True)  # degrees
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Partition key on Postgres (monthly, see utils/partitions.py)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
     def __repr__(self):
         return f'<DeliveryTracking {self.delivery_id} at {self.timestamp}>'
 
 
+class DeliveryTrackSegment(db.Model):
+    """Compacted breadcrumbs of a closed delivery (see utils/track_storage.py)"""
+    __tablename__ = 'delivery_track_segments'
+    __table_args__ = (
+        db.UniqueConstraint('delivery_id', 'seq', name='uq_track_segment_delivery_seq'),
+        {'extend_existing': True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    delivery_id = db.Column(db.Integer, db.ForeignKey('deliveries.id'), nullable=False, index=True)
+    courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+    point_count = db.Column(db.Integer, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=False)
+    encoding = db.Column(db.SmallInteger, nullable=False, default=1)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f'<DeliveryTrackSegment {self.delivery_id}#{self.seq} ({self.point_count} points)>'
+
+
 # ============================================================================
 # Rating Model
 # ============================================================================
@@ -509,7 +597,15 @@ class AuditLog(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)
     status = db.Column(db.String(20), default='SUCCESS') # 'SUCCESS', 'FAILURE'
     details = db.Column(db.Text, nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Partition key on Postgres (monthly, see utils/partitions.py)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    # Hash chain (utils/audit_chain.py): position, previous row's digest, HMAC over both + content.
+    # A partitioned table can't hold a unique index without the partition key: on Postgres
+    # seq is a plain index and the chain writer's advisory lock keeps it unique.
+    seq = db.Column(db.BigInteger, nullable=True, unique=True)
+    prev_digest = db.Column(db.String(64), nullable=True)
+    digest = db.Column(db.String(64), nullable=True)
     
     # Relationships
     user = db.relationship('User', backref='audit_logs')
@@ -518,6 +614,20 @@ class AuditLog(db.Model):
         return f'<AuditLog {self.action} by {self.user_id} at {self.timestamp}>'
 
 
+class AuditCheckpoint(db.Model):
+    """Signed chain head every AuditChain.CHECKPOINT_INTERVAL rows, to verify a range without rescanning from genesis"""
+    __tablename__ = 'audit_checkpoints'
+    __table_args__ = {'extend_existing': True}
+
+    seq = db.Column(db.BigInteger, primary_key=True)
+    digest = db.Column(db.String(64), nullable=False)
+    signature = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AuditCheckpoint {self.seq}>'
+
+
 # ============================================================================
 # Courier Documents Model
 # ============================================================================
@@ -871,3 +981,86 @@ class ApiKey(db.Model):
 
     def __repr__(self):
         return f'<ApiKey {self.merchant_name} ({self.prefix})>'
+
+
+# ============================================================================
+# Routing & Geocoding Caches
+# ============================================================================
+
+class RouteCacheEntry(db.Model):
+    """Persistent tier of utils/route_cache.RouteCache, keyed by quantized endpoints"""
+    __tablename__ = 'route_cache'
+    __table_args__ = {'extend_existing': True}
+
+    key = db.Column(db.String(40), primary_key=True)  # "<from geohash>:<to geohash>"
+    distance_km = db.Column(db.Float, nullable=False)
+    duration_min = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RouteCacheEntry {self.key}>'
+
+
+class GeocodeCacheEntry(db.Model):
+    """Persistent tier of utils/geocoding.GeocodingService, keyed by the normalized address"""
+    __tablename__ = 'geocode_cache'
+    __table_args__ = {'extend_existing': True}
+
+    key = db.Column(db.String(40), primary_key=True)  # sha1 of the normalized query
+    normalized = db.Column(db.String(255), nullable=False)
+    latitude = db.Column(db.Float, nullable=True)  # NULL = provider had no match
+    longitude = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<GeocodeCacheEntry {self.normalized}>'
+
+
+# ============================================================================
+# Daily Rollups (maintained by utils/daily_rollup.py)
+# ============================================================================
+
+class DailyOrderStats(db.Model):
+    """Deliveries created per day and current status, with their invoiced total"""
+    __tablename__ = 'daily_order_stats'
+    __table_args__ = {'extend_existing': True}
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    invoiced_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<DailyOrderStats {self.day} {self.status}: {self.orders}>'
+
+
+class DailyRevenueStats(db.Model):
+    """Invoices issued per day and invoice status"""
+    __tablename__ = 'daily_revenue_stats'
+    __table_args__ = {'extend_existing': True}
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    invoices = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyRevenueStats {self.day} {self.status}: {self.amount}>'
+
+
+class DailyCourierStats(db.Model):
+    """Deliveries per courier and creation day"""
+    __tablename__ = 'daily_courier_stats'
+    __table_args__ = {'extend_existing': True}
+
+    day = db.Column(db.Date, primary_key=True)
+    courier_id = db.Column(db.Integer, db.ForeignKey('couriers.id'), primary_key=True)
+    deliveries = db.Column(db.Integer, nullable=False, default=0)
+    delivered = db.Column(db.Integer, nullable=False, default=0)
+    fees = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyCourierStats {self.day} courier {self.courier_id}: {self.deliveries}>'
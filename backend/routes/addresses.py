@@ -1,41 +1,51 @@
+import os
 from flask import Blueprint, request, jsonify
+from sqlalchemy import func
 from models import Address, db
 from utils.decorators import token_required
+from utils.address_index import address_index
 
 addresses_bp = Blueprint('addresses', __name__)
 
+# 'memory' (default) or 'pg_trgm' to use the trigram GIN index on Postgres instead
+AUTOCOMPLETE_BACKEND = os.getenv('AUTOCOMPLETE_BACKEND', 'memory')
+
 @addresses_bp.route('/autocomplete', methods=['GET'])
 @token_required
 def autocomplete_address(current_user):
     query = request.args.get('q', '').strip()
     if not query or len(query) < 2:
         return jsonify([]), 200
-        
-    # Search for matching addresses
-    # We search by street OR city
-    # Limit results to 10
-    
-    search_pattern = f"%{query}%"
-    
-    results = Address.query.filter(
-        (Address.street.ilike(search_pattern)) | 
-        (Address.city.ilike(search_pattern))
-    ).limit(10).all()
-    
+
+    if AUTOCOMPLETE_BACKEND == 'pg_trgm' and db.engine.dialect.name == 'postgresql':
+        return jsonify(_autocomplete_trgm(query)), 200
+
+    # Ranked prefix/n-gram match on "Street Number, City", limited to 10
+    address_index.ensure_fresh()
+    return jsonify(address_index.search(query, limit=10)), 200
+
+
+def _autocomplete_trgm(query, limit=10):
+    """
+    Same lookup served by Postgres: ILIKE on the concatenated address can use the
+    ix_addresses_full_trgm GIN index (migration e6c2b8f41a9d), ranked by similarity.
+    """
+    full_addr = Address.street + ' ' + Address.building_number + ', ' + Address.city
+    results = db.session.query(Address.id, Address.street, Address.building_number, Address.city).filter(
+        full_addr.ilike(f"%{query}%")
+    ).order_by(func.similarity(full_addr, query).desc()).limit(limit * 3).all()
+
     suggestions = []
     seen = set()
-    
-    for addr in results:
-        # Create a formatted string "Street Number, City"
-        full_addr = f"{addr.street} {addr.building_number}, {addr.city}"
-        if full_addr not in seen:
+    for address_id, street, number, city in results:
+        full = f"{street} {number}, {city}"
+        if full not in seen and len(suggestions) < limit:
             suggestions.append({
-                'id': addr.id,
-                'street': addr.street,
-                'city': addr.city,
-                'number': addr.building_number,
-                'full_address': full_addr
+                'id': address_id,
+                'street': street,
+                'city': city,
+                'number': number,
+                'full_address': full
             })
-            seen.add(full_addr)
-            
-    return jsonify(suggestions), 200
+            seen.add(full)
+    return suggestions
@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from sqlalchemy import func
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from models import db, Delivery, DeliveryStatus, User
+from models import db, Courier, Delivery, User
 from utils.decorators import token_required, role_required
 import logging
 
@@ -40,30 +41,24 @@ def delete_order(current_user, order_id):
 def get_stats(current_user):
     """סטטיסטיקות כלליות"""
     try:
-        from sqlalchemy import func
-        from models import Courier, Customer, Invoice
+        from utils.dashboard_cache import dashboard_cache
         
-        # ספירות בסיסיות
-        total_orders = Delivery.query.count()
-        pending_orders = Delivery.query.filter_by(status='pending').count()
-        active_orders = Delivery.query.filter(
-            Delivery.status.in_(['assigned', 'picked_up', 'in_transit'])
-        ).count()
-        delivered_orders = Delivery.query.filter_by(status='delivered').count()
+        # תמונת מצב משותפת לדשבורד, מתעדכנת בדחיפות 'dashboard_delta'
+        counters = dashboard_cache.snapshot()
         
-        total_couriers = Courier.query.count()
-        available_couriers = Courier.query.filter_by(is_available=True).count()
+        total_orders = counters['orders_total']
+        pending_orders = counters['orders_pending']
+        active_orders = counters['orders_active']
+        delivered_orders = counters['orders_delivered']
         
-        total_customers = Customer.query.count()
+        total_couriers = counters['couriers_total']
+        available_couriers = counters['couriers_available']
         
-        # הכנסות
-        total_revenue = db.session.query(func.sum(Invoice.total_amount)).join(
-            Delivery
-        ).filter(Delivery.status == 'delivered').scalar() or 0
+        total_customers = counters['customers_total']
         
-        pending_revenue = db.session.query(func.sum(Invoice.total_amount)).join(
-            Delivery
-        ).filter(Delivery.status != 'delivered').scalar() or 0
+        # הכנסות
+        total_revenue = counters['revenue_delivered']
+        pending_revenue = counters['revenue_pending']
         
         return jsonify({
             'orders': {
@@ -137,37 +132,45 @@ def update_order_status(current_user, order_id):
         if not new_status:
             return jsonify({'error': 'Status is required'}), 400
         
-        delivery = Delivery.query.get_or_404(order_id)
-        old_status = delivery.status
-        
-        # עדכן סטטוס
-        delivery.status = new_status
-        
-        # הוסף לאיסטוריית סטטוסים
-        status_entry = DeliveryStatus(
-            delivery_id=delivery.id,
-            status=new_status,
-            notes=notes,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(status_entry)
-        
-        # עדכן זמנים רלוונטיים
-        if new_status == 'picked_up' and not delivery.actual_pickup_time:
-            delivery.actual_pickup_time = datetime.utcnow()
-        elif new_status == 'delivered' and not delivery.actual_delivery_time:
-            delivery.actual_delivery_time = datetime.utcnow()
-            
-            # עדכן מונה משלוחים של השליח
-            if delivery.courier:
-                delivery.courier.total_deliveries += 1
+        from utils.delivery_state import delivery_state, TransitionError
+        
+        # שליח רשאי לעדכן רק משלוח שמשויך אליו
+        owned_by = None
+        if current_user.user_type == 'courier':
+            courier = Courier.query.filter_by(user_id=current_user.id).first()
+            if not courier:
+                return jsonify({'error': 'Courier profile not found'}), 404
+            owned_by = courier.id
+        
+        # מעבר ל-pending משחרר את השליח: זכור מי החזיק במשלוח לצורך עדכון המונה
+        current = db.session.query(Delivery.status, Delivery.courier_id).filter_by(id=order_id).first()
+        if not current:
+            return jsonify({'error': f'Delivery {order_id} not found'}), 404
+        
+        # עדכון מותנה (מול הסטטוס שנקרא כאן) + רשומת היסטוריה באותה טרנזקציה.
+        # מנהל רשאי לתקן כל סטטוס, גם מעבר שאינו בטבלת המעברים (force)
+        try:
+            transition = delivery_state.transition(order_id, new_status, expected=current.status,
+                                                   actor_id=current_user.id, owned_by=owned_by, notes=notes,
+                                                   force=current_user.user_type == 'admin')
+        except TransitionError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
+        
+        # עדכן מונה משלוחים של השליח (כולל ביטול מסירה בתיקון של מנהל)
+        was_delivered, is_delivered = transition.old_status == 'delivered', new_status == 'delivered'
+        courier_id = transition.courier_id or current.courier_id
+        if was_delivered != is_delivered and courier_id:
+            Courier.query.filter_by(id=courier_id).update(
+                {Courier.total_deliveries: func.coalesce(Courier.total_deliveries, 0) + (1 if is_delivered else -1)},
+                synchronize_session=False)
         
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'message': f'Status updated from {old_status} to {new_status}',
-            'order_id': delivery.id,
+            'message': f'Status updated from {transition.old_status} to {new_status}',
+            'order_id': order_id,
             'new_status': new_status
         }), 200
         
@@ -230,6 +233,9 @@ def approve_courier(current_user, courier_id):
             return jsonify({'error': 'Invalid action'}), 400
             
         db.session.commit()
+
+        from utils.courier_index import courier_index
+        courier_index.sync(courier)
         
         return jsonify({
             'success': True,
@@ -239,6 +245,60 @@ def approve_courier(current_user, courier_id):
         
     except Exception as e:
         db.session.rollback()
+
+
+@admin_bp.route('/allocate-pending', methods=['POST'])
+@token_required
+@role_required('admin')
+def allocate_pending(current_user):
+    """הקצאה גלובלית של כל ההזמנות הממתינות"""
+    try:
+        from utils.batch_allocation import BatchAllocationEngine
+        limit = (request.json or {}).get('limit') if request.is_json else None
+        assigned = BatchAllocationEngine.allocate_pending(limit=limit)
+
+        return jsonify({
+            'success': True,
+            'assigned_count': len(assigned),
+            'assignments': [{'order_id': d.id, 'courier_id': c.id} for d, c in assigned]
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Batch allocation failed: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/location-buffer', methods=['GET'])
+@token_required
+@role_required('admin')
+def location_buffer_stats(current_user):
+    """מדדי באפר כתיבת המיקומים (עומק ו-latency של flush)"""
+    from utils.location_buffer import location_buffer
+    return jsonify(location_buffer.stats()), 200
+
+
+@admin_bp.route('/perf', methods=['GET', 'DELETE'])
+@token_required
+@role_required('admin')
+def perf_summary(current_user):
+    """סיכום שאילתות לכל endpoint (כמות, זמן DB, צורות שחוזרות = חשד ל-N+1). DELETE מאפס"""
+    from utils.query_stats import query_stats, N_PLUS_ONE_THRESHOLD
+    if request.method == 'DELETE':
+        query_stats.reset()
+        return jsonify({'success': True}), 200
+    return jsonify({'n_plus_one_threshold': N_PLUS_ONE_THRESHOLD, 'endpoints': query_stats.summary()}), 200
+
+
+@admin_bp.route('/jobs', methods=['GET'])
+@token_required
+@role_required('admin')
+def job_queue_stats(current_user):
+    """מצב תור משימות הרקע (הקצאה, התראות, audit) וכשלונות אחרונים"""
+    from utils.audit import audit_sink
+    from utils.job_queue import job_queue
+    return jsonify({**job_queue.stats, 'pending': job_queue.pending(), 'failed_jobs': list(job_queue.failed),
+                    'audit': {**audit_sink.stats, 'pending': audit_sink.pending()}}), 200
+
 @admin_bp.route('/users', methods=['GET'])
 @token_required
 @role_required('admin')
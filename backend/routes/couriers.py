@@ -131,6 +131,9 @@ def update_availability(current_user):
             
         courier.is_available = data['is_available']
         db.session.commit()
+
+        from utils.courier_index import courier_index
+        courier_index.sync(courier)
         
         # Emit Socket.IO event for real-time dashboard updates
         from extensions import socketio
@@ -188,7 +191,7 @@ def get_active_order(current_user):
         # Look for orders in progress
         order = Delivery.query.filter(
             Delivery.courier_id == courier.id,
-            Delivery.status.in_(['accepted', 'assigned', 'picked_up', 'in_transit', 'arrived'])
+            Delivery.status.in_(['assigned', 'picked_up', 'in_transit'])
         ).first()
 
         if not order:
@@ -316,49 +319,68 @@ def get_courier_history(current_user):
 def accept_order(current_user, order_id):
     """קבלת משלוח ע"י שליח"""
     try:
-        from app import socketio # Import here to avoid circular
+        from utils.delivery_state import delivery_state, TransitionError
         courier = Courier.query.filter_by(user_id=current_user.id).first()
         if not courier: return jsonify({'error': 'Courier profile not found'}), 404
-            
-        delivery = Delivery.query.get_or_404(order_id)
-        
-        if delivery.status != 'assigned' and delivery.status != 'pending':
-             return jsonify({'error': 'Order not available'}), 400
         
-        delivery.courier_id = courier.id
-        delivery.status = 'accepted'
-        delivery.updated_at = datetime.utcnow()
+        # Atomic claim: one conditional UPDATE (pending, no courier, row not being
+        # claimed right now); exactly one of many concurrent accepts matches it
+        try:
+            delivery_state.transition(order_id, 'assigned', expected='pending', actor_id=current_user.id,
+                                      unassigned=True, skip_locked=True, courier_id=courier.id,
+                                      notes=f"Accepted by courier {courier.id}")
+        except TransitionError as e:
+            db.session.rollback()
+            if e.status_code in (400, 409):
+                # Already ours (assigned to us by dispatch): accepting is a no-op
+                owner = db.session.query(Delivery.courier_id).filter_by(id=order_id).scalar()
+                if owner == courier.id:
+                    return jsonify({'success': True}), 200
+                return jsonify({'error': 'Order not available'}), 409
+            return jsonify({'error': str(e)}), e.status_code
         db.session.commit()
-        
-        if socketio:
-            socketio.emit('order_update', {'id': delivery.id, 'status': 'accepted', 'courier_name': courier.full_name}, room='admin_room')
-            # Notify courier specifically
-            socketio.emit('delivery_status_update', {'delivery_id': delivery.id, 'status': 'accepted', 'courier_id': courier.id}, room=f'courier_{courier.id}')
 
         return jsonify({'success': True}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _point_address(point):
+    """כתובת נקודת איסוף/מסירה כמחרוזת: 'רחוב מספר, עיר'"""
+    if not point or not point.address:
+        return None
+    address = point.address
+    return f"{address.street} {address.building_number}, {address.city}"
+
 @couriers_bp.route('/orders/<int:order_id>/reject', methods=['POST'])
 @token_required
 @role_required('courier')
 def reject_order(current_user, order_id):
     """דחיית משלוח"""
     try:
-        from app import socketio
+        from extensions import socketio
+        from utils.delivery_state import delivery_state, TransitionError
         courier = Courier.query.filter_by(user_id=current_user.id).first()
-        delivery = Delivery.query.get_or_404(order_id)
-        
-        if delivery.courier_id != courier.id: return jsonify({'error': 'Not assigned to you'}), 400
+        if not courier: return jsonify({'error': 'Courier profile not found'}), 404
 
-        delivery.courier_id = None
-        delivery.status = 'pending'
+        try:
+            transition = delivery_state.transition(order_id, 'pending', expected='assigned', actor_id=current_user.id,
+                                                   owned_by=courier.id, courier_id=None,
+                                                   notes=f"Rejected by courier {courier.id}")
+        except TransitionError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
         db.session.commit()
         
+        # order_update לחדר המנהלים נשלח ממנגנון המעברים; כאן רק ההצעה לשאר השליחים
         if socketio:
-             socketio.emit('order_update', {'id': delivery.id, 'status': 'pending', 'alert': f'Rejected by {courier.full_name}'}, room='admin_room')
-             socketio.emit('new_order_offer', {'order': {'id': delivery.id, 'pickup_address': delivery.pickup_address, 'delivery_address': delivery.delivery_address}}, room='courier_room')
+             delivery = db.session.get(Delivery, order_id)
+             socketio.emit('new_order_offer', {'order': {
+                 'id': order_id,
+                 'order_number': transition.order_number,
+                 'pickup_address': _point_address(delivery.pickup_point),
+                 'delivery_address': _point_address(delivery.delivery_point)
+             }}, room='courier_room')
 
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -371,34 +393,28 @@ def reject_order(current_user, order_id):
 def update_delivery_status(current_user, order_id):
     """עדכון סטטוס"""
     try:
-        from app import socketio
+        from utils.delivery_state import delivery_state, TransitionError
         data = request.json
         new_status = data.get('status')
         courier = Courier.query.filter_by(user_id=current_user.id).first()
+        if not courier: return jsonify({'error': 'Courier profile not found'}), 404
         
-        delivery = Delivery.query.get_or_404(order_id)
-        
-        # Update Status
-        delivery.status = new_status
-        delivery.updated_at = datetime.utcnow()
-        
-        # Handle POD (Proof of Delivery)
+        # Handle POD (Proof of Delivery): files are written only once the status change went through
+        pod = {}
+        pod_files = {}
         pod_signature = data.get('pod_signature')
         pod_image = data.get('pod_image')
         
         if new_status == 'delivered':
              upload_dir = Path(__file__).parent.parent / 'uploads' / 'pod'
-             upload_dir.mkdir(parents=True, exist_ok=True)
 
              # Handle Signature
              if pod_signature:
                  try:
                     if ',' in pod_signature: pod_signature = pod_signature.split(',')[1]
-                    sig_data = base64.b64decode(pod_signature)
-                    sig_filename = f"sig_{delivery.order_number}_{uuid.uuid4().hex[:6]}.png"
-                    with open(upload_dir / sig_filename, 'wb') as f:
-                        f.write(sig_data)
-                    delivery.pod_signature_path = f"/uploads/pod/{sig_filename}"
+                    sig_filename = f"sig_{order_id}_{uuid.uuid4().hex[:6]}.png"
+                    pod_files[sig_filename] = base64.b64decode(pod_signature)
+                    pod['pod_signature_path'] = f"/uploads/pod/{sig_filename}"
                  except Exception as sig_err:
                     logging.error(f"Signature save error: {sig_err}")
 
@@ -406,27 +422,44 @@ def update_delivery_status(current_user, order_id):
              if pod_image:
                  try:
                     if ',' in pod_image: pod_image = pod_image.split(',')[1]
-                    img_data = base64.b64decode(pod_image)
-                    img_filename = f"photo_{delivery.order_number}_{uuid.uuid4().hex[:6]}.jpg"
-                    with open(upload_dir / img_filename, 'wb') as f:
-                        f.write(img_data)
-                    delivery.pod_image_path = f"/uploads/pod/{img_filename}"
+                    img_filename = f"photo_{order_id}_{uuid.uuid4().hex[:6]}.jpg"
+                    pod_files[img_filename] = base64.b64decode(pod_image)
+                    pod['pod_image_path'] = f"/uploads/pod/{img_filename}"
                  except Exception as img_err:
                     logging.error(f"POD photo save error: {img_err}")
                 
-        # Legal Delivery Fields (Recipient ID/Name)
-        if new_status == 'delivered':
+             # Legal Delivery Fields (Recipient ID/Name)
              if data.get('pod_recipient_id'):
-                 delivery.pod_recipient_id = data.get('pod_recipient_id')
-             
+                 pod['pod_recipient_id'] = data.get('pod_recipient_id')
+        
+        # Conditional UPDATE: only this courier's delivery, only from a status that allows it
+        try:
+            transition = delivery_state.transition(order_id, new_status, actor_id=current_user.id, owned_by=courier.id,
+                                                   notes=data.get('notes'), values=pod)
+        except TransitionError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
+        try:
+            if pod_files:
+                upload_dir.mkdir(parents=True, exist_ok=True)
+            for filename, content in pod_files.items():
+                with open(upload_dir / filename, 'wb') as f:
+                    f.write(content)
+            db.session.commit()
+        except Exception:
+            for filename in pod_files:
+                (upload_dir / filename).unlink(missing_ok=True)
+            raise
+        
+        if new_status == 'delivered':
              # Create Digital Signature (Legal Requirement)
              from utils.digital_signature import DigitalSignature
              delivery_hash = DigitalSignature.sign_delivery_completion(
-                 delivery_id=delivery.id,
+                 delivery_id=order_id,
                  courier_id=current_user.id,
-                 timestamp=datetime.utcnow(),
-                 recipient_id=delivery.pod_recipient_id if hasattr(delivery, 'pod_recipient_id') else None,
-                 pod_path=delivery.pod_signature_path if hasattr(delivery, 'pod_signature_path') else None
+                 timestamp=transition.at,
+                 recipient_id=pod.get('pod_recipient_id'),
+                 pod_path=pod.get('pod_signature_path')
              )
              
              # TODO: Store delivery_hash in DB if column exists. 
@@ -438,18 +471,10 @@ def update_delivery_status(current_user, order_id):
                 action='DELIVERY_COMPLETED_SIGNED',
                 user_id=current_user.id,
                 resource_type='Delivery',
-                resource_id=delivery.id,
-                details=f"Delivery completed. Recipient ID: {delivery.pod_recipient_id}. Digital Hash: {delivery_hash}",
+                resource_id=order_id,
+                details=f"Delivery completed. Recipient ID: {pod.get('pod_recipient_id')}. Digital Hash: {delivery_hash}",
                 status='SUCCESS'
              )
-        
-        db.session.commit()
-        
-        if socketio:
-            socketio.emit('order_update', {'id': delivery.id, 'status': new_status}, room='admin_room')
-            socketio.emit('delivery_status_update', {'delivery_id': delivery.id, 'status': new_status}, room=f'courier_{courier.id}')
-            if delivery.customer_id:
-                socketio.emit('order_status_changed', {'order_id': delivery.id, 'status': new_status}, room=f'customer_{delivery.customer_id}')
             
         return jsonify({'success': True, 'status': new_status}), 200
         
@@ -496,17 +521,21 @@ def verify_order_otp(current_user, order_id):
         if not input_code:
             return jsonify({'error': 'OTP code is required'}), 400
             
+        from utils.delivery_state import delivery_state, TransitionError
         delivery = Delivery.query.get_or_404(order_id)
         courier = Courier.query.filter_by(user_id=current_user.id).first()
 
-        if delivery.courier_id != courier.id:
+        if not courier or delivery.courier_id != courier.id:
             return jsonify({'error': 'Unauthorized: You are not assigned to this delivery'}), 403
 
         if delivery.otp_code == input_code:
-            delivery.otp_verified = True
-            delivery.status = 'delivered'
-            delivery.actual_delivery_time = datetime.utcnow()
-            delivery.updated_at = datetime.utcnow()
+            # Conditional on the status (and courier) just read: a concurrent change wins, not us
+            try:
+                delivery_state.transition(delivery.id, 'delivered', expected=delivery.status, actor_id=current_user.id,
+                                          owned_by=courier.id, notes='OTP verified', values={'otp_verified': True})
+            except TransitionError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), e.status_code
             
             # --- Trigger Gamification & Smart Scoring Update ---
             try:
@@ -515,6 +544,8 @@ def verify_order_otp(current_user, order_id):
             except Exception as e:
                 logging.error(f"Gamification update failed: {e}")
             
+            db.session.commit()
+
             # AUDIT LOG
             from utils.audit import log_audit
             log_audit(
@@ -526,7 +557,6 @@ def verify_order_otp(current_user, order_id):
                 status='SUCCESS'
             )
             
-            db.session.commit()
             return jsonify({'success': True, 'message': 'Delivery completed successfully'}), 200
         else:
             return jsonify({'success': False, 'error': 'Invalid OTP code'}), 400
@@ -1,13 +1,15 @@
-from flask import Blueprint, request, jsonify, make_response
-from models import db, Delivery, Courier
+from flask import Blueprint, request, jsonify
+from models import db, Delivery, Courier, Address, PickupPoint, DeliveryPoint
+from sqlalchemy.orm import aliased
+from utils.csv_stream import csv_response
 from utils.decorators import token_required, role_required
 from datetime import datetime, timedelta
-import csv
-import io
 import logging
 
 earnings_reports_bp = Blueprint('earnings_reports', __name__)
 
+EXPORT_BATCH_SIZE = 1000
+
 @earnings_reports_bp.route('/export', methods=['GET'])
 @token_required
 @role_required('courier')
@@ -32,49 +34,60 @@ def export_earnings(current_user):
         else:
             end_date = datetime(year, month + 1, 1)
 
-        deliveries = Delivery.query.filter(
-            Delivery.courier_id == courier.id,
-            Delivery.status == 'delivered',
-            Delivery.updated_at >= start_date,
-            Delivery.updated_at < end_date
-        ).order_by(Delivery.updated_at.asc()).all()
-
-        si = io.StringIO()
-        cw = csv.writer(si)
-        
-        # CSV Headers
-        cw.writerow(['ID המשלוח', 'תאריך', 'מכתובת', 'אל כתובת', 'מרחק (ק"מ)', 'זמן (דקות)', 'רווח (₪)'])
-        
-        total_payout = 0
-        for d in deliveries:
-            amount = float(d.price or 0)
-            total_payout += amount
-            
-            duration_mins = ""
-            if d.actual_pickup_time and d.actual_delivery_time:
-                duration = d.actual_delivery_time - d.actual_pickup_time
-                duration_mins = int(duration.total_seconds() / 60)
-
-            cw.writerow([
-                d.order_number,
-                d.updated_at.strftime('%Y-%m-%d %H:%M') if d.updated_at else '',
-                d.pickup_address,
-                d.delivery_address,
-                d.distance_km or 0,
-                duration_mins,
-                amount
-            ])
-
-        cw.writerow([])
-        cw.writerow(['סה"כ לתשלום', '', '', '', '', '', total_payout])
-
         filename = f"earnings_{courier.full_name}_{year}_{month}.csv"
-        
-        output = make_response(si.getvalue().encode('utf-8-sig'))
-        output.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        output.headers["Content-type"] = "text/csv"
-        return output
+        return csv_response(_earnings_rows(courier.id, start_date, end_date), filename)
 
     except Exception as e:
         logging.error(f"Error exporting earnings: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+
+def _address_text(street, number, city):
+    return f"{street} {number}, {city}" if street else ''
+
+
+def _earnings_rows(courier_id, start_date, end_date):
+    """Header, one row per delivered order (single joined query, read in batches), total"""
+    PickupAddress, DropoffAddress = aliased(Address), aliased(Address)
+
+    # CSV Headers
+    yield ['ID המשלוח', 'תאריך', 'מכתובת', 'אל כתובת', 'מרחק (ק"מ)', 'זמן (דקות)', 'רווח (₪)']
+
+    rows = db.session.query(
+        Delivery.order_number, Delivery.updated_at, Delivery.distance_km,
+        Delivery.actual_pickup_time, Delivery.actual_delivery_time, Delivery.delivery_fee,
+        PickupAddress.street, PickupAddress.building_number, PickupAddress.city,
+        DropoffAddress.street, DropoffAddress.building_number, DropoffAddress.city
+    ).outerjoin(PickupPoint, PickupPoint.id == Delivery.pickup_point_id
+    ).outerjoin(PickupAddress, PickupAddress.id == PickupPoint.address_id
+    ).outerjoin(DeliveryPoint, DeliveryPoint.id == Delivery.delivery_point_id
+    ).outerjoin(DropoffAddress, DropoffAddress.id == DeliveryPoint.address_id
+    ).filter(
+        Delivery.courier_id == courier_id,
+        Delivery.status == 'delivered',
+        Delivery.updated_at >= start_date,
+        Delivery.updated_at < end_date
+    ).order_by(Delivery.updated_at.asc(), Delivery.id).yield_per(EXPORT_BATCH_SIZE)
+
+    total_payout = 0
+    for (order_number, updated_at, distance_km, picked_up, delivered, fee,
+         p_street, p_number, p_city, d_street, d_number, d_city) in rows:
+        amount = float(fee or 0)
+        total_payout += amount
+
+        duration_mins = ""
+        if picked_up and delivered:
+            duration_mins = int((delivered - picked_up).total_seconds() / 60)
+
+        yield [
+            order_number,
+            updated_at.strftime('%Y-%m-%d %H:%M') if updated_at else '',
+            _address_text(p_street, p_number, p_city),
+            _address_text(d_street, d_number, d_city),
+            distance_km or 0,
+            duration_mins,
+            amount
+        ]
+
+    yield []
+    yield ['סה"כ לתשלום', '', '', '', '', '', total_payout]
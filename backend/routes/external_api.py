@@ -1,8 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, g
 from extensions import db, socketio
 from models import Delivery, Address, PickupPoint, DeliveryPoint, Customer
 from utils.decorators import api_key_required
+from sqlalchemy.exc import IntegrityError
+from utils.order_ingest import BulkOrderImporter
+from utils.dashboard_cache import dashboard_cache, status_delta
 from datetime import datetime, timedelta
+import json
 import random
 import string
 import logging
@@ -51,64 +55,67 @@ def create_order():
         if not customer_data or not delivery_addr_data:
              return jsonify({'error': 'Missing customer or delivery address data'}), 400
 
+        # Idempotency: a retried webhook gets the order this merchant already created
+        api_key_id = g.get('api_key_id')
+        merchant_order_id = str(data.get('merchant_order_id') or '').strip() or None
+        if merchant_order_id:
+            existing = Delivery.query.filter_by(api_key_id=api_key_id, merchant_order_id=merchant_order_id).first()
+            if existing:
+                return jsonify(_order_response(existing)), 200
+
         # 2. Find or Create Customer (Simplified for API match)
         # In a real plugin, we might link this to the API Key owner
         # For now, we'll look up by phone or create a "Guest API" customer
         
-        # 3. Create Addresses
-        delivery_address = Address(
+        # 3. Find or Create Addresses (repeat addresses reuse the existing rows)
+        from utils.address_dedup import address_dedup
+        delivery_address = address_dedup.get_or_create_address(
             city=delivery_addr_data.get('city'),
             street=delivery_addr_data.get('street'),
             building_number=delivery_addr_data.get('number', '0'),
             floor=delivery_addr_data.get('floor'),
-            apartment=delivery_addr_data.get('apartment'),
-            notes=data.get('notes', 'External Order')
+            apartment=delivery_addr_data.get('apartment')
         )
-        db.session.add(delivery_address)
-        db.session.flush() # Get ID
         
-        # Create Delivery Point
-        delivery_point = DeliveryPoint(
-            address_id=delivery_address.id,
+        # Find or Create Delivery Point
+        delivery_point = address_dedup.get_or_create_delivery_point(
+            delivery_address,
             recipient_name=customer_data.get('name'),
             recipient_phone=customer_data.get('phone'),
             is_residential=True
         )
-        db.session.add(delivery_point)
-        db.session.flush() # CRITICAL: Get ID for Delivery creation
         
         # 4. Handle Pickup Point (Default to a known ID or create from payload)
         # For MVP, let's assume specific pickup point ID 1 (Main Warehouse) if not provided
-        # Or create ad-hoc pickup
+        # A merchant's repeated warehouse pickup maps to one PickupPoint
         pickup_point_id = 1 
         if data.get('pickup_address'):
              p_addr_data = data.get('pickup_address')
-             p_addr = Address(
-                city=p_addr_data.get('city'),
+             p_addr = address_dedup.get_or_create_address(
+                 city=p_addr_data.get('city'),
                  street=p_addr_data.get('street'),
                  building_number=p_addr_data.get('number', '1')
              )
-             db.session.add(p_addr)
-             db.session.flush()
              
-             p_point = PickupPoint(
-                 address_id=p_addr.id,
+             p_point = address_dedup.get_or_create_pickup_point(
+                 p_addr,
                  contact_name="Merchant Sender",
                  contact_phone="000-0000000"
              )
-             db.session.add(p_point)
-             db.session.flush()
              pickup_point_id = p_point.id
         
         # 5. Create Delivery
         new_order = Delivery(
             order_number=generate_order_number(),
+            merchant_order_id=merchant_order_id,
+            api_key_id=api_key_id,
             customer_id=1, # Default to Demo Customer for now, or fetch from DB
             pickup_point_id=pickup_point_id,
             delivery_point_id=delivery_point.id,
             status='pending',
             package_description=data.get('package_details', {}).get('description', 'Standard Package'),
-            package_weight=data.get('package_details', {}).get('weight', 1.0)
+            package_weight=data.get('package_details', {}).get('weight', 1.0),
+            notes=data.get('notes')  # Per order: the address row is shared
         )
         
         db.session.add(new_order)
@@ -120,15 +127,93 @@ def create_order():
             'order_number': new_order.order_number,
             'status': 'pending'
         })
+
+        # Allocate in batches: bursts of API orders are assigned together
+        from utils.batch_allocation import schedule_batch_allocation
+        schedule_batch_allocation(current_app._get_current_object())
         
-        return jsonify({
-            'success': True,
-            'order_id': new_order.id,
-            'order_number': new_order.order_number,
-            'tracking_url': f"https://app.tzir.com/track/{new_order.order_number}"
-        }), 201
+        return jsonify(_order_response(new_order)), 201
 
+    except IntegrityError:
+        # Same merchant_order_id committed concurrently by a parallel retry
+        db.session.rollback()
+        existing = Delivery.query.filter_by(
+            api_key_id=api_key_id, merchant_order_id=merchant_order_id
+        ).first() if merchant_order_id else None
+        if existing:
+            return jsonify(_order_response(existing)), 200
+        return jsonify({'error': 'Order could not be created'}), 409
     except Exception as e:
         db.session.rollback()
         logging.error(f"API Error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+
+def _order_response(order):
+    return {
+        'success': True,
+        'order_id': order.id,
+        'order_number': order.order_number,
+        'tracking_url': f"https://app.tzir.com/track/{order.order_number}"
+    }
+
+
+def _read_bulk_orders():
+    """Orders from a JSON array, {"orders": [...]}, or an NDJSON body (one order per line)"""
+    content_type = request.mimetype or ''
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        orders = []
+        for line_no, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                orders.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"Invalid JSON on line {line_no}")
+            if len(orders) > BulkOrderImporter.MAX_ORDERS:
+                break
+        return orders
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('orders')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of orders or NDJSON')
+    return data
+
+
+@external_api_bp.route('/orders/bulk', methods=['POST'])
+@api_key_required
+def create_orders_bulk():
+    """
+    Bulk version of POST /orders for store-close pushes: a JSON array (or NDJSON,
+    Content-Type: application/x-ndjson) of up to MAX_ORDERS orders in the same
+    format, each with a merchant_order_id. Returns one result per item in input
+    order: created / exists (already sent earlier by the same merchant) / error.
+    """
+    try:
+        orders = _read_bulk_orders()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(orders) > BulkOrderImporter.MAX_ORDERS:
+        return jsonify({'error': f'At most {BulkOrderImporter.MAX_ORDERS} orders per request'}), 413
+
+    try:
+        results = BulkOrderImporter.ingest(orders, api_key_id=g.get('api_key_id'))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Bulk API Error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+    summary = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'exists', 'error')}
+    if summary['created']:
+        socketio.emit('orders_imported', {'count': summary['created']}, room='admin_room')
+        # Inserted with Core executemany, so the dashboard delta is published here
+        delta = status_delta(None, 'pending', summary['created'])
+        delta['orders_today'] += summary['created']
+        dashboard_cache.publish(delta)
+        from utils.batch_allocation import schedule_batch_allocation
+        schedule_batch_allocation(current_app._get_current_object())
+
+    return jsonify({'success': not summary['error'], **summary, 'results': results}), 200
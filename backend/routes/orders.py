@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
+import base64
 import uuid
 import random
 import string
@@ -9,10 +10,11 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from models import db, Delivery, Address, PickupPoint, DeliveryPoint, Customer, User, Pricing, Invoice
+from models import db, Delivery, Address, PickupPoint, DeliveryPoint, Customer, Courier, User, Pricing, Invoice
+from sqlalchemy.orm import joinedload, selectinload
+from utils.route_cache import LRUCache
 from utils.decorators import token_required, role_required
 import logging
-from services.notifications import notify_new_mission
 
 orders_bp = Blueprint('orders', __name__)
 
@@ -21,6 +23,29 @@ from utils.pricing import PricingEngine
 # Old calculate_price removed - using PricingEngine.calculate_price directly
 
 
+def _fill_coordinates(addr):
+    """משלים lat/lon לכתובת מה-geocoder (cache או קריאה מיידית - לעולם לא ממתין ל-rate limit)"""
+    if not isinstance(addr, dict) or not addr.get('street'):
+        return
+    if addr.get('lat') is not None and addr.get('lon') is not None:
+        return
+    from utils.geocoding import geocoder
+    coords = geocoder.geocode(f"{addr['street']} {addr.get('number') or ''}, {addr.get('city') or ''}")
+    if coords:
+        addr['lat'], addr['lon'] = coords
+
+
+def _routed_distance_km(pickup, dropoff):
+    """מרחק נסיעה בין שתי כתובות עם lat/lon (דרך ה-route cache), או None"""
+    from utils.geo_utils import get_route_info
+    try:
+        route = get_route_info({'lat': float(pickup['lat']), 'lon': float(pickup['lon'])},
+                               {'lat': float(dropoff['lat']), 'lon': float(dropoff['lon'])})
+    except (KeyError, TypeError, ValueError):
+        return None
+    return round(route['distance_km'], 2) if route else None
+
+
 
 @orders_bp.route('/create', methods=['POST'])
 @orders_bp.route('', methods=['POST'])
@@ -51,6 +76,12 @@ def create_order(current_user=None):
                 'senderPhone': data.get('customer_phone'),
                 'senderAddress': {'street': data.get('pickup_address'), 'notes': data.get('notes')}
             }
+
+        # Coordinates and routed distance are resolved before any writes (both caches use their own DB connection)
+        _fill_coordinates(sender_data.get('senderAddress'))
+        _fill_coordinates(recipient_data.get('recipientAddress'))
+        routed_km = _routed_distance_km(sender_data.get('senderAddress') or {},
+                                        recipient_data.get('recipientAddress') or {})
         
         # 1. טיפול בלקוח/יוצר ההזמנה
         # במצב אידיאלי, current_user הוא הלקוח.
@@ -114,9 +145,10 @@ def create_order(current_user=None):
              # Fail-safe
              return jsonify({'error': 'Customer profile not found for user'}), 400
 
-        # 2. כתובת איסוף (Sender Address)
+        # 2. כתובת איסוף (Sender Address) - שימוש חוזר בכתובת/נקודה קיימת אם זהה
+        from utils.address_dedup import address_dedup
         s_addr = sender_data.get('senderAddress', {})
-        pickup_address_obj = Address(
+        pickup_address_obj = address_dedup.get_or_create_address(
             street=s_addr.get('street', 'Unknown'),
             city=s_addr.get('city', 'Unknown'),
             building_number=s_addr.get('number', '0'),
@@ -124,24 +156,20 @@ def create_order(current_user=None):
             apartment=s_addr.get('apartment'),
             entrance=s_addr.get('entrance'),
             latitude=s_addr.get('lat'),
-            longitude=s_addr.get('lon'),
-            notes=s_addr.get('notes')
+            longitude=s_addr.get('lon')
         )
-        db.session.add(pickup_address_obj)
-        db.session.flush()
         
-        pickup_point = PickupPoint(
-            address_id=pickup_address_obj.id,
+        # הערות הכתובת (קוד שער, הוראות) נשמרות על נקודת האיסוף/המסירה של ההזמנה, לא על הכתובת המשותפת
+        pickup_point = address_dedup.get_or_create_pickup_point(
+            pickup_address_obj,
             contact_name=sender_data.get('senderName', customer_name),
             contact_phone=sender_data.get('senderPhone', customer_phone),
             pickup_instructions=s_addr.get('notes', '')
         )
-        db.session.add(pickup_point)
-        db.session.flush()
         
         # 3. כתובת מסירה (Recipient Address)
         r_addr = recipient_data.get('recipientAddress', {})
-        delivery_address_obj = Address(
+        delivery_address_obj = address_dedup.get_or_create_address(
             street=r_addr.get('street', 'Unknown'),
             city=r_addr.get('city', 'Unknown'),
             building_number=r_addr.get('number', '0'),
@@ -149,20 +177,15 @@ def create_order(current_user=None):
             apartment=r_addr.get('apartment'),
             entrance=r_addr.get('entrance'),
             latitude=r_addr.get('lat'),
-            longitude=r_addr.get('lon'),
-            notes=r_addr.get('notes')
+            longitude=r_addr.get('lon')
         )
-        db.session.add(delivery_address_obj)
-        db.session.flush()
         
-        delivery_point = DeliveryPoint(
-            address_id=delivery_address_obj.id,
+        delivery_point = address_dedup.get_or_create_delivery_point(
+            delivery_address_obj,
             recipient_name=recipient_data.get('recipientName', 'Unknown'),
             recipient_phone=recipient_data.get('recipientPhone', 'Unknown'),
             delivery_instructions=r_addr.get('notes', '')
         )
-        db.session.add(delivery_point)
-        db.session.flush()
         
         # 4. נתוני חבילה ושירות
         package_size = package_data.get('packageSize', 'small')
@@ -180,9 +203,8 @@ def create_order(current_user=None):
         priority = priority_map.get(service_type, 'normal')
 
         # 5. חישוב מחיר
-        # TODO: Calculate real distance using OSRM/Google between addresses
-        # For prototype: Random or fixed distance if not provided
-        distance_km = data.get('distance_km', 10.0) 
+        # Real road distance when both addresses have coordinates, otherwise the client value / default
+        distance_km = routed_km or data.get('distance_km', 10.0)
         
         # Map fields to PricingEngine expectations
         delivery_type = service_data.get('deliveryType', 'standard')
@@ -262,67 +284,17 @@ def create_order(current_user=None):
         db.session.add(invoice)
         db.session.commit()
         
-        # 8. Notify Admin
-        from extensions import socketio
-        if socketio:
-            socketio.emit('new_order', {
-                'id': delivery.id, 
-                'order_number': order_number,
-                'status': 'pending',
-                'customer': customer_name
-            }, room='admin')
-        
-        # Notify Available Couriers via Push
-        try:
-            notify_new_mission(delivery)
-        except Exception as e:
-            logging.error(f"Failed to trigger PUSH: {e}")
-
-        # 9. Automatic Allocation (Algorithm)
-        from utils.allocation_engine import AllocationEngine
-        logging.info(f"Starting auto-allocation for {order_number}...")
-        
-        best_courier = AllocationEngine.find_best_courier(delivery)
-        
-        if best_courier:
-            delivery.courier_id = best_courier.id
-            delivery.status = 'assigned' # Or 'offered' if we want acceptance flow
-            delivery.updated_at = datetime.utcnow()
-            db.session.commit()
-            
-            logging.info(f"Auto-assigned {order_number} to {best_courier.full_name}")
-            
-            # Notify Courier
-            if socketio:
-                try:
-                    socketio.emit('new_assignment', {
-                        'order_id': delivery.id,
-                        'order_number': order_number,
-                        'pickup_address': delivery.pickup_point.address.street,
-                        'delivery_address': delivery.delivery_point.address.street,
-                        'package_size': delivery.package_size,
-                        'notes': delivery.notes
-                    }, room=f"courier_{best_courier.id}")
-                except Exception as e:
-                    logging.warning(f"Socket error notify courier: {e}")
-                    
-            # Notify Admin of Update
-            if socketio:
-                socketio.emit('order_update', {
-                    'id': delivery.id,
-                    'status': 'assigned',
-                    'courier_name': best_courier.full_name
-                }, room='admin')
-        
-        # AUDIT LOG
-        from utils.audit import log_audit
-        log_audit(
-            action='CREATE_ORDER',
+        # 8. התראות, הקצאה אוטומטית ו-audit רצים ברקע - הלקוח מקבל מספר הזמנה אחרי טרנזקציה אחת
+        from flask import current_app
+        from utils.order_pipeline import enqueue_order_created
+        enqueue_order_created(
+            current_app._get_current_object(),
+            delivery_id=delivery.id,
+            order_number=order_number,
+            customer_name=customer_name,
+            total_amount=total_amount,
             user_id=current_user.id,
-            resource_type='Delivery',
-            resource_id=delivery.id,
-            details=f"Order {order_number} created with price {total_amount}",
-            status='SUCCESS'
+            ip_address=request.headers.get('X-Forwarded-For', request.remote_addr)
         )
 
         return jsonify({
@@ -331,7 +303,8 @@ def create_order(current_user=None):
             'order_number': order_number,
             'price': total_amount,
             'invoice_number': invoice_number,
-            'assigned_courier': best_courier.full_name if best_courier else None
+            'assigned_courier': None,  # Allocation runs in the background; watch 'order_update'
+            'allocation': 'queued'
         }), 201
         
     except Exception as e:
@@ -348,7 +321,9 @@ def calculate_quote(current_user):
     try:
         data = request.json
         
-        distance_km = data.get('distance_km', 10.0) # In future, calculate from addresses here
+        # pickup/dropoff: {'lat': .., 'lon': ..} - routed distance when given
+        distance_km = _routed_distance_km(data.get('pickup') or {}, data.get('dropoff') or {}) \
+            or data.get('distance_km', 10.0)
         
         quote = PricingEngine.calculate_price(
             distance_km=distance_km,
@@ -371,30 +346,116 @@ def calculate_quote(current_user):
 
 
 
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+ORDER_COUNT_TTL_SECONDS = 30
+_order_counts = LRUCache(1000, ORDER_COUNT_TTL_SECONDS)
+
+
+def _encode_cursor(delivery):
+    raw = f"{delivery.created_at.isoformat() if delivery.created_at else ''}|{delivery.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, delivery_id = raw.split('|')
+    return (datetime.fromisoformat(created_at) if created_at else None), int(delivery_id)
+
+
+def _is_date_only(value):
+    return len(value) == 10  # YYYY-MM-DD
+
+
 @orders_bp.route('', methods=['GET'])
 @token_required
 @role_required(['admin', 'courier', 'customer']) 
 def get_orders(current_user):
-    """קבלת כל ההזמנות"""
+    """
+    קבלת ההזמנות - עם pagination לפי cursor (created_at, id)
+    Query: limit (מקסימום 200), cursor, status, courier_id, date_from, date_to
+    בלי limit ובלי cursor מוחזרות כל ההזמנות (כמו קודם); עם אחד מהם - עמוד (ברירת מחדל 50)
+    התשובה נשארת מערך; X-Next-Cursor ו-X-Total-Count ב-headers
+    """
     try:
         query = Delivery.query
+        scope = 'all'
 
         # Filter based on user role
         if current_user.user_type == 'customer':
             customer = Customer.query.filter_by(user_id=current_user.id).first()
             if not customer:
                 return jsonify([]), 200 # No customer profile yet
-            query = query.filter_by(customer_id=customer.id)
+            query = query.filter(Delivery.customer_id == customer.id)
+            scope = f'customer:{customer.id}'
             
         elif current_user.user_type == 'courier':
              courier = Courier.query.filter_by(user_id=current_user.id).first()
              if not courier:
                  return jsonify([]), 200
-             query = query.filter_by(courier_id=courier.id)
-        
-        # Admin sees all (no filter added)
+             query = query.filter(Delivery.courier_id == courier.id)
+             scope = f'courier:{courier.id}'
         
-        deliveries = query.order_by(Delivery.created_at.desc()).all()
+        # Admin sees all (no role filter added)
+
+        # Server-side filters
+        try:
+            limit = None
+            if request.args.get('limit') or request.args.get('cursor'):
+                limit = min(max(int(request.args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_MAX_PAGE_SIZE)
+            filters = {}
+            if request.args.get('status') and request.args['status'] != 'all':
+                filters['status'] = request.args['status']
+                query = query.filter(Delivery.status == filters['status'])
+            if request.args.get('courier_id'):
+                filters['courier_id'] = int(request.args['courier_id'])
+                query = query.filter(Delivery.courier_id == filters['courier_id'])
+            if request.args.get('date_from'):
+                filters['date_from'] = request.args['date_from']
+                query = query.filter(Delivery.created_at >= datetime.fromisoformat(filters['date_from']))
+            if request.args.get('date_to'):
+                filters['date_to'] = request.args['date_to']
+                date_to = datetime.fromisoformat(filters['date_to'])
+                if _is_date_only(filters['date_to']):  # A plain date includes that whole day
+                    query = query.filter(Delivery.created_at < date_to + timedelta(days=1))
+                else:
+                    query = query.filter(Delivery.created_at <= date_to)
+            cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        # Total for this filter set, cached so paging through doesn't re-count every time
+        total = None
+        if limit is not None:
+            count_key = (scope, tuple(sorted(filters.items())))
+            total = _order_counts.get(count_key)
+            if total is None:
+                total = query.order_by(None).count()
+                _order_counts.set(count_key, total)
+
+        if cursor:
+            created_at, last_id = cursor
+            if created_at is None:
+                query = query.filter(Delivery.created_at.is_(None), Delivery.id < last_id)
+            else:
+                query = query.filter(db.or_(
+                    Delivery.created_at < created_at,
+                    db.and_(Delivery.created_at == created_at, Delivery.id < last_id)
+                ))
+
+        query = query.options(
+            selectinload(Delivery.customer).joinedload(Customer.user),
+            joinedload(Delivery.pickup_point).joinedload(PickupPoint.address),
+            joinedload(Delivery.delivery_point).joinedload(DeliveryPoint.address),
+            joinedload(Delivery.invoice)
+        ).order_by(Delivery.created_at.desc(), Delivery.id.desc())
+        if limit is None:
+            deliveries = query.all()
+            has_more, total = False, len(deliveries)
+        else:
+            deliveries = query.limit(limit + 1).all()
+            has_more = len(deliveries) > limit
+            deliveries = deliveries[:limit]
         
         result = []
         for d in deliveries:
@@ -412,7 +473,11 @@ def get_orders(current_user):
                 'delivery_address': d.delivery_point.address.street if d.delivery_point else ''
             })
         
-        return jsonify(result), 200
+        response = jsonify(result)
+        response.headers['X-Total-Count'] = str(total)
+        if has_more:
+            response.headers['X-Next-Cursor'] = _encode_cursor(deliveries[-1])
+        return response, 200
         
     except Exception as e:
         logging.error(f"Error fetching orders: {str(e)}", exc_info=True)
@@ -448,6 +513,7 @@ def get_order(current_user, order_id):
                 'address': delivery.pickup_point.address.street,
                 'contact': delivery.pickup_point.contact_name,
                 'phone': delivery.pickup_point.contact_phone,
+                'instructions': delivery.pickup_point.pickup_instructions,
                 'coords': {
                     'lat': delivery.pickup_point.address.latitude,
                     'lon': delivery.pickup_point.address.longitude
@@ -457,6 +523,7 @@ def get_order(current_user, order_id):
                 'address': delivery.delivery_point.address.street,
                 'recipient': delivery.delivery_point.recipient_name,
                 'phone': delivery.delivery_point.recipient_phone,
+                'instructions': delivery.delivery_point.delivery_instructions,
                 'coords': {
                     'lat': delivery.delivery_point.address.latitude,
                     'lon': delivery.delivery_point.address.longitude
@@ -491,14 +558,21 @@ def get_order(current_user, order_id):
 def assign_order(current_user, order_id):
     """הקצאת הזמנה לשליח"""
     try:
+        from utils.delivery_state import delivery_state, TransitionError
         data = request.json
         courier_id = data.get('courier_id')
+        if not courier_id:
+            return jsonify({'error': 'courier_id is required'}), 400
         
-        delivery = Delivery.query.get_or_404(order_id)
-        delivery.courier_id = courier_id
-        delivery.status = 'assigned'
-        
+        # Conditional UPDATE: a concurrent accept/assign makes this a 409, not a silent overwrite
+        try:
+            delivery_state.transition(order_id, 'assigned', actor_id=current_user.id, courier_id=courier_id,
+                                      notes=f"Assigned to courier {courier_id}")
+        except TransitionError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), e.status_code
         db.session.commit()
+        delivery = db.session.get(Delivery, order_id)
         
         # Notify the courier via Socket.IO
         from extensions import socketio
@@ -129,6 +129,10 @@ def delete_account(current_user):
         )
 
         db.session.commit()
+
+        if current_user.courier:
+            from utils.courier_index import courier_index
+            courier_index.remove(current_user.courier.id)
         
         return jsonify({'message': 'Account deleted successfully. You have been logged out.'}), 200
 
@@ -1,14 +1,17 @@
-from flask import Blueprint, request, jsonify, Response, make_response
-from models import db, Delivery, Invoice, User, Courier
+from flask import Blueprint, request, jsonify
+from models import db, Delivery, Invoice, User, Courier, Customer, Address, PickupPoint, DeliveryPoint
+from sqlalchemy.orm import aliased
+from utils.csv_stream import csv_response
+from utils.daily_rollup import daily_rollup
 from utils.decorators import token_required, role_required
 import logging
 from datetime import datetime, timedelta
-import csv
-import io
 from sqlalchemy import func, and_
 
 reports_bp = Blueprint('reports', __name__)
 
+EXPORT_BATCH_SIZE = 1000  # Rows per fetch; server-side cursor on Postgres
+
 @reports_bp.route('/revenue', methods=['GET'])
 @token_required
 @role_required(['admin', 'finance_admin'])
@@ -25,32 +28,25 @@ def get_revenue_report(current_user):
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
             
         if not end_date_str:
-            end_date = datetime.utcnow()
+            end_date = datetime.combine(datetime.utcnow().date(), datetime.min.time()) + timedelta(days=1) # Through today
         else:
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1) # Include the end day
 
-        # Query Revenue grouped by day
-        revenue_data = db.session.query(
-            func.date(Invoice.issue_date).label('date'),
-            func.sum(Invoice.total_amount).label('total'),
-            func.count(Invoice.id).label('count')
-        ).filter(
-            Invoice.issue_date >= start_date,
-            Invoice.issue_date < end_date,
-            Invoice.status.in_(['paid', 'sent']) # sent is also revenue theoretically
-        ).group_by(
-            func.date(Invoice.issue_date)
-        ).all()
+        # Revenue grouped by day, from the daily rollup (days in [start, end))
+        revenue_data = daily_rollup.revenue_by_day(
+            start_date.date(), end_date.date(),
+            ['paid', 'sent']  # sent is also revenue theoretically
+        )
         
         result = []
         total_period_revenue = 0
         
-        for r in revenue_data:
-            amount = float(r.total)
+        for day, r in revenue_data.items():
+            amount = r['amount']
             result.append({
-                'date': r.date.strftime('%Y-%m-%d'),
+                'date': day.strftime('%Y-%m-%d'),
                 'amount': amount,
-                'count': r.count
+                'count': r['invoices']
             })
             total_period_revenue += amount
             
@@ -80,61 +76,76 @@ def export_csv(current_user):
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d') + timedelta(days=1)
         
-        si = io.StringIO()
-        cw = csv.writer(si)
-        
         filename = f"report_{report_type}_{datetime.now().strftime('%Y%m%d')}.csv"
         
         if report_type == 'orders':
-            # Export Orders
-            cw.writerow(['Order ID', 'Date', 'Status', 'Customer', 'Courier', 'Pickup', 'Dropoff', 'Price', 'Distance'])
-            
-            orders = Delivery.query.filter(
-                Delivery.created_at >= start_date,
-                Delivery.created_at < end_date
-            ).all()
-            
-            for o in orders:
-                cw.writerow([
-                    o.order_number,
-                    o.created_at.strftime('%Y-%m-%d %H:%M'),
-                    o.status,
-                    o.customer.full_name if o.customer else 'Guest',
-                    o.courier.full_name if o.courier else 'Unassigned',
-                    o.pickup_point.address.city if o.pickup_point else '',
-                    o.delivery_point.address.city if o.delivery_point else '',
-                    o.invoice.total_amount if o.invoice else 0,
-                    o.distance_km or 0
-                ])
-                
+            rows = _order_export_rows(start_date, end_date)
         elif report_type == 'revenue':
-            # Export Revenue
-            cw.writerow(['Invoice ID', 'Date', 'Customer', 'Amount', 'VAT', 'Total', 'Status'])
-            
-            invoices = Invoice.query.filter(
-                Invoice.issue_date >= start_date,
-                Invoice.issue_date < end_date
-            ).all()
-            
-            for i in invoices:
-                cw.writerow([
-                    i.invoice_number,
-                    i.issue_date.strftime('%Y-%m-%d'),
-                    i.customer.full_name if i.customer else 'Unknown',
-                    i.subtotal,
-                    i.vat_amount,
-                    i.total_amount,
-                    i.status
-                ])
-        
+            rows = _revenue_export_rows(start_date, end_date)
         else:
             return jsonify({'error': 'Invalid report type'}), 400
-            
-        output = make_response(si.getvalue().encode('utf-8-sig')) # utf-8-sig for Hebrew Excel support
-        output.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        output.headers["Content-type"] = "text/csv"
-        return output
+
+        # Streamed in chunks (utf-8 BOM for Hebrew Excel support)
+        return csv_response(rows, filename)
         
     except Exception as e:
         logging.error(f"Error exporting CSV: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
+
+
+def _order_export_rows(start_date, end_date):
+    """Header + one row per order from a single joined query, read in batches"""
+    PickupAddress, DropoffAddress = aliased(Address), aliased(Address)
+    yield ['Order ID', 'Date', 'Status', 'Customer', 'Courier', 'Pickup', 'Dropoff', 'Price', 'Distance']
+
+    rows = db.session.query(
+        Delivery.order_number, Delivery.created_at, Delivery.status,
+        Customer.full_name, Courier.full_name, PickupAddress.city, DropoffAddress.city,
+        Invoice.total_amount, Delivery.distance_km
+    ).outerjoin(Customer, Customer.id == Delivery.customer_id
+    ).outerjoin(Courier, Courier.id == Delivery.courier_id
+    ).outerjoin(PickupPoint, PickupPoint.id == Delivery.pickup_point_id
+    ).outerjoin(PickupAddress, PickupAddress.id == PickupPoint.address_id
+    ).outerjoin(DeliveryPoint, DeliveryPoint.id == Delivery.delivery_point_id
+    ).outerjoin(DropoffAddress, DropoffAddress.id == DeliveryPoint.address_id
+    ).outerjoin(Invoice, Invoice.delivery_id == Delivery.id
+    ).filter(
+        Delivery.created_at >= start_date,
+        Delivery.created_at < end_date
+    ).order_by(Delivery.created_at, Delivery.id).yield_per(EXPORT_BATCH_SIZE)
+
+    for order_number, created_at, status, customer, courier, pickup_city, dropoff_city, total, distance in rows:
+        yield [
+            order_number,
+            created_at.strftime('%Y-%m-%d %H:%M'),
+            status,
+            customer or 'Guest',
+            courier or 'Unassigned',
+            pickup_city or '',
+            dropoff_city or '',
+            total if total is not None else 0,
+            distance or 0
+        ]
+
+
+def _revenue_export_rows(start_date, end_date):
+    yield ['Invoice ID', 'Date', 'Customer', 'Amount', 'VAT', 'Total', 'Status']
+
+    rows = db.session.query(
+        Invoice.invoice_number, Invoice.issue_date, Customer.full_name,
+        Invoice.subtotal, Invoice.vat_amount, Invoice.total_amount, Invoice.status
+    ).outerjoin(Customer, Customer.id == Invoice.customer_id).filter(
+        Invoice.issue_date >= start_date,
+        Invoice.issue_date < end_date
+    ).order_by(Invoice.issue_date, Invoice.id).yield_per(EXPORT_BATCH_SIZE)
+
+    for invoice_number, issue_date, customer, subtotal, vat_amount, total_amount, status in rows:
+        yield [
+            invoice_number,
+            issue_date.strftime('%Y-%m-%d'),
+            customer or 'Unknown',
+            subtotal,
+            vat_amount,
+            total_amount,
+            status
+        ]
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify
-from sqlalchemy import func
 from datetime import datetime, timedelta
-from models import db, Delivery, User, Invoice
+from utils.daily_rollup import daily_rollup
+from utils.dashboard_cache import dashboard_cache
 from utils.decorators import token_required, admin_required
 
 stats_bp = Blueprint('stats', __name__)
@@ -11,26 +11,14 @@ stats_bp = Blueprint('stats', __name__)
 @admin_required
 def get_dashboard_stats(current_user):
     """Get high-level dashboard statistics"""
-    
-    # 1. Orders Today
-    today = datetime.utcnow().date()
-    orders_today = Delivery.query.filter(func.date(Delivery.created_at) == today).count()
-    
-    # 2. Active Orders (Pending, Assigned, Picked Up, In Transit)
-    active_orders = Delivery.query.filter(Delivery.status.in_(['pending', 'assigned', 'picked_up', 'in_transit'])).count()
-    
-    # 3. Active Couriers
-    from models import Courier
-    active_couriers = Courier.query.filter_by(is_available=True).count() 
-    
-    # 4. Total Revenue Today
-    revenue_today = db.session.query(func.sum(Invoice.total_amount)).filter(func.date(Invoice.issue_date) == today, Invoice.status == 'paid').scalar() or 0
+    # One cached snapshot, kept current by 'dashboard_delta' pushes (utils/dashboard_cache.py)
+    counters = dashboard_cache.snapshot()
     
     return jsonify({
-        'orders_today': orders_today,
-        'active_orders': active_orders,
-        'active_couriers': active_couriers,
-        'revenue_today': float(revenue_today)
+        'orders_today': counters['orders_today'],
+        'active_orders': counters['orders_pending'] + counters['orders_active'],
+        'active_couriers': counters['couriers_available'],
+        'revenue_today': float(counters['revenue_today'])
     }), 200
 
 @stats_bp.route('/revenue', methods=['GET'])
@@ -41,28 +29,15 @@ def get_revenue_chart(current_user):
     end_date = datetime.utcnow().date()
     start_date = end_date - timedelta(days=6)
     
-    # Query: Date, Sum(Total_Amount)
-    results = db.session.query(
-        func.date(Invoice.issue_date).label('date'),
-        func.sum(Invoice.total_amount).label('total')
-    ).filter(
-        func.date(Invoice.issue_date) >= start_date,
-        Invoice.status == 'paid'
-    ).group_by(
-        func.date(Invoice.issue_date)
-    ).all()
-    
-    # Create map for O(1) lookup
-    revenue_map = {str(r.date): float(r.total) for r in results}
+    revenue_map = daily_rollup.revenue_by_day(start_date, end_date + timedelta(days=1), ['paid'])
     
     # Fill in missing days with 0
     chart_data = []
     for i in range(7):
         current_day = start_date + timedelta(days=i)
-        day_str = str(current_day)
         chart_data.append({
-            'date': day_str,
-            'amount': revenue_map.get(day_str, 0)
+            'date': str(current_day),
+            'amount': revenue_map.get(current_day, {}).get('amount', 0)
         })
         
     return jsonify(chart_data), 200
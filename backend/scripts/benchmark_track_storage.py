@@ -0,0 +1,106 @@
+"""
+Benchmark: row-per-point DeliveryTracking vs. compacted DeliveryTrackSegment.
+
+Usage: python scripts/benchmark_track_storage.py [--deliveries 200] [--points 1800]
+Builds a throwaway SQLite file, fills it with synthetic 1Hz tracks, then reports
+on-disk size and full-replay time before and after compaction.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from flask import Flask
+from sqlalchemy import insert, text
+
+from extensions import db
+from models import User, Courier, Customer, Address, PickupPoint, DeliveryPoint, Delivery, DeliveryTracking
+from utils.track_storage import TrackStorage
+
+
+def seed(n_deliveries, n_points, seed=7):
+    rnd = random.Random(seed)
+    user = User(username='bench_c', email='bench_c@test.com', phone='0500000000', user_type='courier', password_hash='x')
+    courier = Courier(user=user, full_name='Bench Courier', vehicle_type='scooter')
+    customer = Customer(user=User(username='bench_u', email='bench_u@test.com', phone='0510000000',
+                                  user_type='customer', password_hash='x'), full_name='Bench Customer')
+    db.session.add_all([courier, customer])
+    db.session.flush()
+
+    for d in range(n_deliveries):
+        address = Address(street='Bench', city='Tel Aviv', building_number=str(d))
+        delivery = Delivery(order_number=f'BENCH-{d}', customer=customer, courier=courier, status='delivered',
+                            pickup_point=PickupPoint(address=address, contact_name='a', contact_phone='0'),
+                            delivery_point=DeliveryPoint(address=address, recipient_name='b', recipient_phone='0'))
+        db.session.add(delivery)
+        db.session.flush()
+
+        lat, lng, t = 32.0853, 34.7818, datetime(2026, 3, 1, 8, 0)
+        rows = []
+        for _ in range(n_points):
+            lat += rnd.uniform(-0.00005, 0.00008)
+            lng += rnd.uniform(-0.00005, 0.00008)
+            t += timedelta(milliseconds=rnd.randint(950, 1050))
+            rows.append({'delivery_id': delivery.id, 'courier_id': courier.id, 'latitude': lat, 'longitude': lng,
+                         'speed': round(rnd.uniform(0, 45), 1), 'heading': round(rnd.uniform(0, 360), 1), 'timestamp': t})
+        db.session.execute(insert(DeliveryTracking), rows)
+    db.session.commit()
+    return [d for (d,) in db.session.query(Delivery.id).all()]
+
+
+def db_size(path):
+    db.session.commit()
+    db.session.execute(text('VACUUM'))
+    return os.path.getsize(path)
+
+
+def replay_all(delivery_ids):
+    started = time.perf_counter()
+    count = sum(1 for d in delivery_ids for _ in TrackStorage.iter_track(d))
+    return count, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--deliveries', type=int, default=200)
+    parser.add_argument('--points', type=int, default=1800)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tracks.db')
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            baseline = db_size(path)
+            delivery_ids = seed(args.deliveries, args.points)
+
+            rows_size = db_size(path) - baseline
+            rows_count, rows_time = replay_all(delivery_ids)
+
+            started = time.perf_counter()
+            TrackStorage.compact_closed(limit=len(delivery_ids))
+            compact_time = time.perf_counter() - started
+
+            seg_size = db_size(path) - baseline
+            seg_count, seg_time = replay_all(delivery_ids)
+            assert seg_count == rows_count
+
+    print(f"{rows_count:,} points over {args.deliveries} deliveries")
+    print(f"{'':<12}{'bytes':>14}{'bytes/pt':>10}{'replay s':>10}{'pts/s':>12}")
+    print(f"{'rows':<12}{rows_size:>14,}{rows_size / rows_count:>10.1f}{rows_time:>10.3f}{rows_count / rows_time:>12,.0f}")
+    print(f"{'segments':<12}{seg_size:>14,}{seg_size / seg_count:>10.1f}{seg_time:>10.3f}{seg_count / seg_time:>12,.0f}")
+    print(f"storage reduction x{rows_size / seg_size:.1f}, replay speedup x{rows_time / seg_time:.1f}, "
+          f"compaction took {compact_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
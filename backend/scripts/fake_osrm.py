@@ -0,0 +1,168 @@
+"""
+Local fake OSRM serving /route and /table over a synthetic grid road graph.
+
+Usage: python scripts/fake_osrm.py [--port 5001]
+       export OSRM_URL=http://localhost:5001
+
+Roads run along a STEP_DEG grid over central Israel. Every ARTERIAL_EVERY-th
+row/column is an arterial at ARTERIAL_KMH, the rest are local streets at
+LOCAL_KMH. A river along RIVER_LAT can only be crossed at a bridge every
+BRIDGE_EVERY columns, so road ETAs differ from straight-line distance.
+Points are snapped to the nearest grid node.
+"""
+import argparse
+import heapq
+import json
+import math
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+KM_PER_DEG = 111.32
+
+
+class GridGraph:
+    MIN_LAT, MAX_LAT = 31.70, 32.20
+    MIN_LNG, MAX_LNG = 34.70, 35.25
+    STEP_DEG = 0.005
+    ARTERIAL_EVERY = 10
+    ARTERIAL_KMH = 60.0
+    LOCAL_KMH = 30.0
+    RIVER_LAT = 32.1025
+    BRIDGE_EVERY = 20
+
+    def __init__(self):
+        self.rows = int(round((self.MAX_LAT - self.MIN_LAT) / self.STEP_DEG)) + 1
+        self.cols = int(round((self.MAX_LNG - self.MIN_LNG) / self.STEP_DEG)) + 1
+
+    def lat(self, i):
+        return self.MIN_LAT + i * self.STEP_DEG
+
+    def snap(self, lat, lng):
+        i = min(max(int(round((lat - self.MIN_LAT) / self.STEP_DEG)), 0), self.rows - 1)
+        j = min(max(int(round((lng - self.MIN_LNG) / self.STEP_DEG)), 0), self.cols - 1)
+        return i, j
+
+    def neighbors(self, node):
+        """Yield (neighbor, km, seconds)."""
+        i, j = node
+        ns_km = self.STEP_DEG * KM_PER_DEG
+        ew_km = self.STEP_DEG * KM_PER_DEG * math.cos(math.radians(self.lat(i)))
+        for di, dj in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            ni, nj = i + di, j + dj
+            if not (0 <= ni < self.rows and 0 <= nj < self.cols):
+                continue
+            if di:
+                lo = min(i, ni)
+                if self.lat(lo) < self.RIVER_LAT <= self.lat(lo + 1) and j % self.BRIDGE_EVERY:
+                    continue
+                km, arterial = ns_km, j % self.ARTERIAL_EVERY == 0
+            else:
+                km, arterial = ew_km, i % self.ARTERIAL_EVERY == 0
+            speed = self.ARTERIAL_KMH if arterial else self.LOCAL_KMH
+            yield (ni, nj), km, km / speed * 3600
+
+    def shortest(self, source, targets):
+        """Fastest paths from source: {target: (meters, seconds)}, None if unreachable."""
+        pending = set(targets)
+        found = {}
+        best = {source: 0.0}
+        heap = [(0.0, 0.0, source)]
+        while heap and pending:
+            seconds, km, node = heapq.heappop(heap)
+            if seconds > best.get(node, math.inf):
+                continue
+            if node in pending:
+                pending.discard(node)
+                found[node] = (km * 1000, seconds)
+            for nxt, edge_km, edge_s in self.neighbors(node):
+                t = seconds + edge_s
+                if t < best.get(nxt, math.inf):
+                    best[nxt] = t
+                    heapq.heappush(heap, (t, km + edge_km, nxt))
+        return {t: found.get(t) for t in targets}
+
+
+class FakeOSRM:
+    def __init__(self, graph=None):
+        self.graph = graph or GridGraph()
+        self.requests = []
+
+    def handle(self, path, query):
+        service = path.split('/')[1]
+        coords = [tuple(reversed([float(v) for v in pair.split(',')]))
+                  for pair in path.rsplit('/', 1)[1].split(';')]
+        nodes = [self.graph.snap(lat, lng) for lat, lng in coords]
+
+        if service == 'route':
+            result = self.graph.shortest(nodes[0], [nodes[1]])[nodes[1]]
+            if result is None:
+                return {'code': 'NoRoute'}
+            return {'code': 'Ok', 'routes': [{'distance': result[0], 'duration': result[1]}]}
+
+        if service == 'table':
+            sources = self._indexes(query.get('sources'), len(nodes))
+            destinations = self._indexes(query.get('destinations'), len(nodes))
+            distances, durations = [], []
+            for s in sources:
+                paths = self.graph.shortest(nodes[s], [nodes[d] for d in destinations])
+                row = [paths[nodes[d]] for d in destinations]
+                distances.append([r[0] if r else None for r in row])
+                durations.append([r[1] if r else None for r in row])
+            return {'code': 'Ok', 'distances': distances, 'durations': durations}
+
+        return {'code': 'InvalidService'}
+
+    @staticmethod
+    def _indexes(value, count):
+        if not value or value[0] == 'all':
+            return list(range(count))
+        return [int(i) for i in value[0].split(';')]
+
+
+def make_server(osrm, host='127.0.0.1', port=0):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            osrm.requests.append(self.path)
+            body = json.dumps(osrm.handle(url.path, parse_qs(url.query))).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+@contextmanager
+def serve_osrm(osrm=None):
+    """Run a FakeOSRM on a free localhost port in a thread; yields (base_url, osrm)."""
+    osrm = osrm or FakeOSRM()
+    server = make_server(osrm)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", osrm
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+
+    server = make_server(FakeOSRM(), args.host, args.port)
+    print(f"Fake OSRM grid on http://{args.host}:{args.port} (export OSRM_URL=http://{args.host}:{args.port})")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
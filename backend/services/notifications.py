@@ -38,7 +38,7 @@ def send_push_notification(tokens, title, body, data=None):
         print(f"❌ Error sending FCM: {e}")
         return False
 
-def notify_new_mission(order):
+def notify_new_mission(order, price=None):
     """
     Triggers a notification for all available couriers about a new mission.
     """
@@ -48,13 +48,13 @@ def notify_new_mission(order):
     # For now, we'll notify all available couriers who have an FCM token
     # (Assuming we stored FCM tokens in the User model)
     
-    available_couriers = Courier.query.filter_by(is_available=True).all()
+    available_count = Courier.query.filter_by(is_available=True).count()
     # Mock behavior: just log it since we don't have real tokens yet
-    print(f"🔔 Notifying {len(available_couriers)} couriers about Order #{order.order_number}")
+    print(f"🔔 Notifying {available_count} couriers about Order #{order.order_number}")
     
     send_push_notification(
         tokens=["MOCK_TOKEN"], # Replace with actual tokens from DB
         title="משימה חדשה זמינה! 📦",
-        body=f"מאיסוף: {order.pickup_address} | שווי: ₪{order.estimated_price}",
+        body=f"מאיסוף: {order.pickup_point.address.street} | שווי: ₪{price if price is not None else order.delivery_fee}",
         data={"order_id": order.id, "type": "new_mission"}
     )
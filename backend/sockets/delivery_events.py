@@ -7,6 +7,19 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Authenticated courier of each connection (sid -> Courier.id), set on connect.
+# Location pings act only for this courier, never for a payload-supplied id.
+_socket_couriers = {}
+
+
+def _remember_courier(sid, user_id):
+    from models import Courier
+    courier_id = Courier.query.with_entities(Courier.id).filter_by(user_id=int(user_id)).scalar()
+    if courier_id is not None:
+        _socket_couriers[sid] = courier_id
+    return courier_id
+
+
 def register_socket_events(socketio):
     """רישום כל אירועי Socket.IO"""
     
@@ -27,6 +40,7 @@ def register_socket_events(socketio):
             from flask_jwt_extended import decode_token
             decoded = decode_token(token)
             user_id = decoded['sub']
+            _remember_courier(request.sid, user_id)
             print(f'✅ Client authenticated: User {user_id} (SID: {request.sid})')
             emit('connected', {'message': 'Connected to server', 'user_id': user_id})
             return True
@@ -37,6 +51,7 @@ def register_socket_events(socketio):
     @socketio.on('disconnect')
     def handle_disconnect():
         """ניתוק של קליינט"""
+        _socket_couriers.pop(request.sid, None)
         print(f'❌ Client disconnected: {request.sid}')
     
     @socketio.on('join')
@@ -89,6 +104,7 @@ def register_socket_events(socketio):
                     return
                 
                 # Join the general courier room
+                _socket_couriers[request.sid] = courier.id
                 join_room(room)
                 
                 # Join the specific courier room with validated ID
@@ -160,7 +176,14 @@ def register_socket_events(socketio):
     @socketio.on('courier_location_update')
     def handle_location_update(data):
         """עדכון מיקום שליח"""
-        courier_id = data.get('courier_id')
+        # Only the connection's own courier: the payload id is a claim, not an identity
+        courier_id = _socket_couriers.get(request.sid)
+        if courier_id is None:
+            return
+        claimed = data.get('courier_id')
+        if claimed is not None and str(claimed) != str(courier_id):
+            emit('error', {'message': "Unauthorized: Cannot report another courier's location"})
+            return
         # Support both lat/lng (client) and latitude/longitude (legacy)
         lat = data.get('lat') or data.get('latitude')
         lng = data.get('lng') or data.get('longitude')
@@ -168,9 +191,31 @@ def register_socket_events(socketio):
         
         if not lat or not lng:
             return
-            
-        print(f'📍 Courier {courier_id} location update: {lat}, {lng}')
-        
+
+        # Keep the allocation index and the live Redis GEO set current
+        from utils.courier_index import courier_index
+        from utils.live_locations import get_live_location_store
+        try:
+            courier_index.update_location(int(courier_id), float(lat), float(lng))
+            store = get_live_location_store()
+            if store is not None:
+                store.update(int(courier_id), float(lat), float(lng))
+        except (TypeError, ValueError):
+            pass
+        except Exception as e:
+            print(f'⚠️ Live location store error: {e}')
+
+        # Persist through the write-behind buffer (flushed in batches)
+        from flask import current_app
+        from utils.location_buffer import location_buffer, start_location_flusher
+        try:
+            location_buffer.add(courier_id, lat, lng,
+                                delivery_id=data.get('delivery_id'),
+                                speed=data.get('speed'), heading=data.get('heading'))
+            start_location_flusher(current_app._get_current_object())
+        except (TypeError, ValueError):
+            pass
+
         # Prepare broadcast data
         location_data = {
             'courier_id': courier_id,
@@ -0,0 +1,47 @@
+"""
+Helpers for tests that exercise the Flask models on an in-memory SQLite DB.
+(conftest.py fixtures target the FastAPI app under app/.)
+"""
+from contextlib import contextmanager
+from flask import Flask
+
+from extensions import db
+from models import User, Courier, Customer, Address, PickupPoint, DeliveryPoint, Delivery
+
+
+@contextmanager
+def flask_app_context(uri='sqlite://'):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+def make_courier(n, lat, lng, **kwargs):
+    user = User(username=f'c{n}', email=f'c{n}@test.com', phone=f'0500{n:06d}', user_type='courier', password_hash='x')
+    fields = dict(full_name=f'Courier {n}', vehicle_type='scooter', is_available=True,
+                  onboarding_status='approved', current_location_lat=lat, current_location_lng=lng)
+    fields.update(kwargs)
+    return Courier(user=user, **fields)
+
+
+def make_customer(n=0):
+    user = User(username=f'cust{n}', email=f'cust{n}@test.com', phone=f'0510{n:06d}', user_type='customer', password_hash='x')
+    return Customer(user=user, full_name=f'Customer {n}')
+
+
+def make_delivery(customer, order_number, lat, lng, **kwargs):
+    pickup = PickupPoint(address=Address(street='Pickup', city='Tel Aviv', building_number='1', latitude=lat, longitude=lng),
+                         contact_name='Sender', contact_phone='050')
+    dropoff = DeliveryPoint(address=Address(street='Dropoff', city='Tel Aviv', building_number='2'),
+                            recipient_name='Recipient', recipient_phone='050')
+    fields = dict(package_size='small', status='pending')
+    fields.update(kwargs)
+    return Delivery(order_number=order_number, customer=customer, pickup_point=pickup, delivery_point=dropoff, **fields)
@@ -0,0 +1,83 @@
+from sqlalchemy import update
+
+from extensions import db
+from models import Address, PickupPoint, DeliveryPoint, Delivery
+from tests.flask_factories import flask_app_context, make_customer, make_delivery
+from utils.address_dedup import AddressDeduplicator
+
+
+def test_fingerprint_ignores_spelling_but_not_apartment_or_location():
+    base = Address.fingerprint('הרצל', '10', 'תל אביב', latitude=32.06361, longitude=34.77221)
+    assert Address.fingerprint("רח' הרצל", '10', 'תל-אביב', latitude=32.06363, longitude=34.77218) == base
+    assert Address.fingerprint('הרצל', '10', 'תל אביב', apartment='3', latitude=32.06361, longitude=34.77221) != base
+    assert Address.fingerprint('הרצל', '10', 'תל אביב', latitude=32.0700, longitude=34.77221) != base
+    assert Address.fingerprint('הרצל', '10', 'תל אביב') != base
+
+
+def test_repeated_pickup_reuses_address_and_point():
+    dedup = AddressDeduplicator()
+    with flask_app_context():
+        first = dedup.get_or_create_address('Warehouse', '5', 'Holon', latitude=32.01, longitude=34.78)
+        point = dedup.get_or_create_pickup_point(first, 'Merchant Sender', '000-0000000')
+        db.session.commit()
+
+        again = dedup.get_or_create_address('warehouse st.', '5', 'HOLON', latitude=32.01, longitude=34.78)
+        assert again.id == first.id
+        assert dedup.get_or_create_pickup_point(again, 'Merchant Sender', '000-0000000', '').id == point.id
+        assert dedup.get_or_create_pickup_point(again, 'Other Contact', '000-0000000').id != point.id
+        assert Address.query.count() == 1 and PickupPoint.query.count() == 2
+
+        # A cold cache finds the same rows through the hash index
+        cold = AddressDeduplicator()
+        assert cold.get_or_create_address('Warehouse', '5', 'Holon', latitude=32.01, longitude=34.78).id == first.id
+        assert cold.stats == {'reused': 1, 'created': 0}
+
+
+def test_delivery_instructions_are_kept_per_point():
+    dedup = AddressDeduplicator()
+    with flask_app_context():
+        address = dedup.get_or_create_address('Dizengoff', '100', 'Tel Aviv')
+        gate = dedup.get_or_create_delivery_point(address, 'Dana', '050', delivery_instructions='Gate code 1234')
+        plain = dedup.get_or_create_delivery_point(address, 'Dana', '050')
+        db.session.commit()
+        assert gate.id != plain.id and plain.delivery_instructions is None
+        assert dedup.get_or_create_address('Dizengoff', '100', 'Tel Aviv').notes is None
+
+
+def test_cached_row_lost_to_rollback_is_not_reused():
+    dedup = AddressDeduplicator()
+    with flask_app_context():
+        lost = dedup.get_or_create_address('Dizengoff', '100', 'Tel Aviv')
+        dedup.get_or_create_delivery_point(lost, 'Dana', '050')
+        db.session.rollback()
+
+        address = dedup.get_or_create_address('Dizengoff', '100', 'Tel Aviv')
+        point = dedup.get_or_create_delivery_point(address, 'Dana', '050')
+        db.session.commit()
+        assert db.session.get(Address, address.id) is not None
+        assert db.session.get(DeliveryPoint, point.id).address_id == address.id
+
+
+def test_compaction_merges_duplicates_and_rewrites_foreign_keys():
+    with flask_app_context():
+        customer = make_customer()
+        deliveries = [make_delivery(customer, f'ORD-{i}', 32.08, 34.78) for i in range(3)]
+        deliveries.append(make_delivery(customer, 'ORD-other', 32.5, 34.9))
+        db.session.add_all(deliveries)
+        db.session.commit()
+        # Rows from before the hash column existed
+        db.session.execute(update(Address).values(address_hash=None))
+        db.session.commit()
+        assert Address.query.count() == 8
+
+        merged = AddressDeduplicator().compact()
+        assert merged == {'hashes_refreshed': 8, 'addresses': 5, 'pickup_points': 2, 'delivery_points': 3}
+        assert Address.query.count() == 3
+        assert PickupPoint.query.count() == 2 and DeliveryPoint.query.count() == 1
+
+        db.session.expire_all()
+        orders = {d.order_number: d for d in Delivery.query.all()}
+        assert len(orders) == 4
+        assert len({orders[f'ORD-{i}'].pickup_point_id for i in range(3)}) == 1
+        assert orders['ORD-other'].pickup_point.address.latitude == 32.5
+        assert len({d.delivery_point_id for d in orders.values()}) == 1
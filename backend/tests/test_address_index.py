@@ -0,0 +1,107 @@
+import time
+
+from extensions import db
+from models import Address
+from tests.flask_factories import flask_app_context
+from utils.address_dedup import AddressDeduplicator
+from utils.address_index import AddressAutocompleteIndex, address_index
+
+
+def make_index():
+    index = AddressAutocompleteIndex()
+    index.load([
+        (1, 'הרצל', '10', 'תל אביב'),
+        (2, 'הרצל', '10', 'ראשון לציון'),
+        (3, 'הרצל', '10', 'ראשון לציון'),
+        (4, 'הרצליה', '5', 'חיפה'),
+        (5, "רח' אלנבי", '1', 'תל-אביב'),
+        (6, 'Rothschild', '22', 'Tel Aviv'),
+    ])
+    return index
+
+
+def full(results):
+    return [r['full_address'] for r in results]
+
+
+def test_prefix_match_on_hebrew_tokens():
+    index = make_index()
+    # Two rows share the first suggestion; ties go to the shorter string
+    assert full(index.search('הרצ')) == ['הרצל 10, ראשון לציון', 'הרצליה 5, חיפה', 'הרצל 10, תל אביב']
+    # Exact token beats a longer word with the same prefix
+    assert full(index.search('הרצל'))[-1] == 'הרצליה 5, חיפה'
+
+
+def test_all_query_tokens_must_match_in_any_order():
+    index = make_index()
+    assert full(index.search('תל אביב הרצ')) == ['הרצל 10, תל אביב']
+    assert full(index.search('אלנבי תל-אביב')) == ["רח' אלנבי 1, תל-אביב"]
+    assert index.search('הרצל חיפה 99') == []
+
+
+def test_infix_and_case_insensitive_matches():
+    index = make_index()
+    assert full(index.search('ROTHS')) == ['Rothschild 22, Tel Aviv']
+    assert full(index.search('schild')) == ['Rothschild 22, Tel Aviv']
+    assert full(index.search('צליה')) == ['הרצליה 5, חיפה']
+
+
+def test_duplicate_rows_collapse_into_one_weighted_suggestion():
+    index = make_index()
+    results = index.search('ראשון')
+    assert len(results) == 1 and results[0]['id'] == 2
+    assert len(index) == 5 and index.max_id == 6
+
+
+def test_search_is_fast_on_a_large_index():
+    index = AddressAutocompleteIndex()
+    index.load((i, f'רחוב{i % 5000}', str(i % 200), f'עיר{i % 50}') for i in range(1, 50001))
+    started = time.perf_counter()
+    for _ in range(100):
+        assert index.search('רחוב123 עיר2')
+    assert (time.perf_counter() - started) / 100 < 0.005
+
+
+def test_index_follows_committed_inserts_only(tmp_path):
+    with flask_app_context(f"sqlite:///{tmp_path / 'addr.db'}"):
+        address_index.clear()
+        db.session.add(Address(street='הרצל', building_number='10', city='תל אביב'))
+        db.session.commit()
+        address_index.ensure_fresh()
+        assert full(address_index.search('הרצ')) == ['הרצל 10, תל אביב']
+
+        db.session.add(Address(street='ויצמן', building_number='3', city='כפר סבא'))
+        db.session.commit()
+        assert full(address_index.search('ויצ')) == ['ויצמן 3, כפר סבא']
+
+        db.session.add(Address(street='ביאליק', building_number='7', city='רמת גן'))
+        db.session.flush()
+        db.session.rollback()
+        assert address_index.search('ביאליק') == []
+        address_index.clear()
+
+
+def test_edits_deletes_and_compaction_are_reflected(tmp_path):
+    with flask_app_context(f"sqlite:///{tmp_path / 'addr.db'}"):
+        address_index.clear()
+        herzl, weizmann = Address(street='הרצל', building_number='10', city='תל אביב'), \
+            Address(street='ויצמן', building_number='3', city='כפר סבא')
+        db.session.add_all([herzl, weizmann])
+        db.session.commit()
+        address_index.ensure_fresh()
+
+        herzl.street = 'הרצוג'
+        db.session.delete(weizmann)
+        db.session.commit()
+        address_index.ensure_fresh()
+        assert full(address_index.search('הרצ')) == ['הרצוג 10, תל אביב']
+        assert address_index.search('ויצ') == []
+
+        # Compaction deletes duplicates with Core statements, out of sight of the commit hooks
+        db.session.add(Address(street='הרצוג', building_number='10', city='תל אביב'))
+        db.session.commit()
+        AddressDeduplicator().compact()
+        address_index.ensure_fresh()
+        [entry] = address_index.search('הרצוג')
+        assert entry['id'] == herzl.id and address_index._weights == [1]
+        address_index.clear()
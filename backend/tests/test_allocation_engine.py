@@ -0,0 +1,42 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from utils.allocation_engine import AllocationEngine
+
+np = pytest.importorskip("numpy")
+
+
+def _couriers(n, seed=1):
+    rnd = random.Random(seed)
+    couriers = []
+    for i in range(n):
+        located = rnd.random() > 0.05
+        couriers.append(SimpleNamespace(
+            id=i,
+            vehicle_type=rnd.choice(['bicycle', 'scooter', 'motorcycle', 'car', 'van']),
+            current_location_lat=32.0853 + rnd.uniform(-0.4, 0.4) if located else None,
+            current_location_lng=34.7818 + rnd.uniform(-0.4, 0.4) if located else None,
+            # Coarse values so ties exist and ordering stability is exercised
+            performance_index=rnd.choice([None, 0, 50.0, 80.0, 100.0])
+        ))
+    return couriers
+
+
+@pytest.mark.parametrize("package_size", ['small', 'medium', 'large', 'xlarge', None])
+def test_vectorized_scoring_matches_loop(package_size):
+    couriers = _couriers(2000)
+    delivery = SimpleNamespace(package_size=package_size)
+
+    loop = AllocationEngine.score_candidates(couriers, delivery, 32.0853, 34.7818, vectorized=False)
+    vec = AllocationEngine.score_candidates(couriers, delivery, 32.0853, 34.7818, vectorized=True)
+
+    assert [r['courier'].id for r in vec] == [r['courier'].id for r in loop]
+    assert [r['score'] for r in vec] == pytest.approx([r['score'] for r in loop])
+    assert [r['distance'] for r in vec] == pytest.approx([r['distance'] for r in loop])
+
+
+def test_vectorized_scoring_empty():
+    delivery = SimpleNamespace(package_size='small')
+    assert AllocationEngine.score_candidates([], delivery, 32.0, 34.8, vectorized=True) == []
@@ -0,0 +1,99 @@
+import logging
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import AuditLog, User
+from tests.flask_factories import flask_app_context
+from utils import audit
+from utils.audit import AuditSink, audit_sink, log_audit
+from utils.query_stats import assert_max_queries
+
+
+class Lines(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+@pytest.fixture
+def app(tmp_path):
+    # A file DB: in-memory SQLite would share one connection between sessions
+    with flask_app_context(f'sqlite:///{tmp_path / "audit.db"}') as app:
+        yield app
+
+
+@pytest.fixture(autouse=True)
+def json_lines():
+    # Capture the JSON trail instead of appending to logs/security.json
+    handler = Lines()
+    audit.json_logger.removeHandler(audit.file_handler)
+    audit.json_logger.addHandler(handler)
+    yield handler.records
+    audit.json_logger.removeHandler(handler)
+    audit.json_logger.addHandler(audit.file_handler)
+
+
+def stored_actions():
+    with Session(db.engine) as session:
+        return session.scalars(select(AuditLog.action).order_by(AuditLog.id)).all()
+
+
+def test_log_audit_leaves_the_callers_transaction_alone(app, json_lines):
+    db.session.add(User(username='u', email='u@test.com', phone='050', user_type='customer', password_hash='x'))
+    with app.test_request_context(headers={'X-Forwarded-For': '10.0.0.1'}):
+        log_audit('VIEW_ORDER', user_id=1, resource_type='Delivery', resource_id=5)
+    assert audit_sink.flush()
+    db.session.rollback()
+
+    assert User.query.count() == 0
+    assert stored_actions() == ['VIEW_ORDER']
+    assert '"resource": "Delivery:5"' in json_lines[-1] and '"ip_address": "10.0.0.1"' in json_lines[-1]
+
+
+def test_entries_are_written_in_batches(app, json_lines, monkeypatch):
+    sink = AuditSink()
+    monkeypatch.setattr(sink, '_start', lambda: None)  # Drain from the test thread only
+    for i in range(1200):
+        sink.submit(app, {'user_id': None, 'action': f'A{i}', 'resource_type': None, 'resource_id': None,
+                          'ip_address': 'SYSTEM', 'status': 'SUCCESS', 'details': None,
+                          'timestamp': audit.datetime.utcnow()})
+
+    # Per batch: read the chain head, one multi-row insert
+    with assert_max_queries(6) as queries:
+        assert sink.flush()
+    assert sum(n for shape, n in queries.shapes.items() if shape.startswith('INSERT INTO audit_logs')) == 3
+    assert len(stored_actions()) == 1200
+    assert len(json_lines) == 3 and sum(len(lines.split('\n')) for lines in json_lines) == 1200
+    assert sink.stats == {'submitted': 1200, 'written': 1200, 'batches': 3, 'write_errors': 0, 'dropped': 0}
+
+
+def test_full_queue_applies_back_pressure_then_falls_back_to_the_json_log(app, json_lines, monkeypatch):
+    sink = AuditSink(max_pending=2)
+    sink.PUT_TIMEOUT_SECONDS = 0.01
+    monkeypatch.setattr(sink, '_start', lambda: None)
+    with app.test_request_context():
+        monkeypatch.setattr(audit, 'audit_sink', sink)
+        for action in ('A', 'B', 'C'):
+            log_audit(action)
+
+    assert sink.pending() == 2 and sink.stats['dropped'] == 1
+    assert '"action": "C"' in json_lines[-1]
+    sink.flush()
+    assert stored_actions() == ['A', 'B']
+
+
+def test_close_flushes_what_is_queued(app):
+    sink = AuditSink()
+    with app.test_request_context():
+        for action in ('LOGIN', 'LOGOUT'):
+            sink.submit(app, {'user_id': None, 'action': action, 'resource_type': None, 'resource_id': None,
+                              'ip_address': 'SYSTEM', 'status': 'SUCCESS', 'details': None,
+                              'timestamp': audit.datetime.utcnow()})
+    sink.close(timeout=5)
+    assert stored_actions() == ['LOGIN', 'LOGOUT'] and sink.pending() == 0
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import AuditCheckpoint, AuditLog
+from tests.flask_factories import flask_app_context
+from utils import audit
+from utils.audit import AuditSink
+from utils.audit_chain import AuditChain
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(AuditChain, 'CHECKPOINT_INTERVAL', 100)
+    monkeypatch.setattr(AuditChain, '_key', b'test-chain-key')
+    monkeypatch.setattr(audit.json_logger, 'disabled', True)
+    with flask_app_context(f'sqlite:///{tmp_path / "chain.db"}') as app:
+        app.sink = AuditSink()
+        monkeypatch.setattr(app.sink, '_start', lambda: None)
+        yield app
+
+
+def write(app, n, start=0):
+    for i in range(start, start + n):
+        app.sink.submit(app, {'user_id': i % 7 or None, 'action': 'VIEW_ORDER', 'resource_type': 'Delivery',
+                              'resource_id': str(i), 'ip_address': '10.0.0.1', 'status': 'SUCCESS',
+                              'details': f"User accessed order {i}", 'timestamp': datetime.utcnow()})
+    app.sink.flush()
+
+
+def verify(**kwargs):
+    with Session(db.engine) as session:
+        return AuditChain.verify(session, **kwargs)
+
+
+def tamper(statement):
+    with Session(db.engine) as session:
+        session.execute(statement)
+        session.commit()
+
+
+def test_batches_extend_one_chain(app):
+    write(app, 250)
+    write(app, 60, start=250)
+
+    result = verify()
+    assert result['ok'] and result['rows'] == 310 and result['rows_per_sec'] > 0
+    assert [cp.seq for cp in AuditCheckpoint.query.order_by(AuditCheckpoint.seq)] == [100, 200, 300]
+    first, second = AuditLog.query.filter(AuditLog.seq.in_([1, 2])).order_by(AuditLog.seq)
+    assert first.prev_digest == AuditChain.GENESIS and second.prev_digest == first.digest
+
+
+def test_edited_row_is_detected(app):
+    write(app, 150)
+    tamper(update(AuditLog).where(AuditLog.seq == 42).values(details='nothing to see'))
+    result = verify()
+    assert (result['ok'], result['first_bad_seq'], result['error']) == (False, 42, 'row content does not match its digest')
+
+
+def test_deleted_rows_are_detected(app):
+    write(app, 150)
+    tamper(delete(AuditLog).where(AuditLog.seq.between(10, 12)))
+    result = verify()
+    assert (result['first_bad_seq'], result['error']) == (10, 'rows 10..12 missing')
+
+
+def test_truncated_tail_is_caught_by_a_checkpoint(app):
+    write(app, 150)
+    tamper(delete(AuditLog).where(AuditLog.seq > 90))
+    result = verify()
+    assert not result['ok'] and result['error'] == 'chain ends before checkpoint 100'
+
+
+def test_range_resumes_from_nearest_checkpoint(app):
+    write(app, 250)
+    result = verify(start_seq=230, end_seq=240)
+    assert result['ok'] and result['checked_from'] == 201 and result['rows'] == 40
+
+
+def test_forged_checkpoint_is_rejected(app):
+    write(app, 250)
+    tamper(update(AuditCheckpoint).where(AuditCheckpoint.seq == 200).values(digest='f' * 64))
+    result = verify(start_seq=230)
+    assert (result['ok'], result['first_bad_seq'], result['error']) == (False, 200, 'checkpoint signature mismatch')
+
+
+def test_without_a_key_rows_are_stored_unchained(app, monkeypatch, caplog):
+    monkeypatch.setattr(AuditChain, '_key', None)
+    monkeypatch.setattr(AuditChain, '_reported', False)
+    write(app, 3)
+    write(app, 2, start=3)
+
+    assert AuditLog.query.count() == 5
+    assert AuditLog.query.filter(AuditLog.seq.isnot(None)).count() == 0
+    assert AuditCheckpoint.query.count() == 0
+    assert [r.message for r in caplog.records if 'AUDIT_CHAIN_KEY' in r.message] == [
+        'Neither AUDIT_CHAIN_KEY nor DIGITAL_SIGNATURE_KEY is set: audit rows are stored without the hash chain']
+    assert not verify()['ok']
@@ -0,0 +1,103 @@
+import itertools
+import random
+from datetime import datetime
+
+import pytest
+
+from extensions import db
+from models import Delivery, DeliveryStatus
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils import batch_allocation
+from utils.batch_allocation import BatchAllocationEngine, solve_assignment
+from utils.courier_index import courier_index
+from utils.query_stats import assert_max_queries
+
+
+@pytest.mark.parametrize("use_scipy", [False, True])
+def test_solve_assignment_is_optimal(monkeypatch, use_scipy):
+    if use_scipy:
+        pytest.importorskip("scipy")
+    else:
+        monkeypatch.setattr(batch_allocation, 'linear_sum_assignment', None)
+
+    rnd = random.Random(3)
+    for _ in range(20):
+        n, m = rnd.randint(1, 4), rnd.randint(4, 6)
+        cost = [[rnd.randint(0, 50) for _ in range(m)] for _ in range(n)]
+
+        result = solve_assignment(cost)
+        assert len(set(result)) == n
+        best = min(sum(cost[r][c] for r, c in enumerate(cols))
+                   for cols in itertools.permutations(range(m), n))
+        assert sum(cost[r][c] for r, c in enumerate(result)) == best
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        courier_index.clear()
+        yield app
+        courier_index.clear()
+
+
+def test_allocate_pending_respects_capacity_and_global_optimum(app):
+    # A and B each have one free slot, ~5km apart.
+    a = make_courier(1, 32.0853, 34.7818, max_capacity=1)
+    b = make_courier(2, 32.1300, 34.7818, max_capacity=1)
+    customer = make_customer()
+    # Greedy in arrival order gives d1 -> A (2.4km vs 2.6km) and then d2 -> B (5km).
+    # The global optimum is d1 -> B, d2 -> A.
+    d1 = make_delivery(customer, 'ORD-1', 32.1070, 34.7818, created_at=datetime(2026, 1, 1, 10, 0))
+    d2 = make_delivery(customer, 'ORD-2', 32.0853, 34.7818, created_at=datetime(2026, 1, 1, 10, 1))
+    far = make_delivery(customer, 'ORD-FAR', 29.5577, 34.9519, created_at=datetime(2026, 1, 1, 10, 2))  # Eilat, out of range
+    db.session.add_all([a, b, d1, d2, far])
+    db.session.commit()
+
+    assigned = BatchAllocationEngine.allocate_pending()
+
+    assert {(d.order_number, c.id) for d, c in assigned} == {('ORD-1', b.id), ('ORD-2', a.id)}
+    assert Delivery.query.filter_by(order_number='ORD-FAR').one().status == 'pending'
+    # Applied through the state machine: one history row per assignment
+    history = DeliveryStatus.query.filter_by(status='assigned').all()
+    assert sorted(h.delivery_id for h in history) == sorted([d1.id, d2.id])
+
+
+def test_allocate_pending_loads_candidates_once(app):
+    couriers = [make_courier(i, 32.08 + i * 0.01, 34.78, max_capacity=2) for i in range(1, 4)]
+    customer = make_customer()
+    deliveries = [make_delivery(customer, f'ORD-{i}', 32.08 + i * 0.005, 34.78) for i in range(8)]
+    db.session.add_all(couriers + deliveries)
+    db.session.commit()
+
+    with assert_max_queries(100) as queries:
+        assigned = BatchAllocationEngine.allocate_pending()
+    assert len(assigned) == 6
+    courier_loads = [n for shape, n in queries.shapes.items()
+                     if shape.startswith('SELECT couriers.') and 'couriers.id IN (...)' in shape]
+    assert courier_loads == [1]
+
+
+def test_allocate_pending_skips_full_couriers(app):
+    full = make_courier(1, 32.0853, 34.7818, max_capacity=1)
+    customer = make_customer()
+    busy = make_delivery(customer, 'ORD-BUSY', 32.0853, 34.7818, status='assigned', courier=full)
+    waiting = make_delivery(customer, 'ORD-WAIT', 32.0853, 34.7818)
+    db.session.add_all([full, busy, waiting])
+    db.session.commit()
+
+    assert BatchAllocationEngine.allocate_pending() == []
+    assert db.session.get(Delivery, waiting.id).status == 'pending'
+
+
+def test_allocate_pending_shrinks_the_batch_without_scipy(app, monkeypatch):
+    monkeypatch.setattr(batch_allocation, 'linear_sum_assignment', None)
+    monkeypatch.setattr(BatchAllocationEngine, 'FALLBACK_BATCH_LIMIT', 1)
+    courier = make_courier(1, 32.0853, 34.7818, max_capacity=2)
+    customer = make_customer()
+    first = make_delivery(customer, 'ORD-1', 32.0853, 34.7818, created_at=datetime(2026, 1, 1, 10, 0))
+    second = make_delivery(customer, 'ORD-2', 32.0853, 34.7818, created_at=datetime(2026, 1, 1, 10, 1))
+    db.session.add_all([courier, first, second])
+    db.session.commit()
+
+    assert [d.order_number for d, _ in BatchAllocationEngine.allocate_pending()] == ['ORD-1']
+    assert [d.order_number for d, _ in BatchAllocationEngine.allocate_pending()] == ['ORD-2']
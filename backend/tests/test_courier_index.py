@@ -0,0 +1,85 @@
+import pytest
+
+from extensions import db
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.allocation_engine import AllocationEngine
+from utils.courier_index import CourierSpatialIndex, courier_index
+
+
+def test_radius_query_only_returns_nearby_cells():
+    index = CourierSpatialIndex()
+    index.upsert(1, 32.0853, 34.7818)   # Tel Aviv
+    index.upsert(2, 32.1000, 34.8000)   # ~2km away
+    index.upsert(3, 31.7683, 35.2137)   # Jerusalem, ~55km away
+
+    found = set(index.query_radius(32.0853, 34.7818, 10))
+    assert {1, 2} <= found
+    assert 3 not in found
+
+
+def test_upsert_moves_and_remove_drops():
+    index = CourierSpatialIndex()
+    index.upsert(1, 32.0853, 34.7818)
+    index.upsert(1, 31.7683, 35.2137)
+    assert 1 not in index.query_radius(32.0853, 34.7818, 5)
+    assert 1 in index.query_radius(31.7683, 35.2137, 5)
+
+    index.remove(1)
+    assert len(index) == 0
+    assert index.query_radius(31.7683, 35.2137, 5) == []
+
+
+def test_update_location_ignores_unindexed_couriers():
+    index = CourierSpatialIndex()
+    index.update_location(7, 32.0, 34.8)
+    assert 7 not in index
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        courier_index.clear()
+        yield app
+        courier_index.clear()
+
+
+def test_allocation_uses_index_and_tracks_availability(app):
+    near = make_courier(1, 32.0860, 34.7820, performance_index=50.0)
+    far = make_courier(2, 31.7683, 35.2137, performance_index=100.0)
+    delivery = make_delivery(make_customer(), 'ORD-TEST', 32.0853, 34.7818)
+    db.session.add_all([near, far, delivery])
+    db.session.commit()
+
+    assert AllocationEngine.find_best_courier(delivery) == near
+    assert far.id in courier_index
+
+    near.is_available = False
+    db.session.commit()
+    courier_index.sync(near)
+    assert near.id not in courier_index
+    assert AllocationEngine.find_best_courier(delivery) is None
+
+
+def test_location_geog_follows_lat_lng(app):
+    courier = make_courier(1, 32.0853, 34.7818)
+    db.session.add(courier)
+    db.session.commit()
+    assert courier.location_geog == 'SRID=4326;POINT(34.7818 32.0853)'
+
+    courier.current_location_lat, courier.current_location_lng = 32.1, 34.8
+    db.session.commit()
+    assert courier.location_geog == 'SRID=4326;POINT(34.8 32.1)'
+
+    courier.current_location_lat = None
+    db.session.commit()
+    assert courier.location_geog is None
+
+
+def test_postgis_candidate_query_pushes_radius_and_order_into_db(app):
+    from sqlalchemy.dialects import postgresql
+
+    query = AllocationEngine._postgis_candidate_query(32.0853, 34.7818)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    assert 'ST_DWithin(couriers.location_geog, ST_GeogFromText(' in sql
+    assert 'ORDER BY couriers.location_geog <-> ST_GeogFromText(' in sql
@@ -0,0 +1,80 @@
+import csv
+import io
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db
+from models import Invoice, User
+from routes.earnings_reports import earnings_reports_bp
+from routes.reports import reports_bp
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.csv_stream import csv_response
+from utils.query_stats import assert_max_queries
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(reports_bp, url_prefix='/api/reports')
+        app.register_blueprint(earnings_reports_bp, url_prefix='/api/couriers/earnings')
+
+        admin = User(username='admin', email='a@test.com', phone='0500000000', user_type='admin', password_hash='x')
+        courier = make_courier(1, 32.08, 34.78, full_name='דני כהן')
+        customer = make_customer()
+        customer.full_name = 'ישראל ישראלי'
+        db.session.add_all([admin, courier, customer])
+        for i in range(30):
+            delivery = make_delivery(customer, f'ORD-{i:02d}', 32.08, 34.78, courier=courier, status='delivered',
+                                     created_at=datetime(2026, 3, 1 + i % 28, 9), updated_at=datetime(2026, 3, 1 + i % 28, 10),
+                                     delivery_fee=25.0, distance_km=3.5)
+            delivery.invoice = Invoice(invoice_number=f'INV-{i}', customer=customer, subtotal=100, vat_amount=17,
+                                       total_amount=117)
+            db.session.add(delivery)
+        db.session.commit()
+        app.admin_token = create_access_token(identity=str(admin.id))
+        app.courier_token = create_access_token(identity=str(courier.user_id))
+        yield app
+
+
+def read_csv(response):
+    body = response.get_data()
+    assert body.startswith(b'\xef\xbb\xbf')
+    return list(csv.reader(io.StringIO(body.decode('utf-8-sig'))))
+
+
+def test_orders_export_streams_from_one_query(app):
+    client = app.test_client()
+    # Auth user + roles check + the export query, however many orders there are
+    with assert_max_queries(3):
+        response = client.get('/api/reports/export', query_string={'start_date': '2026-03-01', 'end_date': '2026-03-31'},
+                              headers={'Authorization': f'Bearer {app.admin_token}'})
+        rows = read_csv(response)
+
+    assert response.mimetype == 'text/csv'
+    assert rows[0] == ['Order ID', 'Date', 'Status', 'Customer', 'Courier', 'Pickup', 'Dropoff', 'Price', 'Distance']
+    assert len(rows) == 31
+    assert rows[1] == ['ORD-00', '2026-03-01 09:00', 'delivered', 'ישראל ישראלי', 'דני כהן', 'Tel Aviv', 'Tel Aviv',
+                       '117.00', '3.5']
+
+
+def test_earnings_export_has_addresses_and_total(app):
+    response = app.test_client().get('/api/couriers/earnings/export', query_string={'month': 3, 'year': 2026},
+                                     headers={'Authorization': f'Bearer {app.courier_token}'})
+    rows = read_csv(response)
+
+    assert rows[0][0] == 'ID המשלוח' and len(rows) == 33
+    assert rows[1][2:] == ['Pickup 1, Tel Aviv', 'Dropoff 2, Tel Aviv', '3.5', '', '25.0']
+    assert rows[-1] == ['סה"כ לתשלום', '', '', '', '', '', '750.0']
+    assert "filename*=UTF-8''earnings_" in response.headers['Content-Disposition']
+
+
+def test_csv_response_yields_in_chunks(app):
+    with app.test_request_context():
+        response = csv_response(([i, 'שורה'] for i in range(7)), 'x.csv', chunk_rows=3)
+        chunks = list(response.response)
+    assert len(chunks) == 4  # BOM, 3 + 3 rows, last row
+    assert b''.join(chunks).decode('utf-8-sig').splitlines()[-1] == '6,שורה'
@@ -0,0 +1,135 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db
+from models import Delivery, DailyOrderStats, Invoice, User
+from routes.admin import admin_bp
+from routes.reports import reports_bp
+from routes.stats import stats_bp
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.daily_rollup import DailyRollup, daily_rollup
+from utils.dashboard_cache import dashboard_cache
+from utils.query_stats import assert_max_queries
+
+TODAY = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+YESTERDAY = TODAY - timedelta(days=1)
+LAST_WEEK = TODAY - timedelta(days=7)
+
+
+def add_order(customer, n, created_at, status='pending', courier=None, invoice_status=None, total=100):
+    delivery = make_delivery(customer, f'ORD-{n}', 32.08, 34.78, status=status, courier=courier,
+                             created_at=created_at, updated_at=created_at, delivery_fee=20.0)
+    if invoice_status:
+        delivery.invoice = Invoice(invoice_number=f'INV-{n}', customer=customer, subtotal=total, vat_amount=0,
+                                   total_amount=total, status=invoice_status, issue_date=created_at)
+    db.session.add(delivery)
+    return delivery
+
+
+@pytest.fixture
+def app():
+    daily_rollup.clear()
+    dashboard_cache.clear()
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(stats_bp, url_prefix='/api/stats')
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+        app.register_blueprint(reports_bp, url_prefix='/api/reports')
+
+        admin = User(username='admin', email='a@test.com', phone='0500000000', user_type='admin', password_hash='x')
+        app.courier = make_courier(1, 32.08, 34.78)
+        app.customer = make_customer()
+        db.session.add_all([admin, app.courier, app.customer])
+        add_order(app.customer, 1, TODAY, invoice_status='paid', total=100)
+        add_order(app.customer, 2, TODAY, status='in_transit', courier=app.courier, invoice_status='sent', total=50)
+        add_order(app.customer, 3, YESTERDAY, status='delivered', courier=app.courier, invoice_status='paid', total=70)
+        add_order(app.customer, 4, LAST_WEEK, status='delivered', courier=app.courier, invoice_status='paid', total=30)
+        db.session.commit()
+        app.auth = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+        yield app
+    daily_rollup.clear()
+
+
+def test_ranges_merge_consecutive_days():
+    d = date(2026, 3, 1)
+    days = {d, d + timedelta(days=1), d + timedelta(days=2), d + timedelta(days=5)}
+    assert DailyRollup._ranges(days) == [(d, d + timedelta(days=3)), (d + timedelta(days=5), d + timedelta(days=6))]
+
+
+def test_first_read_builds_rollups(app):
+    by_status = daily_rollup.orders_by_status()
+    assert by_status['delivered'] == {'orders': 2, 'invoiced': 100.0}
+    assert by_status['pending']['orders'] == 1 and by_status['in_transit']['orders'] == 1
+
+    revenue = daily_rollup.revenue_by_day(LAST_WEEK.date(), TODAY.date() + timedelta(days=1), ['paid'])
+    assert revenue == {LAST_WEEK.date(): {'invoices': 1, 'amount': 30.0},
+                       YESTERDAY.date(): {'invoices': 1, 'amount': 70.0},
+                       TODAY.date(): {'invoices': 1, 'amount': 100.0}}
+    assert daily_rollup.courier_totals()[app.courier.id] == {'deliveries': 3, 'delivered': 2, 'fees': 60.0}
+
+
+def test_committed_orm_changes_refresh_their_day(app):
+    daily_rollup.ensure_fresh()
+    delivery = Delivery.query.filter_by(order_number='ORD-4').one()
+    delivery.status = 'cancelled'
+    add_order(app.customer, 5, TODAY)
+    db.session.commit()
+
+    # Only the dirty days are recomputed; no watermark scan within REFRESH_SECONDS
+    assert daily_rollup._dirty == {LAST_WEEK.date(), TODAY.date()}
+    # Per day: 3 aggregates + delete/insert per rollup table; then the read itself
+    with assert_max_queries(2 * 9 + 1) as queries:
+        by_status = daily_rollup.orders_by_status()
+    assert not any('updated_at' in shape for shape in queries.shapes)
+    assert by_status['delivered']['orders'] == 1
+    assert by_status['cancelled']['orders'] == 1
+    assert by_status['pending']['orders'] == 2
+
+
+def test_core_updates_are_caught_by_the_watermark_scan(app):
+    daily_rollup.ensure_fresh()
+    Delivery.query.filter_by(order_number='ORD-1').update({Delivery.status: 'assigned'}, synchronize_session=False)
+    db.session.commit()
+    assert daily_rollup.orders_by_status()['pending']['orders'] == 1  # Not seen yet
+
+    daily_rollup.scanned_at -= DailyRollup.REFRESH_SECONDS + 1
+    by_status = daily_rollup.orders_by_status()
+    assert 'pending' not in by_status and by_status['assigned']['orders'] == 1
+
+
+def test_rebuild_replaces_stale_rows(app):
+    db.session.add(DailyOrderStats(day=date(2020, 1, 1), status='pending', orders=99, invoiced_amount=0))
+    db.session.commit()
+    assert daily_rollup.rebuild() == 8
+    assert db.session.get(DailyOrderStats, (date(2020, 1, 1), 'pending')) is None
+
+
+def test_endpoints_read_the_rollups(app):
+    client = app.test_client()
+    dashboard = client.get('/api/stats/dashboard', headers=app.auth).get_json()
+    assert dashboard == {'orders_today': 2, 'active_orders': 2, 'active_couriers': 1, 'revenue_today': 100.0}
+
+    chart = client.get('/api/stats/revenue', headers=app.auth).get_json()
+    assert [day['amount'] for day in chart] == [0, 0, 0, 0, 0, 70.0, 100.0]
+
+    report = client.get('/api/reports/revenue', query_string={'start_date': str(YESTERDAY.date())},
+                        headers=app.auth).get_json()
+    assert report['total_revenue'] == 220.0
+    assert [(r['date'], r['count']) for r in report['daily_breakdown']] == [(str(YESTERDAY.date()), 1), (str(TODAY.date()), 2)]
+
+    stats = client.get('/api/admin/stats', headers=app.auth).get_json()
+    assert stats['orders'] == {'total': 4, 'pending': 1, 'active': 1, 'delivered': 2}
+    assert stats['revenue'] == {'total': 100.0, 'pending': 150.0}
+
+
+def test_readers_leave_the_request_session_alone(app):
+    daily_rollup.mark_dirty({TODAY.date()})
+    # A handler with uncommitted work reads the rollups mid-request
+    add_order(app.customer, 5, TODAY)
+    assert daily_rollup.orders_by_status()['pending']['orders'] == 1
+
+    db.session.rollback()
+    assert Delivery.query.filter_by(order_number='ORD-5').first() is None
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from extensions import db, socketio
+from models import Courier, Delivery, Invoice
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.daily_rollup import daily_rollup
+from utils.dashboard_cache import dashboard_cache, status_delta
+from utils.query_stats import assert_max_queries
+
+
+@pytest.fixture
+def app(monkeypatch):
+    daily_rollup.clear()
+    dashboard_cache.clear()
+    with flask_app_context() as app:
+        app.emitted = []
+        monkeypatch.setattr(socketio, 'emit', lambda event, data, room=None: app.emitted.append((event, data, room)))
+        app.customer = make_customer()
+        db.session.add_all([app.customer, make_courier(1, 32.08, 34.78), make_courier(2, 32.08, 34.78, is_available=False)])
+        for i in range(3):
+            db.session.add(make_delivery(app.customer, f'ORD-{i}', 32.08, 34.78))
+        db.session.commit()
+        app.emitted.clear()
+        yield app
+    daily_rollup.clear()
+    dashboard_cache.clear()
+
+
+def fresh_counters():
+    dashboard_cache.invalidate()
+    return dashboard_cache.snapshot()
+
+
+def test_status_delta():
+    assert status_delta(None, 'pending', 3) == {'orders_total': 3, 'orders_pending': 3}
+    assert status_delta('pending', 'assigned') == {'orders_pending': -1, 'orders_active': 1}
+    assert status_delta('delivered', None) == {'orders_total': -1, 'orders_delivered': -1}
+    assert status_delta('in_transit', 'picked_up') == {'orders_active': 0}
+
+
+def test_snapshot_is_cached(app):
+    counters = dashboard_cache.snapshot()
+    assert counters['orders_pending'] == 3 and counters['orders_today'] == 3
+    assert counters['couriers_total'] == 2 and counters['couriers_available'] == 1
+    with assert_max_queries(0):
+        assert dashboard_cache.snapshot() == counters
+    assert dashboard_cache.stats == {'hits': 1, 'builds': 1}
+
+
+def test_committed_changes_are_applied_and_pushed(app):
+    dashboard_cache.snapshot()
+    delivery = Delivery.query.filter_by(order_number='ORD-0').one()
+    delivery.status = 'assigned'
+    db.session.add(make_delivery(app.customer, 'ORD-9', 32.08, 34.78))
+    Courier.query.filter_by(full_name='Courier 2').one().is_available = True
+    db.session.commit()
+
+    assert app.emitted == [('dashboard_delta', {
+        'delta': {'orders_active': 1, 'orders_total': 1, 'orders_today': 1, 'couriers_available': 1},
+        'stale': False
+    }, 'admin_room')]
+    with assert_max_queries(0):
+        cached = dashboard_cache.snapshot()
+    assert cached == fresh_counters()
+
+
+def test_rolled_back_changes_are_not_published(app):
+    Delivery.query.filter_by(order_number='ORD-0').one().status = 'assigned'
+    db.session.flush()
+    db.session.rollback()
+    assert app.emitted == []
+
+
+def test_invoice_changes_drop_the_snapshot(app):
+    dashboard_cache.snapshot()
+    delivery = Delivery.query.filter_by(order_number='ORD-1').one()
+    db.session.add(Invoice(invoice_number='INV-1', customer=app.customer, delivery=delivery, subtotal=100,
+                           vat_amount=17, total_amount=117, issue_date=datetime.utcnow()))
+    db.session.commit()
+
+    assert app.emitted[-1][1]['stale'] is True
+    assert dashboard_cache.snapshot()['revenue_pending'] == 117.0
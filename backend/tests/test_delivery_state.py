@@ -0,0 +1,210 @@
+import base64
+from pathlib import Path
+
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db, socketio
+from models import Courier, Delivery, DeliveryStatus, User
+from routes.admin import admin_bp
+from routes.couriers import couriers_bp
+from routes.orders import orders_bp
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils import audit
+from utils.daily_rollup import daily_rollup
+from utils.dashboard_cache import dashboard_cache
+from utils.delivery_state import DeliveryStateMachine, TransitionError, delivery_state
+from utils.identity import identity_cache
+from utils.query_stats import assert_max_queries
+
+
+@pytest.fixture
+def app(monkeypatch):
+    dashboard_cache.clear()
+    daily_rollup.clear()
+    identity_cache.clear()
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+        app.register_blueprint(couriers_bp, url_prefix='/api/couriers')
+        app.register_blueprint(orders_bp, url_prefix='/api/orders')
+
+        admin = User(username='admin', email='a@test.com', phone='0500000000', user_type='admin', password_hash='x')
+        app.courier, app.other = make_courier(1, 32.08, 34.78), make_courier(2, 32.09, 34.79)
+        customer = make_customer()
+        app.delivery = make_delivery(customer, 'ORD-1', 32.08, 34.78, status='assigned', courier=app.courier)
+        db.session.add_all([admin, app.other, app.delivery])
+        db.session.commit()
+        app.tokens = {name: create_access_token(identity=str(user_id)) for name, user_id in
+                      (('admin', admin.id), ('courier', app.courier.user_id), ('other', app.other.user_id))}
+
+        app.emitted, app.audited = [], []
+        monkeypatch.setattr(socketio, 'emit', lambda event, data, room=None: app.emitted.append((event, data, room)))
+        monkeypatch.setattr(audit, 'log_audit', lambda action, **kwargs: app.audited.append(action))
+        yield app
+    dashboard_cache.clear()
+    daily_rollup.clear()
+    identity_cache.clear()
+
+
+def post(app, who, url, body, method='post'):
+    return app.test_client().open(url, method=method, json=body,
+                                   headers={'Authorization': f'Bearer {app.tokens[who]}'})
+
+
+def history(delivery_id):
+    return [(s.status, s.notes) for s in DeliveryStatus.query.filter_by(delivery_id=delivery_id).order_by(DeliveryStatus.id)]
+
+
+def test_transition_is_one_update_and_one_history_insert(app):
+    delivery_id, courier_id = app.delivery.id, app.courier.id
+    with assert_max_queries(2) as queries:
+        transition = delivery_state.transition(delivery_id, 'picked_up', expected='assigned', owned_by=courier_id)
+    assert [shape.split()[0] for shape in queries.shapes] == ['UPDATE', 'INSERT']
+    assert app.emitted == []  # Nothing is published before commit
+    db.session.commit()
+
+    assert (transition.old_status, transition.new_status, transition.courier_id) == ('assigned', 'picked_up', courier_id)
+    delivery = db.session.get(Delivery, app.delivery.id)
+    assert delivery.status == 'picked_up' and delivery.actual_pickup_time == transition.at
+    assert history(delivery.id) == [('picked_up', None)]
+    assert [(event, room) for event, data, room in app.emitted] == [
+        ('order_update', 'admin_room'), ('delivery_status_update', f'courier_{courier_id}'),
+        ('order_status_changed', f'customer_{delivery.customer_id}')]
+
+
+def test_rejected_transitions_leave_the_row_alone(app):
+    delivery_id, other_id = app.delivery.id, app.other.id
+    cases = [
+        (dict(new_status='delivered'), 400, 'Cannot change status from assigned to delivered'),
+        (dict(new_status='picked_up', owned_by=other_id), 403, 'Not assigned to you'),
+        (dict(new_status='assigned', expected='pending'), 409, f'Delivery {delivery_id} is assigned, not pending'),
+        (dict(new_status='shipped'), 400, "Unknown status 'shipped'"),
+    ]
+    for kwargs, status_code, message in cases:
+        with pytest.raises(TransitionError) as error:
+            delivery_state.transition(delivery_id, **kwargs)
+        assert (error.value.status_code, str(error.value)) == (status_code, message)
+    with pytest.raises(TransitionError) as error:
+        delivery_state.transition(9999, 'picked_up')
+    assert error.value.status_code == 404
+
+    db.session.commit()
+    assert db.session.get(Delivery, delivery_id).status == 'assigned' and history(delivery_id) == []
+    assert app.emitted == []
+
+
+def test_rolled_back_transition_is_not_published(app):
+    delivery_state.transition(app.delivery.id, 'cancelled')
+    db.session.rollback()
+    db.session.commit()
+    assert app.emitted == [] and db.session.get(Delivery, app.delivery.id).status == 'assigned'
+
+
+def test_dashboard_counters_follow_transitions(app):
+    before = dashboard_cache.snapshot()
+    delivery_state.transition(app.delivery.id, 'pending', courier_id=None)
+    db.session.commit()
+    after = dashboard_cache.snapshot()
+    assert (after['orders_pending'] - before['orders_pending'], after['orders_active'] - before['orders_active']) == (1, -1)
+    assert db.session.get(Delivery, app.delivery.id).courier_id is None
+
+
+def test_courier_status_route_walks_the_state_machine(app):
+    url = f'/api/couriers/orders/{app.delivery.id}/status'
+    assert post(app, 'other', url, {'status': 'picked_up'}).status_code == 403
+    # A refused transition leaves no proof-of-delivery files behind
+    pod_dir = Path(__file__).parent.parent / 'uploads' / 'pod'
+    signature = 'data:image/png;base64,' + base64.b64encode(b'signature').decode()
+    assert post(app, 'courier', url, {'status': 'delivered', 'pod_signature': signature}).status_code == 400
+    assert list(pod_dir.glob(f'sig_{app.delivery.id}_*')) == []
+    assert post(app, 'courier', url, {'status': 'picked_up'}).get_json() == {'success': True, 'status': 'picked_up'}
+    response = post(app, 'courier', url, {'status': 'delivered', 'pod_recipient_id': '123456789'})
+    assert response.status_code == 200
+
+    delivery = db.session.get(Delivery, app.delivery.id)
+    db.session.refresh(delivery)
+    assert delivery.status == 'delivered' and delivery.pod_recipient_id == '123456789'
+    assert delivery.actual_delivery_time is not None and delivery.delivered_at == delivery.actual_delivery_time
+    assert [status for status, _ in history(delivery.id)] == ['picked_up', 'delivered']
+    assert app.audited == ['DELIVERY_COMPLETED_SIGNED']
+
+
+def test_moving_back_to_pending_releases_the_courier(app):
+    url = f'/api/couriers/orders/{app.delivery.id}/status'
+    assert post(app, 'courier', url, {'status': 'pending'}).get_json() == {'success': True, 'status': 'pending'}
+    delivery = db.session.get(Delivery, app.delivery.id)
+    db.session.refresh(delivery)
+    assert (delivery.status, delivery.courier_id) == ('pending', None)
+
+    # An admin reopening a delivered order takes it off the courier's count as well
+    courier_id = app.courier.id
+    delivery_state.transition(delivery.id, 'assigned', courier_id=courier_id)
+    db.session.commit()
+    admin_url = f'/api/admin/orders/{delivery.id}/status'
+    assert post(app, 'admin', admin_url, {'status': 'delivered'}, method='put').status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Courier, courier_id).total_deliveries == 1
+    assert post(app, 'admin', admin_url, {'status': 'pending'}, method='put').status_code == 200
+    db.session.expire_all()
+    assert (delivery.status, delivery.courier_id) == ('pending', None)
+    assert db.session.get(Courier, courier_id).total_deliveries == 0
+
+
+def test_reject_returns_the_order_to_the_pool(app):
+    url = f'/api/couriers/orders/{app.delivery.id}/reject'
+    assert post(app, 'other', url, {}).status_code == 403
+    response = post(app, 'courier', url, {})
+    assert response.status_code == 200 and response.get_json() == {'success': True}
+
+    delivery = db.session.get(Delivery, app.delivery.id)
+    db.session.refresh(delivery)
+    assert (delivery.status, delivery.courier_id) == ('pending', None)
+    offers = [data for event, data, room in app.emitted if event == 'new_order_offer']
+    assert offers == [{'order': {'id': delivery.id, 'order_number': 'ORD-1', 'pickup_address': 'Pickup 1, Tel Aviv',
+                                 'delivery_address': 'Dropoff 2, Tel Aviv'}}]
+    # The state machine's own order_update is the only one
+    assert [data for event, data, room in app.emitted if event == 'order_update'] == [
+        {'id': delivery.id, 'status': 'pending', 'courier_id': None}]
+
+
+def test_assign_conflicts_instead_of_overwriting(app):
+    delivery_state.transition(app.delivery.id, 'picked_up')
+    db.session.commit()
+    response = post(app, 'admin', f'/api/orders/{app.delivery.id}/assign', {'courier_id': app.other.id})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Cannot change status from picked_up to assigned'}
+    assert db.session.get(Delivery, app.delivery.id).courier_id == app.courier.id
+
+
+def test_admin_corrections_override_the_transition_table(app):
+    url = f'/api/admin/orders/{app.delivery.id}/status'
+    courier_id = app.courier.id
+    delivery_state.transition(app.delivery.id, 'in_transit')
+    db.session.commit()
+
+    # The owning courier is bound by the table, an admin isn't
+    assert post(app, 'courier', url, {'status': 'cancelled'}, method='put').status_code == 400
+    response = post(app, 'admin', url, {'status': 'delivered'}, method='put')
+    assert response.get_json()['message'] == 'Status updated from in_transit to delivered'
+    response = post(app, 'admin', url, {'status': 'failed', 'notes': 'recipient disputes delivery'}, method='put')
+    assert response.status_code == 200
+
+    delivery = db.session.get(Delivery, app.delivery.id)
+    db.session.refresh(delivery)
+    assert delivery.status == 'failed'
+    assert history(delivery.id)[-2:] == [('delivered', ''), ('failed', 'recipient disputes delivery')]
+    # The delivered -> failed correction takes the delivery back off the courier's count
+    assert db.session.get(Courier, courier_id).total_deliveries == 0
+
+    # Still a conditional update: a stale expected status conflicts
+    with pytest.raises(TransitionError) as error:
+        delivery_state.transition(delivery.id, 'pending', expected='delivered', force=True)
+    assert error.value.status_code == 409
+
+
+def test_every_status_has_a_transition_table_entry():
+    statuses = set(Delivery.__table__.c.status.type.enums)
+    assert set(DeliveryStateMachine.TRANSITIONS) == statuses
+    assert set().union(*DeliveryStateMachine.TRANSITIONS.values()) <= statuses
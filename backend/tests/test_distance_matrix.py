@@ -0,0 +1,137 @@
+import pytest
+
+from extensions import db
+from scripts.fake_osrm import serve_osrm
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils import route_cache as route_cache_module
+from utils.allocation_engine import AllocationEngine
+from utils.batch_allocation import BatchAllocationEngine
+from utils.courier_index import courier_index
+from utils.geo_utils import get_distance_matrix
+from utils.route_cache import RouteCache
+
+COURIERS = [(32.08, 34.78), (32.06, 34.82), (32.12, 34.85), (31.95, 34.90)]
+PICKUPS = [(32.07, 34.79), (32.09, 34.88)]
+
+
+def as_points(coords):
+    return [{'lat': lat, 'lon': lng} for lat, lng in coords]
+
+
+@pytest.fixture
+def osrm(monkeypatch):
+    with serve_osrm() as (url, fake):
+        cache = RouteCache(osrm_url=url)
+        monkeypatch.setattr(route_cache_module, 'route_cache', cache)
+        yield cache, fake
+
+
+def table_requests(fake):
+    return [r for r in fake.requests if r.startswith('/table/')]
+
+
+def test_matrix_is_one_table_call_and_is_reused(osrm):
+    cache, fake = osrm
+    matrix = get_distance_matrix(as_points(COURIERS), as_points(PICKUPS))
+
+    assert len(matrix) == 4 and all(len(row) == 2 for row in matrix)
+    assert all(cell['distance_km'] > 0 and cell['duration_min'] > 0 for row in matrix for cell in row)
+    assert len(table_requests(fake)) == 1
+
+    # A subset (and a reordered one) is served entirely from the cache
+    assert get_distance_matrix(as_points(COURIERS[2:]), as_points(PICKUPS[::-1])) == [row[::-1] for row in matrix[2:]]
+    assert len(fake.requests) == 1
+
+
+def test_matrix_matches_single_routes(osrm):
+    cache, fake = osrm
+    matrix = cache.get_matrix(COURIERS, PICKUPS)
+    cold = RouteCache(osrm_url=cache.osrm_url)
+    for i, src in enumerate(COURIERS):
+        for j, dst in enumerate(PICKUPS):
+            assert cold.get_route(*src, *dst) == pytest.approx(matrix[i][j])
+
+
+def test_large_matrices_are_chunked_to_the_table_limit(osrm, monkeypatch):
+    cache, fake = osrm
+    monkeypatch.setattr(RouteCache, 'MAX_TABLE_LOCATIONS', 4)
+    monkeypatch.setattr(RouteCache, 'MAX_TABLE_DESTINATIONS', 1)
+
+    matrix = cache.get_matrix(COURIERS, PICKUPS)
+    assert all(cell is not None for row in matrix for cell in row)
+    assert len(table_requests(fake)) == 4  # 2 source chunks x 2 destination chunks
+
+
+def test_matrix_is_persisted_for_other_processes(osrm):
+    cache, fake = osrm
+    with flask_app_context():
+        cache.get_matrix(COURIERS, PICKUPS)
+        cold = RouteCache(osrm_url=cache.osrm_url)
+        assert cold.get_matrix(COURIERS, PICKUPS) == cache.get_matrix(COURIERS, PICKUPS)
+        assert cold.stats['persistent_hits'] == len(COURIERS) * len(PICKUPS)
+        assert len(fake.requests) == 1
+
+
+# South of the fake river, between two bridges
+PICKUP = (32.095, 34.85)
+ACROSS_RIVER = (32.110, 34.85)   # ~1.7km straight line, long detour via a bridge
+SAME_BANK = (32.095, 34.875)     # ~2.4km straight line and by road
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        courier_index.clear()
+        yield app
+        courier_index.clear()
+
+
+def test_top_candidates_are_reranked_by_road_eta(app, osrm, monkeypatch):
+    across = make_courier(1, *ACROSS_RIVER)
+    same_bank = make_courier(2, *SAME_BANK)
+    delivery = make_delivery(make_customer(), 'ORD-ETA', *PICKUP)
+    db.session.add_all([across, same_bank, delivery])
+    db.session.commit()
+
+    assert AllocationEngine.find_best_courier(delivery) == same_bank
+
+    ranked = AllocationEngine.score_candidates([across, same_bank], delivery, *PICKUP)
+    [reranked] = AllocationEngine.rerank_by_eta([ranked], [PICKUP])
+    assert ranked[0]['courier'] == across
+    assert reranked[0]['courier'] == same_bank
+    assert reranked[1]['road_km'] > 5 * reranked[1]['distance']
+
+    # Without OSRM configured allocation stays on straight-line distance
+    monkeypatch.delenv('OSRM_URL', raising=False)
+    monkeypatch.setattr(route_cache_module, 'route_cache', RouteCache())
+    assert AllocationEngine.find_best_courier(delivery) == across
+
+
+def test_batch_allocation_uses_one_matrix_for_all_pickups(app, osrm):
+    cache, fake = osrm
+    couriers = [make_courier(1, *ACROSS_RIVER), make_courier(2, *SAME_BANK), make_courier(3, 32.11, 34.87)]
+    deliveries = [make_delivery(make_customer(0), 'ORD-B1', *PICKUP),
+                  make_delivery(make_customer(1), 'ORD-B2', 32.112, 34.852)]
+    db.session.add_all(couriers + deliveries)
+    db.session.commit()
+
+    assigned = dict((d.order_number, c.id) for d, c in BatchAllocationEngine.allocate_pending())
+    assert assigned['ORD-B1'] == couriers[1].id
+    assert assigned['ORD-B2'] in (couriers[0].id, couriers[2].id)
+    assert len(table_requests(fake)) == 1
+
+
+def test_batch_allocation_reranks_its_whole_short_list(app, osrm, monkeypatch):
+    # Single-order allocation only re-scores its head; the batch compares whole rows
+    monkeypatch.setattr(AllocationEngine, 'ETA_RERANK_K', 1)
+    reranked = []
+    rerank = AllocationEngine.rerank_by_eta
+    monkeypatch.setattr(AllocationEngine, 'rerank_by_eta',
+                        lambda *args, **kwargs: reranked.extend(rerank(*args, **kwargs)) or reranked)
+    db.session.add_all([make_courier(1, *ACROSS_RIVER), make_courier(2, *SAME_BANK),
+                        make_delivery(make_customer(), 'ORD-B1', *PICKUP)])
+    db.session.commit()
+
+    BatchAllocationEngine.allocate_pending()
+    [row] = reranked
+    assert len(row) == 2 and all('eta_min' in entry for entry in row)
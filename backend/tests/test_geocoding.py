@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+
+from extensions import db
+from models import Address, GeocodeCacheEntry
+from tests.flask_factories import flask_app_context
+from utils.geocoding import GeocodingService, TokenBucket, normalize_address
+
+
+class FakeNominatim:
+    """Stands in for requests.Session; answers /search from a dict of normalized queries."""
+
+    def __init__(self, places, delay=0.0):
+        self.places = places
+        self.delay = delay
+        self.queries = []
+        self.headers = {}
+
+    def get(self, url, params=None, timeout=None):
+        self.queries.append(params['q'])
+        time.sleep(self.delay)
+        coords = self.places.get(normalize_address(params['q']))
+        return FakeResponse([{'lat': str(coords[0]), 'lon': str(coords[1])}] if coords else [])
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+HERZL = (32.0636, 34.7722)
+
+
+def make_service(delay=0.0, rate=100.0, burst=10):
+    service = GeocodingService(base_url='http://nominatim.test', rate_per_sec=rate, burst=burst)
+    service.http = FakeNominatim({normalize_address('הרצל 10, תל אביב'): HERZL}, delay)
+    return service
+
+
+def test_normalization_folds_spelling_variants():
+    assert normalize_address("רח' הרצל 10, תל-אביב") == normalize_address('הרצל 10 תל אביב')
+    assert normalize_address('רְחוֹב הֶרְצֵל 10') == normalize_address('הרצל 10')
+    assert normalize_address('  Herzl St. 10,  Tel Aviv ') == 'herzl 10 tel aviv'
+
+
+def test_token_bucket_never_blocks():
+    bucket = TokenBucket(rate_per_sec=1, capacity=2)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    started = time.monotonic()
+    assert not bucket.try_acquire()
+    assert time.monotonic() - started < 0.05
+    assert 0 < bucket.wait_time() <= 1
+
+
+def test_equivalent_addresses_share_a_cache_entry():
+    service = make_service()
+    assert service.geocode('הרצל 10, תל אביב') == HERZL
+    assert service.geocode("רח' הרצל 10 תל-אביב") == HERZL
+    assert len(service.http.queries) == 1
+
+
+def test_no_match_is_cached_but_errors_are_not():
+    service = make_service()
+    assert service.geocode('nowhere 1') is None
+    assert service.geocode('nowhere 1') is None
+    assert len(service.http.queries) == 1
+
+    service.http.get = lambda *a, **kw: (_ for _ in ()).throw(ConnectionError('down'))
+    assert service.geocode('somewhere 2') is None
+    assert service.stats['errors'] == 1
+    assert service.local.get(service.cache_key(normalize_address('somewhere 2'))) is None
+
+
+def test_identical_lookups_in_flight_are_coalesced():
+    service = make_service(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.geocode('הרצל 10, תל אביב')))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [HERZL] * 5
+    assert len(service.http.queries) == 1
+    assert service.stats['coalesced'] == 4
+
+
+def test_throttled_lookup_returns_immediately_and_is_queued():
+    service = make_service(rate=5, burst=1)
+    service.http.places[normalize_address('אלנבי 1 תל אביב')] = (32.07, 34.77)
+    assert service.geocode('הרצל 10, תל אביב') == HERZL
+
+    started = time.monotonic()
+    assert service.geocode('אלנבי 1 תל אביב') is None
+    assert time.monotonic() - started < 0.05
+    assert service.stats['throttled'] == 1
+
+    deadline = time.monotonic() + 3
+    while service.local.get(service.cache_key(normalize_address('אלנבי 1 תל אביב'))) is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert service.geocode('אלנבי 1 תל אביב') == (32.07, 34.77)
+
+
+def test_enqueue_racing_the_worker_is_not_lost():
+    service = make_service()
+    service.http.places[normalize_address('אלנבי 1 תל אביב')] = (32.07, 34.77)
+    done = threading.Event()
+
+    class RacingWakeup(threading.Event):
+        """Lands a second enqueue right after the worker found the queue empty"""
+        raced = False
+
+        def race(self):
+            if not self.raced and service.local.get(service.cache_key(normalize_address('הרצל 10, תל אביב'))):
+                self.raced = True
+                service.enqueue('אלנבי 1 תל אביב', callback=lambda result: done.set())
+
+        def clear(self):
+            self.race()
+            super().clear()
+
+        def wait(self, timeout=None):
+            self.race()
+            return super().wait(timeout)
+
+    service._wakeup = RacingWakeup()
+    service.enqueue('הרצל 10, תל אביב')
+    assert done.wait(timeout=3)
+
+
+def test_backfill_geocodes_missing_rows_once_per_address(tmp_path):
+    service = make_service()
+    with flask_app_context(f"sqlite:///{tmp_path / 'geo.db'}"):
+        db.session.add_all([
+            Address(street='הרצל', building_number='10', city='תל אביב'),
+            Address(street="רח' הרצל", building_number='10', city='תל-אביב'),
+            Address(street='Nowhere', building_number='1', city='Atlantis'),
+            Address(street='Known', building_number='2', city='Haifa', latitude=32.8, longitude=34.99),
+        ])
+        db.session.commit()
+
+        assert service.backfill_addresses() == (2, 2)
+        assert [(a.latitude, a.longitude) for a in Address.query.order_by(Address.id)] == [
+            HERZL, HERZL, (None, None), (32.8, 34.99)
+        ]
+        # Persistent tier: a fresh process doesn't ask the provider again
+        assert GeocodeCacheEntry.query.count() == 2
+        cold = make_service()
+        assert cold.geocode('הרצל 10 תל אביב') == HERZL
+        assert cold.http.queries == []
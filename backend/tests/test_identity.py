@@ -0,0 +1,102 @@
+import pytest
+from flask import jsonify
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db
+from models import User
+from routes.admin import admin_bp
+from tests.flask_factories import flask_app_context
+from utils.decorators import role_required, token_required
+from utils.identity import _token_key, current_identity, identity_cache
+from utils.query_stats import assert_max_queries
+
+
+@pytest.fixture
+def app():
+    identity_cache.clear()
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+
+        @app.route('/api/me')
+        @token_required
+        @role_required(['admin', 'courier'])
+        def me(current_user):
+            return jsonify({'id': current_user.id, 'identity': current_identity()._asdict()})
+
+        admin = User(username='admin', email='a@test.com', phone='0500000000', user_type='admin', password_hash='x')
+        courier = User(username='courier', email='c@test.com', phone='0500000001', user_type='courier', password_hash='x')
+        db.session.add_all([admin, courier])
+        db.session.commit()
+        app.admin_id, app.courier_id = admin.id, courier.id
+        app.admin_token = create_access_token(identity=str(admin.id))
+        app.courier_token = create_access_token(identity=str(courier.id))
+        yield app
+    identity_cache.clear()
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_user_is_loaded_once_per_request(app):
+    client = app.test_client()
+    with assert_max_queries(1):
+        body = client.get('/api/me', headers=auth(app.courier_token)).get_json()
+    assert body == {'id': app.courier_id, 'identity': {'user_id': app.courier_id, 'user_type': 'courier',
+                                                       'admin_role': None, 'is_active': True}}
+
+
+def test_identity_is_cached_per_token(app):
+    app.test_client().get('/api/me', headers=auth(app.courier_token))
+    with app.test_request_context(headers=auth(app.courier_token)):
+        with assert_max_queries(0):
+            assert current_identity().user_type == 'courier'
+    with app.test_request_context():
+        assert current_identity() is None
+
+
+def test_ban_invalidates_and_blocks(app):
+    client = app.test_client()
+    client.get('/api/me', headers=auth(app.courier_token))
+
+    response = client.post(f'/api/admin/users/{app.courier_id}/ban', json={'ban': True}, headers=auth(app.admin_token))
+    assert response.status_code == 200
+
+    with app.test_request_context(headers=auth(app.courier_token)):
+        with assert_max_queries(1):
+            assert current_identity().is_active is False
+    response = client.get('/api/me', headers=auth(app.courier_token))
+    assert response.status_code == 403 and response.get_json()['error'] == 'USER_INACTIVE'
+
+
+def test_invalidate_during_the_user_load_is_not_lost(app, monkeypatch):
+    load = db.session.get
+
+    def load_then_ban(model, ident):
+        user = load(model, ident)
+        identity_cache.invalidate(app.courier_id)  # Committed by another request meanwhile
+        return user
+
+    with app.test_request_context(headers=auth(app.courier_token)):
+        monkeypatch.setattr(db.session, 'get', load_then_ban)
+        assert current_identity().is_active is True
+        monkeypatch.undo()
+        # Cached under the version read before the load: already stale
+        assert identity_cache.get(_token_key()) is None
+
+
+def test_rolled_back_changes_keep_the_cache(app):
+    app.test_client().get('/api/me', headers=auth(app.courier_token))
+    db.session.get(User, app.courier_id).user_type = 'admin'
+    db.session.flush()
+    db.session.rollback()
+    with app.test_request_context(headers=auth(app.courier_token)):
+        with assert_max_queries(0):
+            assert current_identity().user_type == 'courier'
+
+
+def test_bad_token_is_rejected(app):
+    response = app.test_client().get('/api/me', headers=auth('not-a-token'))
+    assert response.status_code == 401
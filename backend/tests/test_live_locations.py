@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from extensions import db
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.allocation_engine import AllocationEngine
+from utils.live_locations import GEO_KEY, LAST_SEEN_KEY, LiveLocationStore, set_live_location_store
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def store():
+    store = LiveLocationStore(fakeredis.FakeRedis(decode_responses=True))
+    yield store
+    set_live_location_store(None)
+
+
+def test_search_returns_nearby_couriers_by_distance(store):
+    store.update(1, 32.1000, 34.8000)
+    store.update(2, 32.0853, 34.7818)
+    store.update(3, 31.7683, 35.2137)  # Jerusalem
+
+    hits = store.search(32.0853, 34.7818, 10)
+    assert [h[0] for h in hits] == [2, 1]
+    assert hits[0][2] == pytest.approx(32.0853, abs=1e-4)
+
+
+def test_positions_written_by_go_engine_are_visible(store):
+    # Same commands realtime-engine/pkg/geo/handler.go issues
+    store.client.geoadd(GEO_KEY, (34.7818, 32.0853, '42'))
+    store.client.set(LAST_SEEN_KEY.format('42'), int(time.time()), ex=60)
+
+    assert [h[0] for h in store.search(32.0853, 34.7818, 1)] == [42]
+    assert store.get(42) == pytest.approx((32.0853, 34.7818), abs=1e-4)
+
+
+def test_expired_last_seen_drops_courier(store):
+    store.update(1, 32.0853, 34.7818)
+    store.update(2, 32.0860, 34.7820)
+    store.client.delete(LAST_SEEN_KEY.format(1))  # TTL expired
+
+    assert [h[0] for h in store.search(32.0853, 34.7818, 5)] == [2]
+    assert store.client.zscore(GEO_KEY, '1') is None
+    assert store.get(1) is None
+
+
+def test_prune_stale(store):
+    for i in range(10):
+        store.update(i, 32.08, 34.78)
+    for i in range(0, 10, 2):
+        store.client.delete(LAST_SEEN_KEY.format(i))
+
+    assert store.prune_stale(batch_size=3) == 5
+    assert store.client.zcard(GEO_KEY) == 5
+
+
+def test_allocation_uses_live_positions(store):
+    with flask_app_context():
+        # DB positions are stale: "far" is recorded next to the pickup, "near" far away
+        near = make_courier(1, 31.7683, 35.2137)
+        far = make_courier(2, 32.0853, 34.7818)
+        offline = make_courier(3, 32.0853, 34.7818)
+        delivery = make_delivery(make_customer(), 'ORD-LIVE', 32.0853, 34.7818)
+        db.session.add_all([near, far, offline, delivery])
+        db.session.commit()
+
+        store.update(near.id, 32.0855, 34.7819)
+        store.update(far.id, 32.2500, 34.9000)
+        set_live_location_store(store)
+
+        assert AllocationEngine.find_best_courier(delivery) == near
+        # Live position is used for scoring but never written back
+        assert not db.session.dirty
+
+
+def test_batch_candidates_come_from_one_search(store, monkeypatch):
+    with flask_app_context():
+        tel_aviv, jerusalem, between = make_courier(1, 0, 0), make_courier(2, 0, 0), make_courier(3, 0, 0)
+        db.session.add_all([tel_aviv, jerusalem, between])
+        db.session.commit()
+
+        store.update(tel_aviv.id, 32.0853, 34.7818)
+        store.update(jerusalem.id, 31.7683, 35.2137)
+        store.update(between.id, 31.6500, 34.8500)  # Inside the search circle, >30km from both pickups
+        set_live_location_store(store)
+        searches = []
+        search = store.search
+        monkeypatch.setattr(store, 'search', lambda *args: searches.append(args) or search(*args))
+
+        candidates = AllocationEngine._get_candidates_near([(32.0860, 34.7820), (31.7690, 35.2140)])
+        assert len(searches) == 1
+        assert {c.id for c in candidates} == {tel_aviv.id, jerusalem.id}
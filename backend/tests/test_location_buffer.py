@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models import Courier, DeliveryTracking
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.location_buffer import LocationWriteBuffer, write_courier_locations
+
+
+def test_pings_are_coalesced_last_write_wins():
+    written = []
+    buffer = LocationWriteBuffer(lambda positions, tracking: written.append((positions, tracking)))
+    buffer.add(1, 32.0, 34.0)
+    buffer.add(1, 32.1, 34.1)
+    buffer.add(2, 31.0, 35.0)
+    assert buffer.stats()['buffer_depth'] == 2
+
+    assert buffer.flush() == 2
+    assert written == [({1: (32.1, 34.1), 2: (31.0, 35.0)}, [])]
+    assert buffer.flush() == 0
+
+    stats = buffer.stats()
+    assert stats['pings_received'] == 3
+    assert stats['pings_coalesced'] == 1
+    assert stats['buffer_depth'] == 0
+    assert stats['flushes'] == 1
+
+
+def test_failed_flush_requeues_without_overwriting_newer_pings():
+    def failing_writer(positions, tracking):
+        # A ping that arrives while the flush is in flight
+        buffer.add(1, 33.0, 35.0)
+        raise RuntimeError('db down')
+
+    buffer = LocationWriteBuffer(failing_writer)
+    buffer.add(1, 32.0, 34.0)
+    buffer.add(2, 31.0, 35.0, delivery_id=7)
+    assert buffer.flush() == 0
+
+    written = []
+    buffer.writer = lambda positions, tracking: written.append((positions, tracking))
+    buffer.flush()
+    positions, tracking = written[0]
+    assert positions == {1: (33.0, 35.0), 2: (31.0, 35.0)}
+    assert [t['delivery_id'] for t in tracking] == [7]
+    assert buffer.stats()['flush_errors'] == 1
+
+
+def test_tracking_backlog_is_bounded():
+    buffer = LocationWriteBuffer(lambda p, t: None, max_tracking_points=3)
+    for i in range(5):
+        buffer.add(1, 32.0 + i, 34.0, delivery_id=1)
+    stats = buffer.stats()
+    assert stats['pending_tracking'] == 3
+    assert stats['tracking_dropped'] == 2
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        yield app
+
+
+def test_flush_issues_one_bulk_update(app):
+    couriers = [make_courier(i, 32.0, 34.0) for i in range(1, 4)]
+    delivery = make_delivery(make_customer(), 'ORD-GPS', 32.0, 34.0, courier=couriers[0], status='in_transit')
+    other = make_delivery(make_customer(1), 'ORD-OTHER', 32.0, 34.0, courier=couriers[1], status='in_transit')
+    db.session.add_all(couriers + [delivery, other])
+    db.session.commit()
+
+    buffer = LocationWriteBuffer(write_courier_locations)
+    for step in range(10):
+        for c in couriers:
+            buffer.add(c.id, 32.0 + step * 0.001, 34.0)
+    buffer.add(couriers[0].id, 32.5, 34.5, delivery_id=delivery.id, speed=20.0)
+    buffer.add(couriers[2].id, 32.5, 34.5, delivery_id=other.id)  # Not this courier's delivery
+    buffer.add(999, 32.5, 34.5)  # Deleted courier is ignored
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        buffer.flush()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert sum(s.startswith('UPDATE couriers') for s in statements) == 1
+    assert sum(s.startswith('INSERT INTO delivery_tracking') for s in statements) == 1
+
+    db.session.expire_all()
+    first = db.session.get(Courier, couriers[0].id)
+    assert (first.current_location_lat, first.current_location_lng) == (32.5, 34.5)
+    assert first.location_geog == 'SRID=4326;POINT(34.5 32.5)'
+    assert db.session.get(Courier, couriers[1].id).current_location_lat == pytest.approx(32.009)
+
+    points = DeliveryTracking.query.all()
+    assert [(p.delivery_id, p.courier_id, p.speed) for p in points] == [(delivery.id, couriers[0].id, 20.0)]
@@ -0,0 +1,97 @@
+import os
+import random
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db, socketio
+from models import Delivery, DeliveryStatus
+from routes.couriers import couriers_bp
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.daily_rollup import daily_rollup
+from utils.dashboard_cache import dashboard_cache
+from utils.identity import identity_cache
+
+COURIERS = 40
+ORDERS = 50
+WORKERS = 32
+
+
+def database_urls():
+    yield pytest.param('sqlite', id='sqlite')
+    yield pytest.param('postgresql', id='postgresql', marks=pytest.mark.skipif(
+        not os.environ.get('TEST_POSTGRES_URL'), reason='TEST_POSTGRES_URL not set'))
+
+
+@pytest.fixture(params=list(database_urls()))
+def app(request, tmp_path, monkeypatch):
+    if request.param == 'sqlite':
+        # A file DB, so every worker thread gets its own connection and writers really contend
+        uri = f'sqlite:///{tmp_path / "claims.db"}?timeout=30'
+    else:
+        uri = os.environ['TEST_POSTGRES_URL']
+    dashboard_cache.clear()
+    daily_rollup.clear()
+    identity_cache.clear()
+    monkeypatch.setattr(socketio, 'emit', lambda *args, **kwargs: None)
+    with flask_app_context(uri) as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(couriers_bp, url_prefix='/api/couriers')
+
+        couriers = [make_courier(n, 32.08, 34.78) for n in range(COURIERS)]
+        customer = make_customer()
+        deliveries = [make_delivery(customer, f'ORD-{n}', 32.08, 34.78) for n in range(ORDERS)]
+        db.session.add_all(couriers + deliveries)
+        db.session.commit()
+        app.couriers = {c.id: create_access_token(identity=str(c.user_id)) for c in couriers}
+        app.order_ids = [d.id for d in deliveries]
+        db.session.remove()
+        yield app
+    dashboard_cache.clear()
+    daily_rollup.clear()
+    identity_cache.clear()
+
+
+def accept(app, courier_id, order_id):
+    response = app.test_client().post(f'/api/couriers/orders/{order_id}/accept',
+                                      headers={'Authorization': f'Bearer {app.couriers[courier_id]}'})
+    return courier_id, order_id, response.status_code
+
+
+def test_stampede_has_exactly_one_winner_per_order(app):
+    # Every courier tries every order: 2000 accepts, released together
+    attempts = [(c, o) for c in app.couriers for o in app.order_ids]
+    random.Random(7).shuffle(attempts)
+    start = threading.Barrier(WORKERS)
+
+    def run(batch):
+        start.wait()
+        return [accept(app, c, o) for c, o in batch]
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = [r for batch in pool.map(run, [attempts[i::WORKERS] for i in range(WORKERS)]) for r in batch]
+
+    assert len(results) == COURIERS * ORDERS
+    assert Counter(status for _, _, status in results) == {200: ORDERS, 409: COURIERS * ORDERS - ORDERS}
+    winners = defaultdict(list)
+    for courier_id, order_id, status in results:
+        if status == 200:
+            winners[order_id].append(courier_id)
+    assert sorted(winners) == sorted(app.order_ids) and all(len(w) == 1 for w in winners.values())
+
+    rows = {d.id: (d.status, d.courier_id) for d in Delivery.query}
+    assert rows == {order_id: ('assigned', winners[order_id][0]) for order_id in app.order_ids}
+    history = Counter(s.delivery_id for s in DeliveryStatus.query)
+    assert history == Counter(app.order_ids)
+
+
+def test_accepting_twice_is_idempotent_and_others_are_turned_away(app):
+    (first, second), order_id = list(app.couriers)[:2], app.order_ids[0]
+    assert accept(app, first, order_id)[2] == 200
+    assert accept(app, first, order_id)[2] == 200
+    assert accept(app, second, order_id)[2] == 409
+    assert DeliveryStatus.query.filter_by(delivery_id=order_id).count() == 1
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from models import Address, ApiKey, Delivery, DeliveryPoint, PickupPoint
+from routes import external_api
+from routes.external_api import external_api_bp
+from tests.flask_factories import flask_app_context, make_customer
+from utils import decorators
+from utils.order_ingest import BulkOrderImporter
+
+HEADERS = {'X-API-Key': 'default-api-key-change-in-production'}
+
+
+def order(n, street='Bialik', number='55', pickup=None):
+    item = {
+        'merchant_order_id': f'SHOP-{n}',
+        'customer': {'name': f'Customer {n}', 'phone': f'052-{n:07d}'},
+        'delivery_address': {'city': 'Ramat Gan', 'street': street, 'number': number},
+        'package_details': {'weight': 1.5, 'description': 'Bag'}
+    }
+    if pickup:
+        item['pickup_address'] = pickup
+    return item
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.delenv('EXTERNAL_API_KEY', raising=False)
+    emitted = []
+    monkeypatch.setattr(external_api.socketio, 'emit', lambda *args, **kwargs: emitted.append(args))
+    monkeypatch.setattr('utils.batch_allocation.schedule_batch_allocation', lambda app: None)
+    decorators._merchant_keys.clear()
+    with flask_app_context() as app:
+        app.register_blueprint(external_api_bp, url_prefix='/api/external')
+        db.session.add(make_customer())
+        db.session.commit()
+        client = app.test_client()
+        client.emitted = emitted
+        yield client
+
+
+def test_bulk_json_creates_orders_with_shared_rows(client):
+    warehouse = {'city': 'Holon', 'street': 'Hamelacha', 'number': '3'}
+    items = [order(i, number=str(i % 3), pickup=warehouse) for i in range(30)]
+    items.append({'merchant_order_id': 'BAD', 'customer': {'name': 'x'}})
+
+    response = client.post('/api/external/orders/bulk', json=items, headers=HEADERS)
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert (body['created'], body['exists'], body['error']) == (30, 0, 1)
+    assert [r['index'] for r in body['results']] == list(range(31))
+    assert body['results'][-1]['error'] == 'customer.name and customer.phone are required'
+    assert Delivery.query.count() == 30
+    # 3 delivery addresses + the warehouse; one pickup point for the whole batch
+    assert Address.query.count() == 4 and PickupPoint.query.count() == 1
+    assert DeliveryPoint.query.count() == 30
+    assert len({r['order_number'] for r in body['results'][:30]}) == 30
+    assert [e for e in client.emitted if e[0] == 'orders_imported'] == [('orders_imported', {'count': 30})]
+    assert client.emitted[-1] == ('dashboard_delta', {
+        'delta': {'orders_total': 30, 'orders_pending': 30, 'orders_today': 30}, 'stale': False
+    })
+
+
+def test_bulk_is_idempotent_on_merchant_order_id(client):
+    first = client.post('/api/external/orders/bulk', json=[order(1), order(2)], headers=HEADERS).get_json()
+    retry = client.post('/api/external/orders/bulk', json=[order(2), order(3), order(3)], headers=HEADERS).get_json()
+
+    assert [r['status'] for r in retry['results']] == ['exists', 'created', 'error']
+    assert retry['results'][0]['order_number'] == first['results'][1]['order_number']
+    assert retry['results'][2]['error'] == 'duplicate of item 1'
+    assert Delivery.query.count() == 3
+
+    # The single-order endpoint honours the same key
+    single = client.post('/api/external/orders', json=order(3), headers=HEADERS)
+    assert single.status_code == 200
+    assert single.get_json()['order_id'] == retry['results'][1]['order_id']
+
+
+def merchant_key(prefix, name):
+    db.session.add(ApiKey(prefix=prefix, key_hash=generate_password_hash('s3cret', method='pbkdf2:sha256:1000'),
+                          merchant_name=name))
+    db.session.commit()
+    return {'X-API-Key': f'{prefix}.s3cret'}
+
+
+def test_merchant_order_ids_are_scoped_to_the_merchant_key(client):
+    shop_a, shop_b = merchant_key('aaaa1111', 'Shop A'), merchant_key('bbbb2222', 'Shop B')
+
+    # Both shops number their orders from 1: neither sees the other's order as a retry
+    a = client.post('/api/external/orders/bulk', json=[order(1)], headers=shop_a).get_json()
+    b = client.post('/api/external/orders/bulk', json=[order(1)], headers=shop_b).get_json()
+    shared = client.post('/api/external/orders', json=order(1), headers=HEADERS)
+    assert [a['created'], b['created'], shared.status_code] == [1, 1, 201]
+
+    retry = client.post('/api/external/orders', json=order(1), headers=shop_b)
+    assert retry.status_code == 200 and retry.get_json()['order_id'] == b['results'][0]['order_id']
+    assert client.post('/api/external/orders/bulk', json=[order(1)], headers=shop_a).get_json()['exists'] == 1
+    assert Delivery.query.count() == 3
+
+    assert client.post('/api/external/orders', json=order(2), headers={'X-API-Key': 'aaaa1111.wrong'}).status_code == 403
+
+
+def test_notes_stay_with_their_order_not_the_shared_address(client):
+    first, second = order(1), order(2)
+    first['notes'], second['notes'] = 'Gate code 1234', 'Leave with the guard'
+    client.post('/api/external/orders/bulk', json=[first], headers=HEADERS)
+    client.post('/api/external/orders', json=second, headers=HEADERS)
+
+    [address] = Address.query.filter_by(street='Bialik').all()
+    assert address.notes is None
+    notes = {d.merchant_order_id: d.notes for d in Delivery.query}
+    assert notes == {'SHOP-1': 'Gate code 1234', 'SHOP-2': 'Leave with the guard'}
+
+
+def test_bulk_accepts_ndjson(client):
+    body = '\n'.join(json.dumps(order(i)) for i in range(5)) + '\n\n'
+    response = client.post('/api/external/orders/bulk', data=body, headers=HEADERS,
+                           content_type='application/x-ndjson')
+    assert response.get_json()['created'] == 5
+
+    bad = client.post('/api/external/orders/bulk', data='{"a": 1}\nnot json\n', headers=HEADERS,
+                      content_type='application/x-ndjson')
+    assert bad.status_code == 400 and bad.get_json()['error'] == 'Invalid JSON on line 2'
+
+
+def test_bulk_rejects_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr(BulkOrderImporter, 'MAX_ORDERS', 3)
+    response = client.post('/api/external/orders/bulk', json=[order(i) for i in range(4)], headers=HEADERS)
+    assert response.status_code == 413
+    assert Delivery.query.count() == 0
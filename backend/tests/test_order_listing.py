@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db
+from models import Invoice, User
+from routes import orders
+from routes.orders import orders_bp
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.query_stats import assert_max_queries
+
+
+@pytest.fixture
+def client():
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        app.register_blueprint(orders_bp, url_prefix='/api/orders')
+        orders._order_counts.clear()
+
+        admin = User(username='admin', email='a@test.com', phone='0500000000', user_type='admin', password_hash='x')
+        customer = make_customer()
+        courier = make_courier(1, 32.08, 34.78)
+        db.session.add_all([admin, customer, courier])
+        start = datetime(2026, 3, 1, 8, 0)
+        for i in range(25):
+            delivery = make_delivery(customer, f'ORD-{i:02d}', 32.08, 34.78,
+                                     created_at=start + timedelta(hours=i // 2),  # pairs share a timestamp
+                                     courier=courier if i % 5 == 0 else None,
+                                     status='assigned' if i % 5 == 0 else 'pending')
+            delivery.invoice = Invoice(invoice_number=f'INV-{i}', customer=customer, subtotal=10, vat_amount=1.7,
+                                       total_amount=11.7)
+            db.session.add(delivery)
+        db.session.commit()
+
+        client = app.test_client()
+        client.headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+        client.courier = courier
+        yield client
+
+
+def fetch_all(client, **params):
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/orders', query_string=query, headers=client.headers)
+        assert response.status_code == 200
+        pages.append(response)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return pages
+
+
+def test_cursor_pages_cover_every_order_once_newest_first(client):
+    pages = fetch_all(client, limit=7)
+    numbers = [o['order_number'] for page in pages for o in page.get_json()]
+
+    assert [len(p.get_json()) for p in pages] == [7, 7, 7, 4]
+    assert sorted(numbers) == [f'ORD-{i:02d}' for i in range(25)]
+    assert numbers[:3] == ['ORD-24', 'ORD-23', 'ORD-22']
+    assert {p.headers['X-Total-Count'] for p in pages} == {'25'}
+    assert pages[0].get_json()[0]['total'] == 11.7
+
+
+def test_without_limit_or_cursor_every_order_is_returned(client, monkeypatch):
+    # Existing callers (dashboards, order history) don't page
+    monkeypatch.setattr(orders, 'ORDERS_PAGE_SIZE', 5)
+    response = client.get('/api/orders', headers=client.headers)
+    assert len(response.get_json()) == 25
+    assert response.headers['X-Total-Count'] == '25' and 'X-Next-Cursor' not in response.headers
+
+    first = client.get('/api/orders', query_string={'limit': 10}, headers=client.headers)
+    rest = client.get('/api/orders', query_string={'cursor': first.headers['X-Next-Cursor']}, headers=client.headers)
+    assert len(rest.get_json()) == 5 and 'X-Next-Cursor' in rest.headers
+
+
+def test_filters(client):
+    assigned = fetch_all(client, status='assigned', courier_id=client.courier.id)
+    assert [o['order_number'] for o in assigned[0].get_json()] == ['ORD-20', 'ORD-15', 'ORD-10', 'ORD-05', 'ORD-00']
+
+    window = fetch_all(client, date_from='2026-03-01T10:00:00', date_to='2026-03-01T11:00:00')
+    assert sorted(o['order_number'] for o in window[0].get_json()) == ['ORD-04', 'ORD-05', 'ORD-06', 'ORD-07']
+    assert window[0].headers['X-Total-Count'] == '4'
+    whole_day = fetch_all(client, date_from='2026-03-01', date_to='2026-03-01')
+    assert whole_day[0].headers['X-Total-Count'] == '25'
+
+    bad = client.get('/api/orders', query_string={'cursor': '!!'}, headers=client.headers)
+    assert bad.status_code == 400
+
+
+def test_page_query_count_does_not_grow_with_page_size(client):
+    # Auth user, count, page, customers (selectin) + their users
+    with assert_max_queries(5):
+        client.get('/api/orders', query_string={'limit': 5}, headers=client.headers)
+    # The cached total isn't counted again, however many rows the page has
+    with assert_max_queries(4):
+        client.get('/api/orders', query_string={'limit': 25}, headers=client.headers)
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from extensions import db
+from models import Delivery, DeliveryStatus
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.courier_index import courier_index
+from utils.job_queue import JobQueue
+from utils.order_pipeline import allocate_order
+
+
+@pytest.fixture
+def app():
+    with flask_app_context() as app:
+        courier_index.clear()
+        yield app
+        courier_index.clear()
+
+
+def test_failing_job_is_retried_then_succeeds(app):
+    jobs = JobQueue(workers=2, retry_backoff=0.01)
+    calls = []
+
+    def flaky(n):
+        calls.append(n)
+        if len(calls) < 3:
+            raise RuntimeError('db hiccup')
+
+    jobs.enqueue(app, flaky, 7)
+    assert jobs.wait_idle(timeout=5)
+    assert calls == [7, 7, 7]
+    assert jobs.stats == {'enqueued': 1, 'succeeded': 1, 'retried': 2, 'failed': 0}
+
+
+def test_job_gives_up_after_max_attempts(app):
+    jobs = JobQueue(workers=1, max_attempts=2, retry_backoff=0.01)
+
+    def broken():
+        raise ValueError('nope')
+
+    jobs.enqueue(app, broken)
+    assert jobs.wait_idle(timeout=5)
+    assert jobs.stats['failed'] == 1
+    assert list(jobs.failed) == [{'job': 'broken', 'args': (), 'error': 'nope', 'attempts': 2}]
+
+
+def test_slow_job_does_not_block_enqueue(app):
+    jobs = JobQueue(workers=2)
+    release = threading.Event()
+    done = []
+
+    jobs.enqueue(app, release.wait, 5)
+    jobs.enqueue(app, done.append, 'fast')
+    assert not jobs.wait_idle(timeout=0.2)
+    assert done == ['fast'] and jobs.pending() == 1
+    release.set()
+    assert jobs.wait_idle(timeout=5)
+
+
+def test_allocate_order_assigns_once(app):
+    courier = make_courier(1, 32.0853, 34.7818)
+    delivery = make_delivery(make_customer(), 'ORD-1', 32.0860, 34.7820)
+    db.session.add_all([courier, delivery])
+    db.session.commit()
+
+    allocate_order(delivery.id)
+    db.session.expire_all()
+    assert (delivery.status, delivery.courier_id) == ('assigned', courier.id)
+    assert [h.status for h in DeliveryStatus.query.filter_by(delivery_id=delivery.id)] == ['assigned']
+
+    # A retry (or a late duplicate job) leaves the existing assignment alone
+    other = make_courier(2, 32.0853, 34.7818)
+    db.session.add(other)
+    db.session.commit()
+    allocate_order(delivery.id)
+    db.session.expire_all()
+    assert db.session.get(Delivery, delivery.id).courier_id == courier.id
+    assert DeliveryStatus.query.filter_by(delivery_id=delivery.id).count() == 1
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+from flask import jsonify
+
+from extensions import db
+from models import Customer, Delivery
+from tests.flask_factories import flask_app_context, make_customer, make_delivery
+from utils.query_stats import assert_max_queries, init_query_stats, query_stats, statement_shape
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('QUERY_STATS_HEADER', '1')
+    with flask_app_context() as app:
+        db.session.add_all([make_delivery(make_customer(i), f'ORD-{i}', 32.08, 34.78) for i in range(6)])
+        db.session.commit()
+
+        @app.route('/n-plus-one')
+        def n_plus_one():
+            return jsonify([d.customer.full_name for d in Delivery.query.all()])
+
+        @app.route('/joined')
+        def joined():
+            rows = db.session.query(Delivery.order_number, Customer.full_name).join(Customer).all()
+            return jsonify([list(r) for r in rows])
+
+        init_query_stats(app)
+        query_stats.reset()
+        yield app.test_client()
+        query_stats.reset()
+
+
+def test_shape_folds_literals_and_in_lists():
+    assert statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?) AND name = 'x'") == \
+        statement_shape("SELECT * FROM t WHERE id IN (?) AND name = 'y'") == \
+        "SELECT * FROM t WHERE id IN (...) AND name = ?"
+
+
+def test_header_and_summary_flag_repeated_statements(client):
+    response = client.get('/n-plus-one')
+    # One list query, then a lazy customer load per delivery
+    assert response.headers['X-Query-Count'] == '7'
+    assert float(response.headers['X-DB-Time-Ms']) >= 0
+    assert client.get('/joined').headers['X-Query-Count'] == '1'
+
+    summary = {row['endpoint']: row for row in query_stats.summary()}
+    assert summary['n_plus_one']['queries_max'] == 7
+    (shape, repeats), = summary['n_plus_one']['repeated_shapes'].items()
+    assert shape.startswith('SELECT customers.') and repeats == 6
+    assert summary['joined']['repeated_shapes'] == {}
+    assert [row['endpoint'] for row in query_stats.summary()] == ['n_plus_one', 'joined']
+
+
+def test_assert_max_queries(client):
+    with assert_max_queries(1):
+        client.get('/joined')
+    with pytest.raises(AssertionError, match='Expected at most 1 queries'):
+        with assert_max_queries(1):
+            Delivery.query.count()
+            Customer.query.count()
+
+
+def test_assert_max_queries_ignores_other_threads(tmp_path):
+    with flask_app_context(f"sqlite:///{tmp_path / 'app.db'}") as app:
+        def background():
+            with app.app_context():
+                Delivery.query.count()
+                db.session.remove()
+
+        with assert_max_queries(1) as queries:
+            Customer.query.count()
+            worker = threading.Thread(target=background)
+            worker.start()
+            worker.join()
+        assert queries.count == 1
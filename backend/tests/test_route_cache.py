@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import RouteCacheEntry
+from tests.flask_factories import flask_app_context
+from scripts.fake_osrm import serve_osrm
+from utils import route_cache as route_cache_module
+from utils.geo_utils import get_route_info
+from utils.route_cache import LRUCache, RouteCache, geohash_center, geohash_encode
+
+TLV = (32.0853, 34.7818)
+JLM = (31.7683, 35.2137)
+
+
+def test_geohash_matches_reference_and_center_is_inside_cell():
+    assert geohash_encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    cell = geohash_encode(*TLV, 7)
+    assert geohash_encode(*geohash_center(cell), 7) == cell
+
+
+def test_lru_evicts_oldest_and_expires():
+    lru = LRUCache(maxsize=2, ttl_seconds=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+
+    lru.set('d', 4, ttl_seconds=-1)
+    assert lru.get('d') is None
+
+
+@pytest.fixture
+def osrm():
+    with serve_osrm() as (url, stub):
+        yield url, stub
+
+
+def test_nearby_requests_share_one_osrm_call(osrm):
+    url, stub = osrm
+    cache = RouteCache(osrm_url=url)
+
+    first = cache.get_route(*TLV, *JLM)
+    # A few metres away at both ends falls in the same geohash cells
+    second = cache.get_route(TLV[0] + 0.0001, TLV[1], JLM[0], JLM[1] + 0.0001)
+
+    assert first == second
+    assert 55 < first['distance_km'] < 90
+    assert len(stub.requests) == 1
+    assert cache.stats['local_hits'] == 1
+
+
+def test_persistent_tier_survives_a_cold_process_and_expires(osrm):
+    url, stub = osrm
+    with flask_app_context():
+        RouteCache(osrm_url=url).get_route(*TLV, *JLM)
+
+        cold = RouteCache(osrm_url=url)
+        assert cold.get_route(*TLV, *JLM) is not None
+        assert cold.stats['persistent_hits'] == 1
+        assert len(stub.requests) == 1
+
+        entry = RouteCacheEntry.query.one()
+        entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        from extensions import db
+        db.session.commit()
+
+        assert RouteCache(osrm_url=url).get_route(*TLV, *JLM) is not None
+        assert len(stub.requests) == 2
+
+        entry = RouteCacheEntry.query.one()
+        entry.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert cold.purge_expired() == 1
+
+
+def test_unreachable_osrm_is_cached_briefly(monkeypatch):
+    cache = RouteCache(osrm_url='http://127.0.0.1:9')
+    assert cache.get_route(*TLV, *JLM) is None
+    assert cache.get_route(*TLV, *JLM) is None
+    assert cache.get_matrix([TLV], [JLM]) == [[None]]
+    assert cache.stats['errors'] == 1
+
+    # Only for NEGATIVE_TTL_SECONDS: then OSRM is asked again
+    monkeypatch.setattr(route_cache_module.time, 'monotonic', lambda: 10 ** 9)
+    assert cache.get_route(*TLV, *JLM) is None
+    assert cache.stats['errors'] == 2
+
+
+def test_map_system_routes_through_the_shared_cache(osrm, monkeypatch, tmp_path):
+    url, stub = osrm
+    monkeypatch.setattr(route_cache_module, 'route_cache', RouteCache(osrm_url=url))
+    from utils.map_system import DeliveryMapSystem
+    maps = DeliveryMapSystem(db_path=str(tmp_path / 'deliveries.db'))
+
+    route = maps.calculate_route(*TLV, *JLM)
+    assert route == maps.calculate_route(TLV[0] + 0.0001, TLV[1], *JLM)
+    assert 55 < route['distance_km'] < 90
+    assert len(stub.requests) == 1
+    maps.close()
+
+
+def test_get_route_info_goes_through_the_cache(osrm, monkeypatch):
+    url, stub = osrm
+    monkeypatch.setattr(route_cache_module, 'route_cache', RouteCache(osrm_url=url))
+
+    pickup, dropoff = {'lat': TLV[0], 'lon': TLV[1]}, {'lat': JLM[0], 'lon': JLM[1]}
+    info = get_route_info(pickup, dropoff)
+    assert info == get_route_info(pickup, dropoff)
+    assert isinstance(info['duration_min'], int)
+    assert len(stub.requests) == 1
@@ -0,0 +1,59 @@
+import pytest
+from flask_jwt_extended import JWTManager, create_access_token
+
+from extensions import db, socketio
+from sockets import delivery_events
+from sockets.delivery_events import register_socket_events
+from tests.flask_factories import flask_app_context, make_courier, make_customer
+from utils import courier_index as courier_index_module
+from utils import location_buffer as location_buffer_module
+
+
+@pytest.fixture
+def app(monkeypatch):
+    with flask_app_context() as app:
+        app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-32b'
+        JWTManager(app)
+        socketio.init_app(app, async_mode='threading')
+        register_socket_events(socketio)
+
+        app.mine, app.other = make_courier(1, 32.08, 34.78), make_courier(2, 32.09, 34.79)
+        customer = make_customer()
+        db.session.add_all([app.mine, app.other, customer])
+        db.session.commit()
+        app.tokens = {'mine': create_access_token(identity=str(app.mine.user_id)),
+                      'customer': create_access_token(identity=str(customer.user_id))}
+
+        app.moved, app.buffered = [], []
+        monkeypatch.setattr(courier_index_module.courier_index, 'update_location',
+                            lambda courier_id, lat, lng: app.moved.append(courier_id))
+        monkeypatch.setattr(location_buffer_module.location_buffer, 'add',
+                            lambda courier_id, lat, lng, **kwargs: app.buffered.append(courier_id))
+        monkeypatch.setattr(location_buffer_module, 'start_location_flusher', lambda app: None)
+        yield app
+    delivery_events._socket_couriers.clear()
+
+
+def connect(app, who):
+    return socketio.test_client(app, query_string=f"token={app.tokens[who]}")
+
+
+def test_location_is_recorded_for_the_authenticated_courier(app):
+    client = connect(app, 'mine')
+    client.emit('courier_location_update', {'lat': 32.1, 'lng': 34.8})
+    client.emit('courier_location_update', {'courier_id': app.mine.id, 'lat': 32.1, 'lng': 34.8})
+    assert app.moved == app.buffered == [app.mine.id, app.mine.id]
+
+
+def test_location_for_another_courier_is_rejected(app):
+    client = connect(app, 'mine')
+    client.get_received()
+    client.emit('courier_location_update', {'courier_id': app.other.id, 'lat': 32.1, 'lng': 34.8})
+    assert app.moved == app.buffered == []
+    assert [m['name'] for m in client.get_received()] == ['error']
+
+
+def test_non_courier_connections_cannot_report_locations(app):
+    client = connect(app, 'customer')
+    client.emit('courier_location_update', {'courier_id': app.other.id, 'lat': 32.1, 'lng': 34.8})
+    assert app.moved == app.buffered == []
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import DeliveryTrackSegment, DeliveryTracking
+from tests.flask_factories import flask_app_context, make_courier, make_customer, make_delivery
+from utils.track_storage import TrackPoint, TrackStorage, decode_points, encode_points
+
+START = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def make_track(n, start=START):
+    return [TrackPoint(start + timedelta(seconds=i, milliseconds=i % 7),
+                       32.0853 + i * 0.00003, 34.7818 - i * 0.00002,
+                       None if i % 5 == 0 else 20.0 + (i % 30) / 10, (i * 3) % 360)
+            for i in range(n)]
+
+
+def test_encode_decode_round_trip():
+    track = make_track(500)
+    decoded = list(decode_points(encode_points(track)))
+
+    assert len(decoded) == len(track)
+    for got, want in zip(decoded, track):
+        assert got.timestamp == want.timestamp
+        assert got.latitude == pytest.approx(want.latitude, abs=1e-6)
+        assert got.longitude == pytest.approx(want.longitude, abs=1e-6)
+        assert got.speed == (None if want.speed is None else pytest.approx(want.speed, abs=0.05))
+        assert got.heading == pytest.approx(want.heading, abs=0.05)
+
+
+def test_single_point_segment():
+    [point] = decode_points(encode_points(make_track(1)))
+    assert point.latitude == pytest.approx(32.0853)
+    assert point.speed is None
+
+
+def test_segments_are_much_smaller_than_raw_floats():
+    # 8 bytes per float column + 8 for the timestamp, before any row overhead
+    raw_bytes = 600 * 5 * 8
+    assert len(encode_points(make_track(600))) < raw_bytes / 5
+
+
+@pytest.fixture
+def delivery():
+    with flask_app_context():
+        courier = make_courier(1, 32.0, 34.0)
+        delivery = make_delivery(make_customer(), 'ORD-TRACK', 32.0, 34.0, courier=courier, status='in_transit')
+        db.session.add(delivery)
+        db.session.commit()
+        yield delivery
+
+
+def add_rows(delivery, track, courier_id=None):
+    db.session.add_all([DeliveryTracking(delivery_id=delivery.id, courier_id=courier_id or delivery.courier_id,
+                                         timestamp=p.timestamp, latitude=p.latitude, longitude=p.longitude,
+                                         speed=p.speed, heading=p.heading) for p in track])
+    db.session.commit()
+
+
+def test_only_closed_deliveries_are_compacted(delivery, monkeypatch):
+    monkeypatch.setattr(TrackStorage, 'SEGMENT_POINTS', 100)
+    track = make_track(250)
+    add_rows(delivery, track)
+
+    assert TrackStorage.compact_closed() == (0, 0)
+
+    delivery.status = 'delivered'
+    db.session.commit()
+    assert TrackStorage.compact_closed() == (1, 250)
+
+    assert DeliveryTracking.query.count() == 0
+    assert [s.point_count for s in delivery.track_segments] == [100, 100, 50]
+    replay = list(TrackStorage.iter_track(delivery.id))
+    assert [p.timestamp for p in replay] == [p.timestamp for p in track]
+
+
+def test_late_points_are_streamed_then_appended(delivery):
+    delivery.status = 'delivered'
+    add_rows(delivery, make_track(10))
+    TrackStorage.compact_closed()
+
+    late = make_track(3, start=START + timedelta(hours=1))
+    add_rows(delivery, late)
+    assert len(list(TrackStorage.iter_track(delivery.id))) == 13
+
+    TrackStorage.compact_closed()
+    assert [s.seq for s in DeliveryTrackSegment.query.order_by(DeliveryTrackSegment.seq)] == [0, 1]
+    assert list(TrackStorage.iter_track(delivery.id))[-1].timestamp == late[-1].timestamp
+
+
+def test_segments_split_when_the_courier_changes(delivery, monkeypatch):
+    monkeypatch.setattr(TrackStorage, 'SEGMENT_POINTS', 100)
+    other = make_courier(2, 32.0, 34.0)
+    db.session.add(other)
+    db.session.commit()
+    first = delivery.courier_id
+    track = make_track(150)
+    add_rows(delivery, track[:30])
+    add_rows(delivery, track[30:], courier_id=other.id)  # reassigned mid-delivery
+
+    delivery.status = 'delivered'
+    db.session.commit()
+    assert TrackStorage.compact_closed() == (1, 150)
+
+    segments = DeliveryTrackSegment.query.order_by(DeliveryTrackSegment.seq).all()
+    assert [(s.courier_id, s.point_count) for s in segments] == [(first, 30), (other.id, 100), (other.id, 20)]
+    assert segments[1].started_at == track[30].timestamp
+    assert [p.timestamp for p in TrackStorage.iter_track(delivery.id)] == [p.timestamp for p in track]
@@ -0,0 +1,188 @@
+import logging
+
+from sqlalchemy import bindparam
+
+from utils.route_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class AddressDeduplicator:
+    """
+    Reuses Address / PickupPoint / DeliveryPoint rows instead of inserting a new
+    set for every order. Addresses are matched on Address.address_hash
+    (normalized fields + rounded coordinates), points on their address and
+    contact details. Per-order notes (gate codes, instructions) go on the point,
+    which is matched on them too; a shared Address carries none, so one order's
+    notes never show up on another's. Lookups are cached by key -> row id; a cached id is checked
+    with a primary-key get, so rows removed by a rollback or by compact() are
+    never handed out.
+    """
+
+    CACHE_SIZE = 20000
+    CACHE_TTL_SECONDS = 3600
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.cache = LRUCache(self.CACHE_SIZE, self.CACHE_TTL_SECONDS)
+        self.stats = {'reused': 0, 'created': 0}
+
+    def get_or_create_address(self, street, building_number, city, apartment=None, floor=None, entrance=None,
+                              latitude=None, longitude=None, user_id=None):
+        """Existing Address with the same fingerprint, or a new (flushed) one"""
+        from models import db, Address
+
+        address_hash = Address.fingerprint(street, building_number, city, apartment, floor, entrance,
+                                           latitude, longitude, user_id)
+        address = self._lookup(Address, ('address', address_hash), lambda: Address.query.filter_by(
+            address_hash=address_hash
+        ).order_by(Address.id).first())
+        if address is not None:
+            return address
+
+        address = Address(street=street, building_number=building_number, city=city, apartment=apartment,
+                          floor=floor, entrance=entrance, latitude=latitude, longitude=longitude,
+                          user_id=user_id)
+        return self._create(address, ('address', address_hash))
+
+    def get_or_create_pickup_point(self, address, contact_name, contact_phone, business_name=None,
+                                   pickup_instructions=None):
+        from models import PickupPoint
+
+        fields = dict(address_id=address.id, contact_name=contact_name, contact_phone=contact_phone,
+                      business_name=business_name or None, pickup_instructions=pickup_instructions or None)
+        key = ('pickup',) + tuple(fields.values())
+        point = self._lookup(PickupPoint, key, lambda: self._match(PickupPoint, fields))
+        return point if point is not None else self._create(PickupPoint(**fields), key)
+
+    def get_or_create_delivery_point(self, address, recipient_name, recipient_phone, delivery_instructions=None,
+                                     access_code=None, is_residential=True):
+        from models import DeliveryPoint
+
+        fields = dict(address_id=address.id, recipient_name=recipient_name, recipient_phone=recipient_phone,
+                      delivery_instructions=delivery_instructions or None, access_code=access_code or None,
+                      is_residential=is_residential)
+        key = ('delivery',) + tuple(fields.values())
+        point = self._lookup(DeliveryPoint, key, lambda: self._match(DeliveryPoint, fields))
+        return point if point is not None else self._create(DeliveryPoint(**fields), key)
+
+    def _lookup(self, model, key, query):
+        from models import db
+
+        cached_id = self.cache.get(key)
+        row = db.session.get(model, cached_id) if cached_id is not None else None
+        if row is None:
+            row = query()
+        if row is not None:
+            self.cache.set(key, row.id)
+            self.stats['reused'] += 1
+        return row
+
+    def _create(self, row, key):
+        from models import db
+        db.session.add(row)
+        db.session.flush()
+        self.cache.set(key, row.id)
+        self.stats['created'] += 1
+        return row
+
+    @staticmethod
+    def _match(model, fields):
+        query = model.query
+        for name, value in fields.items():
+            column = getattr(model, name)
+            query = query.filter(column.is_(None) if value is None else column == value)
+        return query.order_by(model.id).first()
+
+    # ------------------------------------------------------------------
+    # One-off compaction of rows written before dedup existed
+    # ------------------------------------------------------------------
+
+    def compact(self):
+        """
+        Merge duplicate addresses, then duplicate pickup/delivery points, pointing
+        every foreign key at the lowest id of each group. Returns counts merged.
+        """
+        from models import Address, PickupPoint, DeliveryPoint, Delivery
+
+        refreshed = self._refresh_hashes()
+        merged = {
+            'hashes_refreshed': refreshed,
+            'addresses': self._merge(
+                Address, [Address.address_hash],
+                [(PickupPoint.__table__.c.address_id, PickupPoint.__table__),
+                 (DeliveryPoint.__table__.c.address_id, DeliveryPoint.__table__)]
+            ),
+            'pickup_points': self._merge(
+                PickupPoint, [PickupPoint.address_id, PickupPoint.contact_name, PickupPoint.contact_phone,
+                              PickupPoint.business_name, PickupPoint.pickup_instructions],
+                [(Delivery.__table__.c.pickup_point_id, Delivery.__table__)]
+            ),
+            'delivery_points': self._merge(
+                DeliveryPoint, [DeliveryPoint.address_id, DeliveryPoint.recipient_name, DeliveryPoint.recipient_phone,
+                                DeliveryPoint.delivery_instructions, DeliveryPoint.access_code,
+                                DeliveryPoint.is_residential],
+                [(Delivery.__table__.c.delivery_point_id, Delivery.__table__)]
+            ),
+        }
+        self.cache.clear()
+        # Merged addresses were deleted with Core statements, past the index's commit hooks
+        from utils.address_index import address_index
+        address_index.clear()
+        logger.info(f"Address compaction: {merged}")
+        return merged
+
+    def _refresh_hashes(self):
+        """Fill / fix address_hash for rows written by paths that skip ORM events (bulk updates, old rows)"""
+        from models import db, Address
+
+        table = Address.__table__
+        stale = []
+        rows = db.session.query(
+            Address.id, Address.street, Address.building_number, Address.city, Address.apartment, Address.floor,
+            Address.entrance, Address.latitude, Address.longitude, Address.user_id, Address.address_hash
+        ).order_by(Address.id).yield_per(self.BATCH_SIZE)
+        for row in rows:
+            address_hash = Address.fingerprint(*row[1:10])
+            if address_hash != row.address_hash:
+                stale.append({'b_id': row.id, 'b_hash': address_hash})
+
+        update = table.update().where(table.c.id == bindparam('b_id')).values(address_hash=bindparam('b_hash'))
+        for start in range(0, len(stale), self.BATCH_SIZE):
+            db.session.execute(update, stale[start:start + self.BATCH_SIZE])
+        db.session.commit()
+        return len(stale)
+
+    def _merge(self, model, key_columns, references):
+        """
+        Rows with equal key_columns are duplicates of the lowest id among them.
+        Sorting by the key puts each group together, so only the duplicates are
+        held in memory. Repoints every (fk_column, table) in references, then
+        deletes the duplicates.
+        """
+        from models import db
+
+        remap = []
+        keeper_key, keeper_id = object(), None
+        rows = db.session.query(model.id, *key_columns).order_by(*key_columns, model.id).yield_per(self.BATCH_SIZE)
+        for row in rows:
+            key = tuple(row[1:])
+            if key == keeper_key:
+                remap.append({'b_old': row.id, 'b_new': keeper_id})
+            else:
+                keeper_key, keeper_id = key, row.id
+
+        table = model.__table__
+        for start in range(0, len(remap), self.BATCH_SIZE):
+            batch = remap[start:start + self.BATCH_SIZE]
+            for fk_column, fk_table in references:
+                db.session.execute(
+                    fk_table.update().where(fk_column == bindparam('b_old')).values({fk_column.name: bindparam('b_new')}),
+                    batch
+                )
+            db.session.execute(table.delete().where(table.c.id.in_([r['b_old'] for r in batch])))
+            db.session.commit()
+        return len(remap)
+
+
+address_dedup = AddressDeduplicator()
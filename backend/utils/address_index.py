@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from utils.geocoding import normalize_address
+
+logger = logging.getLogger(__name__)
+
+
+class AddressAutocompleteIndex:
+    """
+    In-memory autocomplete over distinct "street number, city" strings.
+    Every normalized token is indexed by its prefixes (so 'הרצ' finds 'הרצל') and
+    by character trigrams as a fallback for matches inside a word. A query must
+    match all of its tokens; suggestions are ranked by how well they match, then
+    by how many Address rows share the string.
+
+    Built from the addresses table on first use / at startup. Committed inserts
+    in this process are added as they happen; every REFRESH_SECONDS the whole
+    index is rebuilt off to the side and swapped in, which picks up rows written
+    elsewhere and drops deleted or edited ones. A committed ORM update or delete
+    of an Address here, or clear() (address compaction), forces that rebuild on
+    the next search.
+    """
+
+    MAX_PREFIX = 12
+    NGRAM = 3
+    REFRESH_SECONDS = 300
+    LOAD_BATCH = 5000
+
+    INDEX_STATE = ('_entries', '_tokens', '_weights', '_by_text', '_prefixes', '_ngrams', 'max_id')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries = []       # entry id -> suggestion dict
+            self._tokens = []        # entry id -> tuple of normalized tokens
+            self._weights = []       # entry id -> number of Address rows
+            self._by_text = {}       # full_address -> entry id
+            self._prefixes = {}      # token prefix -> set(entry ids)
+            self._ngrams = {}        # trigram -> set(entry ids)
+            self.max_id = 0
+            self.built = False
+            self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, address_id, street, number, city):
+        full_address = f"{street} {number}, {city}"
+        with self._lock:
+            self.max_id = max(self.max_id, address_id or 0)
+            entry_id = self._by_text.get(full_address)
+            if entry_id is not None:
+                self._weights[entry_id] += 1
+                return
+
+            tokens = tuple(normalize_address(street, number, city).split())
+            if not tokens:
+                return
+            entry_id = len(self._entries)
+            self._by_text[full_address] = entry_id
+            self._entries.append({
+                'id': address_id,
+                'street': street,
+                'city': city,
+                'number': number,
+                'full_address': full_address
+            })
+            self._tokens.append(tokens)
+            self._weights.append(1)
+            for token in set(tokens):
+                for end in range(1, min(len(token), self.MAX_PREFIX) + 1):
+                    self._prefixes.setdefault(token[:end], set()).add(entry_id)
+                for gram in self._grams(token):
+                    self._ngrams.setdefault(gram, set()).add(entry_id)
+
+    def search(self, query, limit=10):
+        terms = normalize_address(query).split()
+        if not terms:
+            return []
+
+        with self._lock:
+            matches = None
+            for term in terms:
+                found = self._match_term(term)
+                matches = found if matches is None else matches & found
+                if not matches:
+                    return []
+
+            ranked = sorted(matches, key=lambda e: self._rank(e, terms))[:limit]
+            return [dict(self._entries[e]) for e in ranked]
+
+    def _match_term(self, term):
+        found = self._prefixes.get(term[:self.MAX_PREFIX], set())
+        if len(term) > self.MAX_PREFIX:
+            found = {e for e in found if any(t.startswith(term) for t in self._tokens[e])}
+        if found or len(term) < self.NGRAM:
+            return found
+
+        # Fallback: term appears inside a word
+        grams = self._grams(term)
+        candidates = set.intersection(*(self._ngrams.get(g, set()) for g in grams))
+        return {e for e in candidates if any(term in t for t in self._tokens[e])}
+
+    def _rank(self, entry_id, terms):
+        tokens = self._tokens[entry_id]
+        exact = sum(term in tokens for term in terms)
+        leading = tokens[0].startswith(terms[0])
+        return (-exact, not leading, -self._weights[entry_id], len(self._entries[entry_id]['full_address']))
+
+    def _grams(self, token):
+        return {token[i:i + self.NGRAM] for i in range(len(token) - self.NGRAM + 1)}
+
+    def load(self, rows):
+        for address_id, street, number, city in rows:
+            self.add(address_id, street, number, city)
+
+    def refresh(self):
+        """Rebuild from the addresses table into a new index, then swap it in; searches keep running meanwhile."""
+        from models import db, Address
+        fresh = AddressAutocompleteIndex()
+        rows = db.session.query(Address.id, Address.street, Address.building_number, Address.city).order_by(
+            Address.id
+        ).yield_per(self.LOAD_BATCH)
+        fresh.load(rows)
+        with self._lock:
+            for name in self.INDEX_STATE:
+                setattr(self, name, getattr(fresh, name))
+            self.built = True
+            self.refreshed_at = time.monotonic()
+
+    def invalidate(self):
+        """Rebuild on the next ensure_fresh(), keeping the current entries until then."""
+        self.refreshed_at = 0.0
+
+    def _stale(self):
+        return not self.built or time.monotonic() - self.refreshed_at > self.REFRESH_SECONDS
+
+    def ensure_fresh(self):
+        if self._stale():
+            with self._refresh_lock:
+                if self._stale():
+                    started = time.perf_counter()
+                    self.refresh()
+                    logger.info(f"Address index: {len(self)} entries ({time.perf_counter() - started:.2f}s)")
+
+    def warm(self, app):
+        """Build the index in the background at startup."""
+        def run():
+            with app.app_context():
+                try:
+                    self.ensure_fresh()
+                except Exception as e:
+                    logger.warning(f"Address index warm-up failed: {e}")
+        threading.Thread(target=run, name='address-index', daemon=True).start()
+
+
+address_index = AddressAutocompleteIndex()
+
+
+# Incremental updates: only addresses whose transaction actually committed
+@event.listens_for(Session, 'after_flush')
+def _collect_new_addresses(session, flush_context):
+    from models import Address
+    # Capture values now: instances are expired by the time after_commit runs
+    new = [(obj.id, obj.street, obj.building_number, obj.city) for obj in session.new if isinstance(obj, Address)]
+    if new:
+        session.info.setdefault('new_addresses', []).extend(new)
+    # Entries can't be taken out of the index in place: edits and deletes mean a rebuild
+    if any(isinstance(obj, Address) for obj in session.deleted) or any(
+        isinstance(obj, Address) and any(inspect(obj).attrs[name].history.has_changes()
+                                         for name in ('street', 'building_number', 'city'))
+        for obj in session.dirty
+    ):
+        session.info['addresses_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _index_committed_addresses(session):
+    new = session.info.pop('new_addresses', None)
+    if new and address_index.built:
+        address_index.load(new)
+    if session.info.pop('addresses_changed', False):
+        address_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_addresses(session):
+    session.info.pop('new_addresses', None)
+    session.info.pop('addresses_changed', None)
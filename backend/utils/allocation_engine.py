@@ -1,6 +1,16 @@
 import logging
 from math import radians, cos, sin, asin, sqrt
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
+from geoalchemy2 import Geography
 from models import Courier, Delivery, db
+from utils.courier_index import courier_index
+from utils.live_locations import get_live_location_store
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python path is always available
+    np = None
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,6 +26,28 @@ class AllocationEngine:
     WEIGHT_DISTANCE = 0.45
     WEIGHT_RATING = 0.35
     WEIGHT_ACTIVITY = 0.20
+    EARTH_RADIUS_KM = 6371
+    DEFAULT_PERFORMANCE = 50.0
+
+    # Use the NumPy path once the candidate list is large enough to amortize array setup
+    VECTORIZE_MIN_CANDIDATES = 64
+
+    # Re-rank the best haversine candidates by road ETA (needs OSRM_URL)
+    ETA_RERANK_K = 5
+    MAX_ETA_MIN = 60.0
+
+    # Package Size Constraints
+    # 'small' (envelope) -> Any vehicle
+    # 'medium' (box) -> Scooter, Motorcycle, Car, Van
+    # 'large' -> Car, Van
+    # 'xlarge' -> Van only
+    # Vehicle Types: 'bicycle', 'scooter', 'motorcycle', 'car', 'van'
+    ALLOWED_VEHICLES = {
+        'small': ['bicycle', 'scooter', 'motorcycle', 'car', 'van'],
+        'medium': ['scooter', 'motorcycle', 'car', 'van'],
+        'large': ['car', 'van'],
+        'xlarge': ['van']
+    }
     
     @staticmethod
     def haversine_distance(lat1, lon1, lat2, lon2):
@@ -34,7 +66,7 @@ class AllocationEngine:
         dlat = lat2 - lat1 
         a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
         c = 2 * asin(sqrt(a)) 
-        r = 6371 # Radius of earth in kilometers. Use 3956 for miles
+        r = AllocationEngine.EARTH_RADIUS_KM # Radius of earth in kilometers. Use 3956 for miles
         return c * r
 
     @classmethod
@@ -51,13 +83,81 @@ class AllocationEngine:
             return None
 
         # 1. Get Candidates (Filter Phase)
-        # We fetch all available couriers and filter in python for now 
-        # (For scale, use PostGIS ST_DWithin)
-        candidates = Courier.query.filter_by(
-            is_available=True,
-            onboarding_status='approved' # Ensure only approved couriers
-        ).all()
+        candidates = cls._get_candidates(pickup_lat, pickup_lng)
+
+        # 2-5. Constraints, Distance, Score, Sort
+        scored_candidates = cls.score_candidates(candidates, delivery, pickup_lat, pickup_lng)
+
+        # 6. Road ETA for the short list
+        scored_candidates = cls.rerank_by_eta([scored_candidates], [(pickup_lat, pickup_lng)])[0]
+
+        if not scored_candidates:
+            logger.info(f"Allocation: No suitable courier found for {delivery.order_number}")
+            return None
 
+        best_match = scored_candidates[0]
+        logger.info(f"Allocation: Assigned {best_match['courier'].full_name} (Score: {best_match['score']:.1f}, Dist: {best_match['distance']:.1f}km)")
+        
+        return best_match['courier']
+
+    @classmethod
+    def score_candidates(cls, candidates, delivery, pickup_lat, pickup_lng, vectorized=None):
+        """
+        Filter and rank candidates for a pickup point.
+        Returns a list of {'courier', 'score', 'distance'} dicts sorted by score (desc).
+        vectorized=None picks the NumPy path automatically for large candidate lists.
+        """
+        if vectorized is None:
+            vectorized = np is not None and len(candidates) >= cls.VECTORIZE_MIN_CANDIDATES
+
+        if vectorized:
+            return cls._score_candidates_vectorized(candidates, delivery, pickup_lat, pickup_lng)
+        return cls._score_candidates_loop(candidates, delivery, pickup_lat, pickup_lng)
+
+    @classmethod
+    def rerank_by_eta(cls, ranked_lists, pickups, k=None):
+        """
+        Re-score the top k (default ETA_RERANK_K) of each ranked list
+        (score_candidates output for pickups[i]) on road ETA instead of
+        straight-line distance. All lists share a single couriers x pickups
+        distance matrix. Lists are returned unchanged when OSRM is not
+        configured or the matrix lookup fails. Callers that compare scores
+        across a whole list (batch allocation) pass its full length.
+        """
+        from utils.route_cache import route_cache
+        k = cls.ETA_RERANK_K if k is None else k
+        if not k or not route_cache.configured:
+            return ranked_lists
+
+        sources = {}
+        for ranked in ranked_lists:
+            for entry in ranked[:k]:
+                c = entry['courier']
+                sources.setdefault(c.id, {'lat': c.current_location_lat, 'lon': c.current_location_lng})
+        if not sources:
+            return ranked_lists
+
+        from utils.geo_utils import get_distance_matrix
+        row_of = {courier_id: row for row, courier_id in enumerate(sources)}
+        matrix = get_distance_matrix(list(sources.values()), [{'lat': lat, 'lon': lng} for lat, lng in pickups])
+        if matrix is None:
+            return ranked_lists
+
+        result = []
+        for col, ranked in enumerate(ranked_lists):
+            head = []
+            for entry in ranked[:k]:
+                route = matrix[row_of[entry['courier'].id]][col]
+                if route is not None:
+                    entry = dict(entry, score=cls._calculate_eta_score(entry['courier'], route['duration_min']),
+                                 eta_min=route['duration_min'], road_km=route['distance_km'])
+                head.append(entry)
+            head.sort(key=lambda x: x['score'], reverse=True)
+            result.append(head + ranked[k:])
+        return result
+
+    @classmethod
+    def _score_candidates_loop(cls, candidates, delivery, pickup_lat, pickup_lng):
         scored_candidates = []
 
         for courier in candidates:
@@ -84,38 +184,182 @@ class AllocationEngine:
 
         # 5. Sort by Score (Desc)
         scored_candidates.sort(key=lambda x: x['score'], reverse=True)
+        return scored_candidates
 
-        if not scored_candidates:
-            logger.info(f"Allocation: No suitable courier found for {delivery.order_number}")
-            return None
+    @classmethod
+    def _score_candidates_vectorized(cls, candidates, delivery, pickup_lat, pickup_lng):
+        """
+        Same result as _score_candidates_loop, computed in one NumPy pass
+        over contiguous lat/lng/performance/vehicle arrays.
+        """
+        if np is None:
+            raise RuntimeError("NumPy is required for vectorized scoring")
 
-        best_match = scored_candidates[0]
-        logger.info(f"Allocation: Assigned {best_match['courier'].full_name} (Score: {best_match['score']:.1f}, Dist: {best_match['distance']:.1f}km)")
-        
-        return best_match['courier']
+        n = len(candidates)
+        if n == 0:
+            return []
+
+        lats = np.fromiter((c.current_location_lat if c.current_location_lat is not None else np.nan for c in candidates), dtype=np.float64, count=n)
+        lngs = np.fromiter((c.current_location_lng if c.current_location_lng is not None else np.nan for c in candidates), dtype=np.float64, count=n)
+        perf = np.fromiter((c.performance_index or cls.DEFAULT_PERFORMANCE for c in candidates), dtype=np.float64, count=n)
+        vehicles = np.array([c.vehicle_type or '' for c in candidates], dtype=object)
+
+        # 2. Hard Constraints Mask
+        allowed = cls.ALLOWED_VEHICLES.get(delivery.package_size or 'small', [])
+        mask = np.isin(vehicles, allowed)
+
+        # 3. Distance (haversine) - NaN coordinates never pass the radius check
+        lat1, lng1 = np.radians(pickup_lat), np.radians(pickup_lng)
+        lat2, lng2 = np.radians(lats), np.radians(lngs)
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        dist = 2 * np.arcsin(np.sqrt(a)) * cls.EARTH_RADIUS_KM
+        mask &= dist <= cls.MAX_RADIUS_KM
+
+        # 4. Score
+        dist_score = np.maximum(0, 100 - (dist / cls.MAX_RADIUS_KM * 100))
+        score = dist_score * cls.WEIGHT_DISTANCE + perf * (1.0 - cls.WEIGHT_DISTANCE)
+
+        # 5. Sort by Score (Desc), stable so ties keep candidate order like list.sort
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(-score[idx], kind='stable')]
+
+        return [{
+            'courier': candidates[i],
+            'score': float(score[i]),
+            'distance': float(dist[i])
+        } for i in idx]
+
+    @classmethod
+    def _get_candidates(cls, lat, lng):
+        """
+        Fetch available couriers near the pickup point.
+        With Redis configured, the live GEO set (shared with the Go realtime-engine)
+        is the source of positions and only couriers seen in the last minute qualify.
+        On PostGIS the radius filter and distance ordering run in the DB against
+        the GiST-indexed location_geog column; elsewhere (SQLite dev) the
+        in-memory spatial index narrows the search to the grid cells within
+        MAX_RADIUS_KM, so only those rows are loaded.
+        """
+        store = get_live_location_store()
+        if store is not None:
+            try:
+                return cls._get_candidates_live(store, lat, lng)
+            except Exception as e:
+                logger.warning(f"Live location store unavailable, falling back to DB positions: {e}")
+
+        if cls._use_postgis():
+            return cls._get_candidates_postgis(lat, lng)
+
+        courier_index.ensure_fresh()
+        nearby_ids = courier_index.query_radius(lat, lng, cls.MAX_RADIUS_KM)
+        if not nearby_ids:
+            return []
+
+        return Courier.query.filter(
+            Courier.id.in_(nearby_ids),
+            Courier.is_available == True,
+            Courier.onboarding_status == 'approved' # Ensure only approved couriers
+        ).all()
+
+    @classmethod
+    def _get_candidates_near(cls, points):
+        """
+        Available couriers within MAX_RADIUS_KM of any of points, in one fetch
+        (batch allocation). Same sources as _get_candidates: one GEOSEARCH over a
+        circle covering every point's radius, one PostGIS query against the
+        points as a MULTIPOINT, or the spatial index per point and a single row
+        load. Couriers out of range of a given point are left to score_candidates.
+        """
+        if len(points) == 1:
+            return cls._get_candidates(*points[0])
+
+        store = get_live_location_store()
+        if store is not None:
+            try:
+                return cls._get_candidates_live(store, *cls._bounding_circle(points), points=points)
+            except Exception as e:
+                logger.warning(f"Live location store unavailable, falling back to DB positions: {e}")
+
+        if cls._use_postgis():
+            multipoint = ', '.join(f'({lng} {lat})' for lat, lng in points)
+            area = func.ST_GeogFromText(f'SRID=4326;MULTIPOINT({multipoint})', type_=Geography)
+            return Courier.query.filter(
+                Courier.is_available == True,
+                Courier.onboarding_status == 'approved',
+                func.ST_DWithin(Courier.location_geog, area, cls.MAX_RADIUS_KM * 1000)
+            ).all()
+
+        courier_index.ensure_fresh()
+        nearby_ids = set()
+        for lat, lng in points:
+            nearby_ids.update(courier_index.query_radius(lat, lng, cls.MAX_RADIUS_KM))
+        if not nearby_ids:
+            return []
+
+        return Courier.query.filter(
+            Courier.id.in_(list(nearby_ids)),
+            Courier.is_available == True,
+            Courier.onboarding_status == 'approved'
+        ).all()
+
+    @classmethod
+    def _bounding_circle(cls, points):
+        """(lat, lng, radius_km) of a circle containing MAX_RADIUS_KM around every point"""
+        lats, lngs = [lat for lat, _ in points], [lng for _, lng in points]
+        lat, lng = (min(lats) + max(lats)) / 2, (min(lngs) + max(lngs)) / 2
+        reach = max(cls.haversine_distance(lat, lng, p_lat, p_lng) for p_lat, p_lng in points)
+        return lat, lng, reach + cls.MAX_RADIUS_KM
+
+    @classmethod
+    def _get_candidates_live(cls, store, lat, lng, radius_km=None, points=None):
+        hits = store.search(lat, lng, radius_km or cls.MAX_RADIUS_KM)
+        if points:
+            # Keep only couriers within range of at least one of the points
+            hits = [hit for hit in hits if any(
+                cls.haversine_distance(p_lat, p_lng, hit[2], hit[3]) <= cls.MAX_RADIUS_KM for p_lat, p_lng in points)]
+        if not hits:
+            return []
+
+        positions = {courier_id: (c_lat, c_lng) for courier_id, _, c_lat, c_lng in hits}
+        candidates = Courier.query.filter(
+            Courier.id.in_(list(positions)),
+            Courier.is_available == True,
+            Courier.onboarding_status == 'approved'
+        ).all()
+
+        # Score on the live position without marking the row dirty (no DB write)
+        for courier in candidates:
+            c_lat, c_lng = positions[courier.id]
+            set_committed_value(courier, 'current_location_lat', c_lat)
+            set_committed_value(courier, 'current_location_lng', c_lng)
+        return candidates
+
+    @staticmethod
+    def _use_postgis():
+        return db.engine.dialect.name == 'postgresql'
+
+    @classmethod
+    def _get_candidates_postgis(cls, lat, lng):
+        return cls._postgis_candidate_query(lat, lng).all()
+
+    @classmethod
+    def _postgis_candidate_query(cls, lat, lng):
+        point = func.ST_GeogFromText(Courier.location_ewkt(lat, lng), type_=Geography)
+        return Courier.query.filter(
+            Courier.is_available == True,
+            Courier.onboarding_status == 'approved',
+            func.ST_DWithin(Courier.location_geog, point, cls.MAX_RADIUS_KM * 1000)
+        ).order_by(
+            Courier.location_geog.op('<->')(point) # KNN ordering, served by the GiST index
+        )
 
     @classmethod
     def _check_constraints(cls, courier: Courier, delivery: Delivery) -> bool:
         """
         Check hard constraints like vehicle type vs package size.
         """
-        # Package Size Constraints
-        # 'small' (envelope) -> Any vehicle
-        # 'medium' (box) -> Scooter, Motorcycle, Car, Van
-        # 'large' -> Car, Van
-        # 'xlarge' -> Van only
-        
-        # Vehicle Types: 'bicycle', 'scooter', 'motorcycle', 'car', 'van'
-        
-        allowed_vehicles = {
-            'small': ['bicycle', 'scooter', 'motorcycle', 'car', 'van'],
-            'medium': ['scooter', 'motorcycle', 'car', 'van'],
-            'large': ['car', 'van'],
-            'xlarge': ['van']
-        }
-
         package_size = delivery.package_size or 'small'
-        if courier.vehicle_type not in allowed_vehicles.get(package_size, []):
+        if courier.vehicle_type not in cls.ALLOWED_VEHICLES.get(package_size, []):
             return False
 
         return True
@@ -131,7 +375,7 @@ class AllocationEngine:
         
         # Performance Score (0-100)
         # Using the advanced index which includes reliability, service, and integrity.
-        perf_score = courier.performance_index or 50.0 # Default to 50 if not set
+        perf_score = courier.performance_index or cls.DEFAULT_PERFORMANCE # Default to 50 if not set
 
         final_score = (
             dist_score * cls.WEIGHT_DISTANCE +
@@ -139,3 +383,14 @@ class AllocationEngine:
         )
 
         return final_score
+
+    @classmethod
+    def _calculate_eta_score(cls, courier: Courier, eta_min: float) -> float:
+        """Same weighting as _calculate_score, with road ETA in place of straight-line distance."""
+        eta_score = max(0, 100 - (eta_min / cls.MAX_ETA_MIN * 100))
+        perf_score = courier.performance_index or cls.DEFAULT_PERFORMANCE
+
+        return (
+            eta_score * cls.WEIGHT_DISTANCE +
+            perf_score * (1.0 - cls.WEIGHT_DISTANCE)
+        )
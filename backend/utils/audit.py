@@ -1,11 +1,19 @@
-from flask import request
-from models import db, AuditLog
-import traceback
+from flask import current_app, has_request_context, request
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models import db, AuditLog, AuditCheckpoint
+from utils.audit_chain import AuditChain
+import atexit
 import json
 import logging
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Setup JSON Logger (Simulating ELK/Splunk forwarder source)
 LOG_DIR = os.path.join(os.getcwd(), 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -15,46 +23,180 @@ file_handler = logging.FileHandler(os.path.join(LOG_DIR, 'security.json'))
 file_handler.setFormatter(logging.Formatter('%(message)s'))
 json_logger.addHandler(file_handler)
 
-def log_audit(action, user_id=None, resource_type=None, resource_id=None, status='SUCCESS', details=None):
+
+class AuditSink:
+    """
+    Non-blocking audit trail. log_audit() only builds the entry and puts it on
+    a bounded queue; a background writer drains it in batches, chaining the
+    AuditLog rows (see AuditChain) and inserting them with one executemany on
+    its own Session (never the caller's transaction), then appending the JSON
+    lines with a single write. A retried batch is re-linked to the new chain head.
+
+    Back-pressure: when MAX_PENDING entries are waiting, producers block up to
+    PUT_TIMEOUT_SECONDS; past that the entry goes straight to the JSON log and
+    is counted as dropped from the DB. Whatever is queued at exit is flushed.
+    """
+
+    MAX_PENDING = 10000
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL_SECONDS = 0.5
+    PUT_TIMEOUT_SECONDS = 0.5
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.stats = {'submitted': 0, 'written': 0, 'batches': 0, 'write_errors': 0, 'dropped': 0}
+
+    def submit(self, app, entry):
+        """Queue one entry (a dict of AuditLog columns) for app's database."""
+        self._start()
+        try:
+            self._queue.put((app, entry), timeout=self.PUT_TIMEOUT_SECONDS)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logger.error(f"Audit queue full, {entry['action']} written to the JSON log only")
+            json_logger.info(_json_line(entry))
+            return
+        self.stats['submitted'] += 1
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=5.0):
+        """
+        Write everything queued so far, from the calling thread if need be, and
+        wait for the batch the writer may be holding. Returns False on timeout.
+        """
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                break
+            self._write_batch(batch)
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        """Stop the writer and flush what is left (registered with atexit)."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush(timeout)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write_batch(batch)
+
+    def _take(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.FLUSH_INTERVAL_SECONDS if block else None))
+            while len(batch) < self.BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            self._write(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch):
+        by_app = {}
+        for app, entry in batch:
+            by_app.setdefault(app, []).append(entry)
+
+        for app, entries in by_app.items():
+            for attempt in range(1, self.MAX_ATTEMPTS + 1):
+                try:
+                    with app.app_context(), Session(db.engine) as session:
+                        checkpoints = AuditChain.link(session, entries)
+                        session.execute(insert(AuditLog), entries)
+                        if checkpoints:
+                            session.execute(insert(AuditCheckpoint), checkpoints)
+                        session.commit()
+                    self.stats['written'] += len(entries)
+                    break
+                except Exception as e:
+                    self.stats['write_errors'] += 1
+                    if attempt == self.MAX_ATTEMPTS:
+                        self.stats['dropped'] += len(entries)
+                        logger.error(f"Failed to write {len(entries)} audit rows, kept in the JSON log only: {e}")
+                    else:
+                        time.sleep(0.1 * attempt)
+            # The JSON trail gets every entry, whether or not the DB insert made it
+            json_logger.info('\n'.join(_json_line(entry) for entry in entries))
+        self.stats['batches'] += 1
+
+
+def _json_line(entry):
+    # For Splunk/ELK
+    return json.dumps({
+        'timestamp': entry['timestamp'].isoformat(),
+        'action': entry['action'],
+        'user_id': entry['user_id'],
+        'ip_address': entry['ip_address'],
+        'status': entry['status'],
+        'resource': f"{entry['resource_type']}:{entry['resource_id']}" if entry['resource_type'] else None,
+        'details': entry['details']
+    })
+
+
+audit_sink = AuditSink()
+
+
+def log_audit(action, user_id=None, resource_type=None, resource_id=None, status='SUCCESS', details=None,
+              ip_address=None):
     """
     Records an audit log entry for security and compliance.
-    Writes to BOTH Database and JSON Log File.
+    Writes to BOTH Database and JSON Log File, in the background (see AuditSink):
+    the caller's session is never flushed or committed.
+    Background jobs pass the ip_address captured from the original request.
     """
     try:
         # Attempt to get IP address
-        if request:
+        if ip_address:
+            pass
+        elif has_request_context():
             ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
         else:
             ip_address = 'SYSTEM'
-            
-        # 1. DB Log
-        log_entry = AuditLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=str(resource_id) if resource_id else None,
-            ip_address=ip_address,
-            status=status,
-            details=str(details) if details else None
-        )
-        db.session.add(log_entry)
-        db.session.commit()
-        
-        # 2. JSON Log (for Splunk/ELK)
-        log_data = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'action': action,
+
+        audit_sink.submit(current_app._get_current_object(), {
             'user_id': user_id,
+            'action': action,
+            'resource_type': resource_type,
+            'resource_id': str(resource_id) if resource_id else None,
             'ip_address': ip_address,
             'status': status,
-            'resource': f"{resource_type}:{resource_id}" if resource_type else None,
-            'details': details
-        }
-        json_logger.info(json.dumps(log_data))
+            'details': str(details) if details else None,
+            'timestamp': datetime.utcnow()
+        })
 
     except Exception as e:
-        print(f"⚠️ Failed to write audit log: {e}")
-        traceback.print_exc()
+        logger.error(f"Failed to queue audit log: {e}", exc_info=True)
 
 def scan_file_virus(file_stream) -> bool:
     """
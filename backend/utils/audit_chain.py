@@ -0,0 +1,190 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+
+from sqlalchemy import func, select, text
+
+logger = logging.getLogger(__name__)
+
+
+class AuditChain:
+    """
+    Tamper-evident audit trail. Every AuditLog row gets a gap-free `seq`, the
+    previous row's digest, and digest = HMAC-SHA256(prev_digest + content), so
+    editing a row breaks its own digest, and deleting or inserting one breaks
+    the sequence or the next row's link. Without the key a chain can't be
+    re-forged after the fact.
+
+    Every CHECKPOINT_INTERVAL rows the chain head is stored, signed, in
+    audit_checkpoints; verify() of a range starts from the nearest one.
+    Rows written before chaining was introduced have no seq and are skipped.
+    Months archived by the retention job (utils/partitions.py) take the start
+    of the chain with them; a full verify() begins at the oldest row kept.
+
+    The key is AUDIT_CHAIN_KEY, or DIGITAL_SIGNATURE_KEY when that isn't set.
+    With neither, rows are stored unchained rather than signed with a key
+    anyone can read in the source; see enabled().
+    """
+
+    GENESIS = '0' * 64
+    CHECKPOINT_INTERVAL = 10000
+    VERIFY_BATCH = 10000
+    PG_LOCK_KEY = 0x417564  # pg_advisory_xact_lock: one chain writer at a time across workers
+    FIELDS = ('seq', 'user_id', 'action', 'resource_type', 'resource_id', 'ip_address', 'status', 'details',
+              'timestamp')
+
+    _key = (os.environ.get('AUDIT_CHAIN_KEY') or os.environ.get('DIGITAL_SIGNATURE_KEY') or '').encode('utf-8') or None
+    _reported = False
+
+    @classmethod
+    def enabled(cls):
+        """Whether a chain key is configured; logs an error (once) when it isn't."""
+        if cls._key is None and not cls._reported:
+            cls._reported = True
+            logger.error("Neither AUDIT_CHAIN_KEY nor DIGITAL_SIGNATURE_KEY is set: "
+                         "audit rows are stored without the hash chain")
+        return cls._key is not None
+
+    @classmethod
+    def row_digest(cls, prev_digest, seq, user_id, action, resource_type, resource_id, ip_address, status,
+                   details, timestamp):
+        # Unit/record separators keep fields unambiguous; \x00 marks NULL
+        content = '\x1f'.join('\x00' if v is None else (v.isoformat() if hasattr(v, 'isoformat') else str(v))
+                              for v in (seq, user_id, action, resource_type, resource_id, ip_address, status,
+                                        details, timestamp))
+        return hmac.digest(cls._key, f"{prev_digest}\x1e{content}".encode('utf-8'), hashlib.sha256).hex()
+
+    @classmethod
+    def checkpoint_signature(cls, seq, digest):
+        return hmac.digest(cls._key, f"checkpoint\x1e{seq}\x1e{digest}".encode('utf-8'), hashlib.sha256).hex()
+
+    @classmethod
+    def link(cls, session, entries):
+        """
+        Fill seq / prev_digest / digest on new AuditLog column dicts (in order)
+        from the current chain head. Returns the checkpoint rows they complete.
+        Call inside the inserting transaction; a concurrent writer that got
+        there first makes the insert fail on the unique seq, and the caller retries.
+        Without a key the entries are left unchained (seq NULL, like pre-chain rows).
+        """
+        from models import AuditLog
+
+        if not cls.enabled():
+            return []
+        if session.get_bind().dialect.name == 'postgresql':
+            session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': cls.PG_LOCK_KEY})
+        head = session.execute(
+            select(AuditLog.seq, AuditLog.digest).where(AuditLog.seq.isnot(None)).order_by(AuditLog.seq.desc()).limit(1)
+        ).first()
+        seq, prev = (head.seq, head.digest) if head else (0, cls.GENESIS)
+
+        checkpoints = []
+        for entry in entries:
+            seq += 1
+            entry['seq'] = seq
+            entry['prev_digest'] = prev
+            entry['digest'] = prev = cls.row_digest(prev, *(entry[f] for f in cls.FIELDS))
+            if seq % cls.CHECKPOINT_INTERVAL == 0:
+                checkpoints.append({'seq': seq, 'digest': prev, 'signature': cls.checkpoint_signature(seq, prev)})
+        return checkpoints
+
+    @classmethod
+    def verify(cls, session, start_seq=None, end_seq=None):
+        """
+        Stream rows start_seq..end_seq (inclusive) and check every link.
+        Without start_seq, checks from the oldest retained row: from genesis
+        when nothing was archived, otherwise anchored on a checkpoint right
+        before it or, failing that, on the row's own prev_digest.
+        Returns {'ok', 'rows', 'checked_from', 'first_bad_seq', 'error', 'seconds', 'rows_per_sec'}.
+        """
+        from models import AuditLog, AuditCheckpoint
+
+        started = time.perf_counter()
+        result = {'ok': True, 'rows': 0, 'checked_from': 1, 'first_bad_seq': None, 'error': None}
+
+        def fail(seq, error):
+            result.update(ok=False, first_bad_seq=seq, error=error)
+
+        if not cls.enabled():
+            fail(None, 'no audit chain key configured (AUDIT_CHAIN_KEY)')
+            return cls._finish(result, started)
+
+        anchor = None
+        if start_seq is None:
+            first = session.execute(
+                select(AuditLog.seq, AuditLog.prev_digest).where(AuditLog.seq.isnot(None))
+                .order_by(AuditLog.seq).limit(1)
+            ).first()
+            start_seq = first.seq if first else 1
+            if first and first.seq > 1:
+                anchor = (first.seq, first.prev_digest)
+
+        # Resume from the closest signed checkpoint before the range
+        checkpoint = session.execute(
+            select(AuditCheckpoint).where(AuditCheckpoint.seq < start_seq).order_by(AuditCheckpoint.seq.desc()).limit(1)
+        ).scalar()
+        expected_seq, prev = 1, cls.GENESIS
+        if anchor is not None and (checkpoint is None or checkpoint.seq < anchor[0] - 1):
+            checkpoint, (expected_seq, prev) = None, anchor
+        if checkpoint is not None:
+            if not hmac.compare_digest(checkpoint.signature, cls.checkpoint_signature(checkpoint.seq, checkpoint.digest)):
+                fail(checkpoint.seq, 'checkpoint signature mismatch')
+                return cls._finish(result, started)
+            expected_seq, prev = checkpoint.seq + 1, checkpoint.digest
+        result['checked_from'] = expected_seq
+
+        # Checkpoints inside the range must agree with the chain as it is now
+        cp_query = select(AuditCheckpoint.seq, AuditCheckpoint.digest, AuditCheckpoint.signature).where(
+            AuditCheckpoint.seq >= expected_seq)
+        if end_seq is not None:
+            cp_query = cp_query.where(AuditCheckpoint.seq <= end_seq)
+        checkpoints = {seq: (digest, signature) for seq, digest, signature in session.execute(cp_query)}
+
+        columns = [getattr(AuditLog, f) for f in cls.FIELDS] + [AuditLog.prev_digest, AuditLog.digest]
+        query = select(*columns).where(AuditLog.seq >= expected_seq).order_by(AuditLog.seq)
+        if end_seq is not None:
+            query = query.where(AuditLog.seq <= end_seq)
+
+        row_digest, compare = cls.row_digest, hmac.compare_digest
+        rows = session.execute(query.execution_options(yield_per=cls.VERIFY_BATCH))
+        for row in rows:
+            seq = row[0]
+            if seq != expected_seq:
+                fail(expected_seq, f"rows {expected_seq}..{seq - 1} missing")
+                break
+            if row[-2] != prev:
+                fail(seq, 'broken link to the previous row')
+                break
+            digest = row_digest(prev, *row[:-2])
+            if not compare(digest, row[-1] or ''):
+                fail(seq, 'row content does not match its digest')
+                break
+            if seq in checkpoints:
+                cp_digest, signature = checkpoints[seq]
+                if cp_digest != digest or not compare(signature, cls.checkpoint_signature(seq, cp_digest)):
+                    fail(seq, 'checkpoint does not match the chain')
+                    break
+            prev, expected_seq = digest, seq + 1
+            result['rows'] += 1
+        rows.close()
+
+        # A signed checkpoint past the last row means the tail was cut off
+        unreached = [seq for seq in checkpoints if seq >= expected_seq]
+        if result['ok'] and unreached:
+            fail(expected_seq, f"chain ends before checkpoint {min(unreached)}")
+        if result['ok'] and end_seq is not None and expected_seq <= end_seq:
+            last = session.execute(select(func.max(AuditLog.seq))).scalar() or 0
+            if last > end_seq:
+                fail(expected_seq, f"rows {expected_seq}..{end_seq} missing")
+        return cls._finish(result, started)
+
+    @staticmethod
+    def _finish(result, started):
+        seconds = time.perf_counter() - started
+        result['seconds'] = round(seconds, 3)
+        result['rows_per_sec'] = int(result['rows'] / seconds) if seconds > 0 else 0
+        level = logging.INFO if result['ok'] else logging.ERROR
+        logger.log(level, f"Audit chain verification: {result}")
+        return result
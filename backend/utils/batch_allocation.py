@@ -0,0 +1,238 @@
+import logging
+import threading
+from sqlalchemy import func
+from models import Delivery, db
+from utils.allocation_engine import AllocationEngine
+from utils.delivery_state import TransitionError, delivery_state
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # SciPy is in requirements; without it solve_assignment falls back to pure Python
+    linear_sum_assignment = None
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('assigned', 'picked_up', 'in_transit')
+
+
+def solve_assignment(cost):
+    """
+    Hungarian algorithm (Kuhn-Munkres) for a rectangular cost matrix with
+    rows <= columns. Returns a list where result[row] is the chosen column.
+    Uses SciPy when installed, otherwise a pure-Python O(rows^2 * columns) solver.
+    """
+    n = len(cost)
+    if n == 0:
+        return []
+    m = len(cost[0])
+    if n > m:
+        raise ValueError("cost matrix must have at least as many columns as rows")
+
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+        result = [None] * n
+        for r, c in zip(rows, cols):
+            result[r] = int(c)
+        return result
+
+    INF = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)    # p[col] = row matched to col (1-based, 0 = free)
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            delta = INF
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    result = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+class BatchAllocationEngine:
+    """
+    Assigns all pending, unassigned deliveries in one global optimization.
+    Each courier contributes one column per free capacity slot, every delivery
+    is a row, and the cost of a cell is (100 - AllocationEngine score). Rows also
+    get a private "unassigned" column so deliveries with no feasible courier stay pending.
+    Only each delivery's top-K couriers become columns, which keeps the matrix
+    small without changing the optimum in practice.
+    """
+
+    BATCH_LIMIT = 200
+    # The pure-Python solver runs while the batch's rows are locked: keep it small
+    FALLBACK_BATCH_LIMIT = 50
+    CANDIDATES_PER_DELIVERY = 10
+    UNASSIGNED_COST = 1000.0
+    INFEASIBLE_COST = 1e9
+
+    @classmethod
+    def allocate_pending(cls, limit=None):
+        """
+        Allocate pending deliveries. All assignments are committed in a single
+        transaction. Returns a list of (delivery, courier) pairs that were assigned.
+        """
+        if not limit:
+            limit = cls.BATCH_LIMIT if linear_sum_assignment is not None else cls.FALLBACK_BATCH_LIMIT
+        deliveries = Delivery.query.filter(
+            Delivery.status == 'pending',
+            Delivery.courier_id.is_(None)
+        ).order_by(Delivery.created_at).limit(limit).with_for_update(skip_locked=True).all()
+
+        # Only deliveries we can locate take part in the optimization
+        located = []
+        for d in deliveries:
+            address = d.pickup_point.address if d.pickup_point else None
+            if address and address.latitude and address.longitude:
+                located.append((d, address.latitude, address.longitude))
+        if not located:
+            db.session.rollback()
+            return []
+
+        # 1. Candidate couriers near any pickup, fetched once for the whole batch
+        couriers = AllocationEngine._get_candidates_near(list(dict.fromkeys((lat, lng) for _, lat, lng in located)))
+        if not couriers:
+            db.session.rollback()
+            return []
+
+        # 2. Score every delivery against the nearby couriers, keep its top-K,
+        #    then re-score the whole short lists on road ETA (one matrix for the
+        #    whole batch), so every cell of a row is on the same scale
+        ranked_lists = [
+            AllocationEngine.score_candidates(couriers, delivery, lat, lng)[:cls.CANDIDATES_PER_DELIVERY]
+            for delivery, lat, lng in located
+        ]
+        ranked_lists = AllocationEngine.rerank_by_eta(ranked_lists, [(lat, lng) for _, lat, lng in located],
+                                                      k=cls.CANDIDATES_PER_DELIVERY)
+
+        row_scores = []
+        shortlisted = {}
+        for ranked in ranked_lists:
+            row_scores.append({r['courier'].id: r['score'] for r in ranked})
+            for r in ranked:
+                shortlisted.setdefault(r['courier'].id, [r['courier'], 0])[1] += 1
+
+        # 3. Free capacity per courier (one grouped query)
+        active_counts = dict(db.session.query(Delivery.courier_id, func.count(Delivery.id)).filter(
+            Delivery.courier_id.in_(list(shortlisted)),
+            Delivery.status.in_(ACTIVE_STATUSES)
+        ).group_by(Delivery.courier_id).all()) if shortlisted else {}
+
+        slots = []  # column -> courier
+        for courier_id, (courier, rows) in shortlisted.items():
+            free = (courier.max_capacity or 1) - active_counts.get(courier_id, 0)
+            # A courier never needs more slots than the deliveries it is shortlisted for
+            slots.extend([courier] * max(0, min(free, rows)))
+        if not slots:
+            db.session.rollback()
+            return []
+
+        # Cost matrix from the existing score function
+        n = len(located)
+        cost = []
+        for row, scores in enumerate(row_scores):
+            cells = [100.0 - scores[c.id] if c.id in scores else cls.INFEASIBLE_COST for c in slots]
+            unassigned = [cls.INFEASIBLE_COST] * n
+            unassigned[row] = cls.UNASSIGNED_COST
+            cost.append(cells + unassigned)
+
+        # 4. Solve globally and apply in one transaction (history rows and
+        #    order_update events come from the state machine)
+        assignment = solve_assignment(cost)
+        assigned = []
+        for row, col in enumerate(assignment):
+            if col is None or col >= len(slots):
+                continue
+            delivery, courier = located[row][0], slots[col]
+            try:
+                delivery_state.transition(delivery.id, 'assigned', expected='pending', unassigned=True,
+                                          courier_id=courier.id)
+            except TransitionError as e:
+                logger.info(f"Batch allocation skipped {delivery.order_number}: {e}")
+                continue
+            assigned.append((delivery, courier))
+
+        db.session.commit()
+        logger.info(f"Batch allocation: assigned {len(assigned)} of {n} pending deliveries")
+
+        cls._notify(assigned)
+        return assigned
+
+    @staticmethod
+    def _notify(assigned):
+        from extensions import socketio
+        for delivery, courier in assigned:
+            try:
+                socketio.emit('new_assignment', {
+                    'order_id': delivery.id,
+                    'order_number': delivery.order_number,
+                    'pickup_address': delivery.pickup_point.address.street,
+                    'delivery_address': delivery.delivery_point.address.street,
+                    'package_size': delivery.package_size,
+                    'notes': delivery.notes
+                }, room=f"courier_{courier.id}")
+            except Exception as e:
+                logger.warning(f"Socket error notify courier: {e}")
+
+
+# Debounced trigger so a burst of orders is allocated together
+BATCH_WINDOW_SECONDS = 2.0
+_scheduled = threading.Event()
+
+
+def schedule_batch_allocation(app):
+    """Run allocate_pending once after a short window, coalescing repeated calls."""
+    if _scheduled.is_set():
+        return
+    _scheduled.set()
+
+    from extensions import socketio
+
+    def run():
+        socketio.sleep(BATCH_WINDOW_SECONDS)
+        _scheduled.clear()
+        with app.app_context():
+            try:
+                BatchAllocationEngine.allocate_pending()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Batch allocation failed: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    socketio.start_background_task(run)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from math import cos, radians, floor
+
+logger = logging.getLogger(__name__)
+
+
+class CourierSpatialIndex:
+    """
+    Process-local grid index of available courier positions.
+    Couriers are bucketed into fixed-size lat/lng cells so a radius query only
+    visits the cells overlapping the search circle instead of the whole table.
+    The index is a pre-filter: callers must still re-check the DB row.
+    """
+
+    # Cell size in degrees (~5.5km of latitude)
+    CELL_SIZE_DEG = 0.05
+    KM_PER_DEG_LAT = 111.32
+    # Full rebuild from DB so updates made by other workers are picked up
+    REFRESH_SECONDS = 60
+
+    def __init__(self, cell_size_deg=None, refresh_seconds=None):
+        self.cell_size = cell_size_deg or self.CELL_SIZE_DEG
+        self.refresh_seconds = self.REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._lock = threading.Lock()
+        self._cells = {}      # (row, col) -> set(courier_id)
+        self._positions = {}  # courier_id -> (lat, lng, cell)
+        self._loaded_at = None
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_size), floor(lng / self.cell_size))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, courier_id):
+        return courier_id in self._positions
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def upsert(self, courier_id, lat, lng):
+        """Insert or move a courier. A missing position removes it."""
+        if lat is None or lng is None:
+            self.remove(courier_id)
+            return
+
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._positions.get(courier_id)
+            if previous and previous[2] != cell:
+                self._discard(courier_id, previous[2])
+            self._cells.setdefault(cell, set()).add(courier_id)
+            self._positions[courier_id] = (lat, lng, cell)
+
+    def update_location(self, courier_id, lat, lng):
+        """Move a courier that is already indexed (i.e. currently available)."""
+        if courier_id in self._positions and lat is not None and lng is not None:
+            self.upsert(courier_id, lat, lng)
+
+    def remove(self, courier_id):
+        with self._lock:
+            previous = self._positions.pop(courier_id, None)
+            if previous:
+                self._discard(courier_id, previous[2])
+
+    def _discard(self, courier_id, cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(courier_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def sync(self, courier):
+        """Reflect a Courier row's availability/position after it was committed."""
+        if courier.is_available and courier.onboarding_status == 'approved':
+            self.upsert(courier.id, courier.current_location_lat, courier.current_location_lng)
+        else:
+            self.remove(courier.id)
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._positions = {}
+            self._loaded_at = None
+
+    def load(self, rows):
+        """Replace the index contents with (courier_id, lat, lng) rows."""
+        cells = {}
+        positions = {}
+        for courier_id, lat, lng in rows:
+            if lat is None or lng is None:
+                continue
+            cell = self._cell(lat, lng)
+            cells.setdefault(cell, set()).add(courier_id)
+            positions[courier_id] = (lat, lng, cell)
+
+        with self._lock:
+            self._cells = cells
+            self._positions = positions
+            self._loaded_at = time.monotonic()
+
+    def rebuild(self):
+        """Load all available, approved couriers (id + position columns only)."""
+        from models import db, Courier
+
+        rows = db.session.query(
+            Courier.id, Courier.current_location_lat, Courier.current_location_lng
+        ).filter(
+            Courier.is_available == True,
+            Courier.onboarding_status == 'approved',
+            Courier.current_location_lat.isnot(None),
+            Courier.current_location_lng.isnot(None)
+        ).all()
+        self.load(rows)
+        logger.info(f"Courier index rebuilt with {len(self._positions)} couriers")
+
+    def ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def query_radius(self, lat, lng, radius_km):
+        """
+        Return ids of couriers in the cells overlapping the radius around (lat, lng).
+        Results are a superset of the couriers inside the circle; exact distance
+        filtering is left to the caller.
+        """
+        lat_span = radius_km / self.KM_PER_DEG_LAT
+        lng_span = radius_km / (self.KM_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+
+        min_row, min_col = self._cell(lat - lat_span, lng - lng_span)
+        max_row, max_col = self._cell(lat + lat_span, lng + lng_span)
+
+        result = []
+        with self._lock:
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    bucket = self._cells.get((row, col))
+                    if bucket:
+                        result.extend(bucket)
+        return result
+
+
+# Shared per-process instance
+courier_index = CourierSpatialIndex()
@@ -0,0 +1,47 @@
+import csv
+import io
+import logging
+from urllib.parse import quote
+
+from flask import Response, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 500
+
+
+def csv_response(rows, filename, chunk_rows=CHUNK_ROWS):
+    """
+    Stream an iterable of CSV rows (header first) as a UTF-8-with-BOM download,
+    so Excel opens Hebrew text correctly. Rows are encoded chunk_rows at a time;
+    nothing is held in memory beyond the current chunk, and the request (with its
+    DB session) stays open until the last row is sent.
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        yield '\ufeff'.encode('utf-8')  # BOM, as utf-8-sig would write
+        pending = 0
+        try:
+            for row in rows:
+                writer.writerow(row)
+                pending += 1
+                if pending >= chunk_rows:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+        except Exception as e:
+            # Headers are already sent; all we can do is stop and leave a trace
+            logger.error(f"CSV export {filename} aborted: {e}", exc_info=True)
+            raise
+        if pending:
+            yield buffer.getvalue().encode('utf-8')
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    if filename.isascii():
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    else:
+        # Hebrew names: headers must be latin-1, so use the RFC 5987 form
+        response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
@@ -0,0 +1,268 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class DailyRollup:
+    """
+    Per-day aggregates behind the dashboard and revenue reports, so they read a
+    few hundred rollup rows instead of grouping the full deliveries/invoices
+    tables on every request:
+
+        daily_order_stats    deliveries by creation day and current status (+ invoiced total)
+        daily_revenue_stats  invoices by issue day and invoice status
+        daily_courier_stats  deliveries per courier and creation day
+
+    A day is recomputed from the base tables with range predicates (index-friendly,
+    no date() on the filtered column) when it is known to have changed: ORM
+    commits in this process mark their days immediately, and a periodic scan of
+    deliveries.updated_at catches Core updates and other processes.
+
+    Refreshes write and commit through their own session: a reader called from a
+    request handler never flushes or commits the request's unit of work.
+    """
+
+    REFRESH_SECONDS = 60
+    # A transaction can stamp updated_at before our scan and commit after it:
+    # re-read a little behind the watermark so it isn't missed
+    WATERMARK_OVERLAP = timedelta(minutes=2)
+    REBUILD_CHUNK_DAYS = 31
+    ACTIVE_STATUSES = ('pending', 'assigned', 'picked_up', 'in_transit')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._dirty = set()
+            self.checked_at = None   # deliveries.updated_at watermark (UTC)
+            self.scanned_at = None   # monotonic time of the last watermark scan
+
+    def mark_dirty(self, days):
+        with self._lock:
+            self._dirty.update(days)
+
+    def ensure_fresh(self):
+        scan = self.scanned_at is None or time.monotonic() - self.scanned_at > self.REFRESH_SECONDS
+        if scan or self._dirty:
+            self.refresh(scan=scan)
+
+    def refresh(self, scan=True):
+        """Recompute dirty days and (with scan) days of deliveries updated since the watermark. Commits."""
+        from models import db, Delivery, DailyOrderStats
+
+        with self._lock, Session(db.engine) as session:
+            started = datetime.utcnow()
+            days, self._dirty = self._dirty, set()
+            try:
+                if scan:
+                    if self.checked_at is None:
+                        self.checked_at = session.query(func.max(DailyOrderStats.refreshed_at)).scalar()
+                    if self.checked_at is None:
+                        self.rebuild(session)
+                        self._scanned(started)
+                        return
+                    changed = session.query(self._day(Delivery.created_at)).filter(
+                        Delivery.updated_at >= self.checked_at - self.WATERMARK_OVERLAP
+                    ).distinct()
+                    days.update(day for (day,) in changed if day is not None)
+                for start, end in self._ranges(days):
+                    self._recompute(session, start, end, started)
+                session.commit()
+            except IntegrityError:
+                # Another worker rewrote the same days concurrently; try again next time
+                session.rollback()
+                self._dirty |= days
+                logger.warning(f"Daily rollup refresh of {len(days)} days collided, will retry")
+                return
+            except Exception:
+                session.rollback()
+                self._dirty |= days
+                raise
+            if scan:
+                self._scanned(started)
+            if days:
+                logger.debug(f"Daily rollup refreshed {len(days)} days")
+
+    def _scanned(self, started):
+        self.checked_at = started
+        self.scanned_at = time.monotonic()
+
+    def rebuild(self, session=None):
+        """Recompute every day from the first delivery/invoice to today, a month per transaction."""
+        from models import db, Delivery, Invoice, DailyOrderStats, DailyRevenueStats, DailyCourierStats
+
+        session = session or db.session
+        first = [d for d in (session.query(func.min(Delivery.created_at)).scalar(),
+                             session.query(func.min(Invoice.issue_date)).scalar()) if d is not None]
+        for model in (DailyOrderStats, DailyRevenueStats, DailyCourierStats):
+            session.query(model).delete(synchronize_session=False)
+        session.commit()
+        if not first:
+            return 0
+
+        started = datetime.utcnow()
+        day, end = min(first).date(), started.date() + timedelta(days=1)
+        total = (end - day).days
+        while day < end:
+            chunk_end = min(day + timedelta(days=self.REBUILD_CHUNK_DAYS), end)
+            self._recompute(session, day, chunk_end, started)
+            session.commit()
+            day = chunk_end
+        logger.info(f"Daily rollup rebuilt {total} days")
+        return total
+
+    @staticmethod
+    def _day(column):
+        from models import db
+        return func.date(column, type_=db.Date)
+
+    @staticmethod
+    def _ranges(days):
+        """Sorted days -> [(start, end_exclusive)] of consecutive runs"""
+        ranges = []
+        for day in sorted(days):
+            if ranges and ranges[-1][1] == day:
+                ranges[-1][1] = day + timedelta(days=1)
+            else:
+                ranges.append([day, day + timedelta(days=1)])
+        return [tuple(r) for r in ranges]
+
+    @classmethod
+    def _recompute(cls, session, start, end, refreshed_at):
+        """Replace rollup rows for days in [start, end)"""
+        from models import db, Delivery, Invoice, DailyOrderStats, DailyRevenueStats, DailyCourierStats
+
+        start_at, end_at = datetime(start.year, start.month, start.day), datetime(end.year, end.month, end.day)
+
+        day = cls._day(Delivery.created_at)
+        orders = session.query(
+            day, Delivery.status, func.count(Delivery.id), func.coalesce(func.sum(Invoice.total_amount), 0)
+        ).outerjoin(Invoice, Invoice.delivery_id == Delivery.id).filter(
+            Delivery.created_at >= start_at, Delivery.created_at < end_at
+        ).group_by(day, Delivery.status)
+        order_rows = [{'day': d, 'status': status, 'orders': n, 'invoiced_amount': amount,
+                       'refreshed_at': refreshed_at} for d, status, n, amount in orders]
+
+        courier_day = cls._day(Delivery.created_at)
+        couriers = session.query(
+            courier_day, Delivery.courier_id, func.count(Delivery.id),
+            func.sum(db.case((Delivery.status == 'delivered', 1), else_=0)),
+            func.coalesce(func.sum(Delivery.delivery_fee), 0)
+        ).filter(
+            Delivery.created_at >= start_at, Delivery.created_at < end_at, Delivery.courier_id.isnot(None)
+        ).group_by(courier_day, Delivery.courier_id)
+        courier_rows = [{'day': d, 'courier_id': courier_id, 'deliveries': n, 'delivered': delivered, 'fees': fees}
+                        for d, courier_id, n, delivered, fees in couriers]
+
+        issue_day = cls._day(Invoice.issue_date)
+        revenue = session.query(
+            issue_day, Invoice.status, func.count(Invoice.id), func.coalesce(func.sum(Invoice.total_amount), 0)
+        ).filter(
+            Invoice.issue_date >= start_at, Invoice.issue_date < end_at
+        ).group_by(issue_day, Invoice.status)
+        revenue_rows = [{'day': d, 'status': status, 'invoices': n, 'amount': amount}
+                        for d, status, n, amount in revenue]
+
+        for model, rows in ((DailyOrderStats, order_rows), (DailyCourierStats, courier_rows),
+                            (DailyRevenueStats, revenue_rows)):
+            session.query(model).filter(model.day >= start, model.day < end).delete(synchronize_session=False)
+            if rows:
+                session.execute(insert(model), rows)
+
+    # --- Readers (half-open day ranges; None = unbounded) ---
+
+    def orders_by_status(self, start=None, end=None):
+        """{status: {'orders': n, 'invoiced': amount}} for deliveries created in [start, end)"""
+        from models import db, DailyOrderStats
+
+        self.ensure_fresh()
+        query = db.session.query(
+            DailyOrderStats.status, func.sum(DailyOrderStats.orders), func.sum(DailyOrderStats.invoiced_amount)
+        )
+        query = self._in_range(query, DailyOrderStats, start, end).group_by(DailyOrderStats.status)
+        return {status: {'orders': int(n or 0), 'invoiced': float(amount or 0)} for status, n, amount in query}
+
+    def revenue_by_day(self, start, end, statuses):
+        """{day: {'invoices': n, 'amount': amount}} for invoices issued in [start, end) with one of statuses"""
+        from models import db, DailyRevenueStats
+
+        self.ensure_fresh()
+        query = db.session.query(
+            DailyRevenueStats.day, func.sum(DailyRevenueStats.invoices), func.sum(DailyRevenueStats.amount)
+        ).filter(DailyRevenueStats.status.in_(statuses))
+        query = self._in_range(query, DailyRevenueStats, start, end).group_by(DailyRevenueStats.day)
+        return {day: {'invoices': int(n or 0), 'amount': float(amount or 0)}
+                for day, n, amount in query.order_by(DailyRevenueStats.day)}
+
+    def courier_totals(self, start=None, end=None):
+        """{courier_id: {'deliveries', 'delivered', 'fees'}} for deliveries created in [start, end)"""
+        from models import db, DailyCourierStats
+
+        self.ensure_fresh()
+        query = db.session.query(
+            DailyCourierStats.courier_id, func.sum(DailyCourierStats.deliveries),
+            func.sum(DailyCourierStats.delivered), func.sum(DailyCourierStats.fees)
+        )
+        query = self._in_range(query, DailyCourierStats, start, end).group_by(DailyCourierStats.courier_id)
+        return {courier_id: {'deliveries': int(n or 0), 'delivered': int(delivered or 0), 'fees': float(fees or 0)}
+                for courier_id, n, delivered, fees in query}
+
+    @staticmethod
+    def _in_range(query, model, start, end):
+        if start is not None:
+            query = query.filter(model.day >= start)
+        if end is not None:
+            query = query.filter(model.day < end)
+        return query
+
+
+daily_rollup = DailyRollup()
+
+
+# Days touched by ORM writes, applied once the transaction commits
+@event.listens_for(Session, 'after_flush')
+def _collect_dirty_days(session, flush_context):
+    from models import Delivery, Invoice
+
+    def stamp_of(obj, name):
+        # Deleted rows can't be reloaded, so only read what the instance already holds
+        if name in obj.__dict__ or obj in session.deleted:
+            return obj.__dict__.get(name)
+        return getattr(obj, name)
+
+    days = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Delivery):
+            stamp = stamp_of(obj, 'created_at')
+        elif isinstance(obj, Invoice):
+            stamp = stamp_of(obj, 'issue_date')
+            # Its delivery's day carries the invoiced total
+            delivery = obj.__dict__.get('delivery')
+            if delivery is not None and delivery.__dict__.get('created_at') is not None:
+                days.add(delivery.created_at.date())
+        else:
+            continue
+        days.add((stamp or datetime.utcnow()).date())
+    if days:
+        session.info.setdefault('rollup_days', set()).update(days)
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_committed_days(session):
+    days = session.info.pop('rollup_days', None)
+    if days:
+        daily_rollup.mark_dirty(days)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_days(session):
+    session.info.pop('rollup_days', None)
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('assigned', 'picked_up', 'in_transit')
+
+
+def status_delta(old_status, new_status, n=1):
+    """
+    Counter changes for n deliveries moving old_status -> new_status
+    (None on either side for an insert or delete).
+    """
+    delta = Counter()
+    if old_status is None or new_status is None:
+        delta['orders_total'] += n if old_status is None else -n
+    for status, sign in ((old_status, -n), (new_status, n)):
+        if status == 'pending':
+            delta['orders_pending'] += sign
+        elif status in ACTIVE_STATUSES:
+            delta['orders_active'] += sign
+        elif status == 'delivered':
+            delta['orders_delivered'] += sign
+    return delta
+
+
+class DashboardCache:
+    """
+    One snapshot of the admin dashboard counters, shared by /api/stats/dashboard
+    and /api/admin/stats. Committed order/courier changes in this process are
+    applied to it as deltas and pushed to admin_room as 'dashboard_delta', so
+    open dashboards can stay current without polling; invoice changes (revenue)
+    drop it instead. The short TTL bounds drift from other workers' writes.
+    """
+
+    TTL_SECONDS = 15
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            self._built_at = 0.0
+            self._day = None
+            self._generation = 0  # Bumped by publish(), so a build that raced a commit isn't cached
+            self.stats = {'hits': 0, 'builds': 0}
+
+    def snapshot(self):
+        """Current counters (a copy)"""
+        with self._lock:
+            if self._valid():
+                self.stats['hits'] += 1
+                return dict(self._snapshot)
+            generation = self._generation
+        counters = self._build()
+        with self._lock:
+            self.stats['builds'] += 1
+            if generation == self._generation:
+                self._snapshot, self._built_at, self._day = counters, time.monotonic(), datetime.utcnow().date()
+            return dict(counters)
+
+    def _valid(self):
+        return (self._snapshot is not None and time.monotonic() - self._built_at < self.TTL_SECONDS
+                and self._day == datetime.utcnow().date())
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def publish(self, delta, stale=False):
+        """Apply committed counter changes and push them to connected admins."""
+        delta = {key: n for key, n in delta.items() if n}
+        if not delta and not stale:
+            return
+        with self._lock:
+            self._generation += 1
+            if stale:
+                self._snapshot = None
+            elif self._snapshot is not None:
+                for key, n in delta.items():
+                    self._snapshot[key] = self._snapshot.get(key, 0) + n
+
+        from extensions import socketio
+        try:
+            socketio.emit('dashboard_delta', {'delta': delta, 'stale': stale}, room='admin_room')
+        except Exception as e:
+            logger.debug(f"dashboard_delta not sent: {e}")
+
+    @staticmethod
+    def _build():
+        from models import Courier, Customer
+        from utils.daily_rollup import daily_rollup
+
+        today = datetime.utcnow().date()
+        by_status = daily_rollup.orders_by_status()
+        orders_today = sum(s['orders'] for s in daily_rollup.orders_by_status(today, None).values())
+        revenue_today = sum(r['amount'] for r in daily_rollup.revenue_by_day(today, None, ['paid']).values())
+
+        def orders(*statuses):
+            return sum(by_status.get(s, {}).get('orders', 0) for s in statuses)
+
+        return {
+            'orders_total': sum(s['orders'] for s in by_status.values()),
+            'orders_pending': orders('pending'),
+            'orders_active': orders(*ACTIVE_STATUSES),
+            'orders_delivered': orders('delivered'),
+            'orders_today': orders_today,
+            'couriers_total': Courier.query.count(),
+            'couriers_available': Courier.query.filter_by(is_available=True).count(),
+            'customers_total': Customer.query.count(),
+            'revenue_today': revenue_today,
+            'revenue_delivered': by_status.get('delivered', {}).get('invoiced', 0),
+            'revenue_pending': sum(s['invoiced'] for status, s in by_status.items() if status != 'delivered')
+        }
+
+
+dashboard_cache = DashboardCache()
+
+
+# ORM writes -> deltas, published once the transaction commits
+@event.listens_for(Session, 'after_flush')
+def _collect_dashboard_delta(session, flush_context):
+    from models import Courier, Customer, Delivery, Invoice
+
+    delta = Counter()
+    stale = False
+    today = datetime.utcnow().date()
+    for obj in session.new:
+        if isinstance(obj, Delivery):
+            delta.update(status_delta(None, obj.status))
+            # Revenue per status comes from the invoice: let the snapshot recompute
+            stale = stale or obj.status == 'delivered'
+            if obj.created_at and obj.created_at.date() == today:
+                delta['orders_today'] += 1
+        elif isinstance(obj, Courier):
+            delta['couriers_total'] += 1
+            delta['couriers_available'] += 1 if obj.is_available else 0
+        elif isinstance(obj, Customer):
+            delta['customers_total'] += 1
+        elif isinstance(obj, Invoice):
+            stale = True
+    for obj in session.dirty:
+        if isinstance(obj, Delivery):
+            history = inspect(obj).attrs.status.history
+            if history.has_changes() and history.deleted:
+                old, new = history.deleted[0], obj.status
+                delta.update(status_delta(old, new))
+                stale = stale or 'delivered' in (old, new)
+        elif isinstance(obj, Courier):
+            history = inspect(obj).attrs.is_available.history
+            if history.has_changes() and history.deleted and bool(history.deleted[0]) != bool(obj.is_available):
+                delta['couriers_available'] += 1 if obj.is_available else -1
+        elif isinstance(obj, Invoice) and session.is_modified(obj):
+            stale = True
+    for obj in session.deleted:
+        if isinstance(obj, (Delivery, Invoice, Courier, Customer)):
+            # Rare (admin deletes): recompute rather than reconstruct
+            stale = True
+
+    if delta or stale:
+        pending = session.info.setdefault('dashboard_delta', [Counter(), False])
+        pending[0].update(delta)
+        pending[1] = pending[1] or stale
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_dashboard_delta(session):
+    pending = session.info.pop('dashboard_delta', None)
+    if pending:
+        dashboard_cache.publish(*pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_dashboard_delta(session):
+    session.info.pop('dashboard_delta', None)
@@ -1,27 +1,33 @@
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended import verify_jwt_in_request
 from functools import wraps
 from flask import jsonify
-from models import User
+import hashlib
+import logging
+
+from utils.identity import current_user as load_current_user
+from utils.route_cache import LRUCache
+
+logger = logging.getLogger(__name__)
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         try:
-            print(f"🔐 Verifying JWT for endpoint: {f.__name__}")
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            print(f"✅ JWT verified. User ID: {user_id}")
-            
-            current_user = User.query.get(user_id)
+            # Shared with set_db_context: the User is loaded once per request
+            current_user = load_current_user()
             if not current_user:
-                print(f"❌ User {user_id} not found in database!")
+                logger.warning(f"JWT for unknown user on {f.__name__}")
                 return jsonify({'message': 'User not found!', 'error': 'USER_NOT_FOUND'}), 401
             
-            print(f"✅ User found: {current_user.username} (type: {current_user.user_type})")
+            logger.debug(f"{f.__name__}: user {current_user.id} ({current_user.user_type})")
             
         except Exception as e:
-            print(f"❌ JWT verification failed: {str(e)}")
+            logger.info(f"JWT verification failed for {f.__name__}: {e}")
             return jsonify({'message': 'Invalid or missing token', 'error': str(e)}), 401
+        
+        if current_user.is_active is False:
+            return jsonify({'message': 'Account is disabled', 'error': 'USER_INACTIVE'}), 403
             
         return f(current_user, *args, **kwargs)
         
@@ -41,8 +47,6 @@ def role_required(required_roles):
     def decorator(f):
         @wraps(f)
         def decorated(current_user, *args, **kwargs):
-            print(f"🔑 Checking roles for {current_user.username}. Required: {required_roles}")
-            
             # Define admin role types that exist in the system
             admin_role_types = ['super_admin', 'finance_admin', 'support_admin', 'content_admin']
             
@@ -50,10 +54,6 @@ def role_required(required_roles):
             required_admin_roles = [role for role in required_roles if role in admin_role_types]
             required_user_types = [role for role in required_roles if role not in admin_role_types]
             
-            print(f"   User type: {current_user.user_type}")
-            print(f"   Required user types: {required_user_types}")
-            print(f"   Required admin roles: {required_admin_roles}")
-            
             # Check user_type match
             user_type_match = current_user.user_type in required_user_types
             
@@ -67,15 +67,11 @@ def role_required(required_roles):
                 elif hasattr(current_user, 'admin_role') and current_user.admin_role == 'super_admin':
                     admin_role_match = True
             
-            print(f"   User type match: {user_type_match}")
-            print(f"   Admin role match: {admin_role_match}")
-            
             # Grant access if either condition is met
             if user_type_match or admin_role_match:
-                print(f"✅ Access granted!")
                 return f(current_user, *args, **kwargs)
             
-            print(f"❌ Permission denied!")
+            logger.info(f"Permission denied for user {current_user.id} on {f.__name__}: requires {required_roles}")
             return jsonify({
                 'message': 'Permission denied!',
                 'error': 'INSUFFICIENT_PERMISSIONS',
@@ -89,14 +85,41 @@ def role_required(required_roles):
 def admin_required(f):
     return role_required('admin')(f)
 
+# Verified merchant keys (sha256 of the presented key -> ApiKey id): the hash
+# check is deliberately slow and webhooks arrive in bursts. A deactivated key
+# stops working within the TTL.
+_merchant_keys = LRUCache(1000, 60)
+
+
+def _merchant_api_key_id(api_key):
+    """ApiKey id for an active per-merchant key ('prefix.secret'), or None"""
+    if '.' not in api_key:
+        return None
+    digest = hashlib.sha256(api_key.encode()).hexdigest()
+    api_key_id = _merchant_keys.get(digest)
+    if api_key_id is not None:
+        return api_key_id
+
+    from models import ApiKey
+    from werkzeug.security import check_password_hash
+    prefix, secret = api_key.split('.', 1)
+    for record in ApiKey.query.filter_by(prefix=prefix, is_active=True):
+        if check_password_hash(record.key_hash, secret):
+            _merchant_keys.set(digest, record.id)
+            return record.id
+    return None
+
+
 def api_key_required(f):
     """
     Decorator to verify API key for external API access.
-    Expects 'X-API-Key' header with valid API key.
+    Expects 'X-API-Key' header with valid API key: a merchant's own key (see
+    `flask create-api-key`), whose id is put on g.api_key_id, or the shared
+    EXTERNAL_API_KEY (g.api_key_id = None).
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        from flask import request
+        from flask import g, request
         import os
         
         api_key = request.headers.get('X-API-Key')
@@ -108,7 +131,8 @@ def api_key_required(f):
                 'message': 'Please provide X-API-Key header'
             }), 401
         
-        if api_key != valid_api_key:
+        g.api_key_id = _merchant_api_key_id(api_key)
+        if g.api_key_id is None and api_key != valid_api_key:
             return jsonify({
                 'error': 'Invalid API key',
                 'message': 'The provided API key is not valid'
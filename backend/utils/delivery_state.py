@@ -0,0 +1,205 @@
+"""
+Delivery status transitions.
+
+Every change of Delivery.status goes through delivery_state.transition():
+one conditional UPDATE ... WHERE id = :id AND status = :expected RETURNING,
+plus the DeliveryStatus history row, both in the caller's transaction. A
+concurrent writer that changed the row first makes the UPDATE match nothing,
+which surfaces as a 409 TransitionError instead of silently overwriting it.
+
+Once the transaction commits, each change is handed as one Transition event to
+the subscribers: by default the admin/courier/customer socket rooms, the
+dashboard counters and the daily rollups (a Core UPDATE bypasses their ORM hooks).
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+# Imported here, not in the subscribers: their modules register Session hooks
+# on import, which must not happen while after_commit listeners are running
+from utils.daily_rollup import daily_rollup
+from utils.dashboard_cache import dashboard_cache, status_delta
+
+logger = logging.getLogger(__name__)
+
+Transition = namedtuple('Transition', ['delivery_id', 'order_number', 'old_status', 'new_status', 'courier_id',
+                                       'customer_id', 'actor_id', 'created_at', 'at'])
+
+_UNCHANGED = object()
+
+
+class TransitionError(ValueError):
+    """A transition that can't be applied; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DeliveryStateMachine:
+    """Validates and applies Delivery.status changes, then publishes them."""
+
+    TRANSITIONS = {
+        'pending': {'assigned', 'cancelled'},
+        'assigned': {'assigned', 'pending', 'picked_up', 'in_transit', 'cancelled'},
+        'picked_up': {'in_transit', 'delivered', 'failed', 'cancelled'},
+        'in_transit': {'delivered', 'failed'},
+        'failed': {'pending', 'cancelled'},
+        'delivered': set(),
+        'cancelled': set(),
+    }
+    # Set once, on the first transition into the status
+    STAMPS = {'picked_up': ('actual_pickup_time',), 'delivered': ('actual_delivery_time', 'delivered_at')}
+
+    def __init__(self):
+        self._subscribers = []
+        self._claim_target = None  # deliveries alias for the SKIP LOCKED subquery, built once
+
+    def subscribe(self, fn):
+        """Register fn(transition), called after commit for every applied transition."""
+        self._subscribers.append(fn)
+        return fn
+
+    @classmethod
+    def allowed(cls, old_status, new_status):
+        return new_status in cls.TRANSITIONS.get(old_status, ())
+
+    def transition(self, delivery_id, new_status, expected=None, actor_id=None, owned_by=None, unassigned=False,
+                   skip_locked=False, courier_id=_UNCHANGED, notes=None, location=None, values=None, force=False):
+        """
+        Move a delivery to new_status (no commit). Returns the Transition.
+
+        expected     status the caller saw; read here when not given
+        owned_by     only if the delivery is assigned to this courier id
+        unassigned   only if no courier holds it (claims)
+        skip_locked  don't queue behind a concurrent writer of the row, treat it as
+                     taken (FOR UPDATE SKIP LOCKED; SQLite serializes writers anyway)
+        courier_id   set the assignment in the same UPDATE (None unassigns); a move
+                     to pending always unassigns, so the order is back in the pool
+        values       other Delivery columns to set with it, e.g. POD fields
+        force        admin correction: skip the TRANSITIONS table (any status to any
+                     other); still a conditional UPDATE with a history row
+        Raises TransitionError: 404 unknown delivery, 403 not owned_by,
+        400 transition not allowed, 409 the row changed underneath.
+        """
+        from models import db, Delivery, DeliveryStatus
+
+        if new_status not in self.TRANSITIONS:
+            raise TransitionError(f"Unknown status '{new_status}'", 400)
+        if new_status == 'pending':
+            courier_id = None
+        if expected is None:
+            expected = self._check(delivery_id, new_status, owned_by, force=force).status
+        elif not force and not self.allowed(expected, new_status):
+            raise TransitionError(f"Cannot change status from {expected} to {new_status}", 400)
+
+        now = datetime.utcnow()
+        changes = {Delivery.status: new_status, Delivery.updated_at: now}
+        for name in self.STAMPS.get(new_status, ()):
+            column = getattr(Delivery, name)
+            changes[column] = func.coalesce(column, now)
+        if courier_id is not _UNCHANGED:
+            changes[Delivery.courier_id] = courier_id
+        for name, value in (values or {}).items():
+            changes[getattr(Delivery, name)] = value
+
+        stmt = update(Delivery).where(Delivery.id == delivery_id, Delivery.status == expected)
+        if owned_by is not None:
+            stmt = stmt.where(Delivery.courier_id == owned_by)
+        if unassigned:
+            stmt = stmt.where(Delivery.courier_id.is_(None))
+        if skip_locked:
+            if self._claim_target is None:
+                self._claim_target = Delivery.__table__.alias('target')
+            target = self._claim_target
+            stmt = stmt.where(Delivery.id.in_(
+                select(target.c.id).where(target.c.id == delivery_id).with_for_update(skip_locked=True)))
+        row = db.session.execute(
+            stmt.values(changes).returning(Delivery.order_number, Delivery.courier_id, Delivery.customer_id,
+                                           Delivery.created_at),
+            execution_options={'synchronize_session': 'fetch'}
+        ).first()
+        if row is None:
+            # Say why: gone, taken, or moved on since `expected` was read
+            self._check(delivery_id, new_status, owned_by, expected, unassigned, force)
+            raise TransitionError(f"Delivery {delivery_id} was changed concurrently", 409)
+
+        lat, lng = location or (None, None)
+        db.session.execute(insert(DeliveryStatus).values(
+            delivery_id=delivery_id, status=new_status, timestamp=now, notes=notes,
+            location_lat=lat, location_lng=lng, updated_by=actor_id
+        ))
+        transition = Transition(delivery_id, row.order_number, expected, new_status, row.courier_id,
+                                row.customer_id, actor_id, row.created_at, now)
+        db.session.info.setdefault('delivery_transitions', []).append(transition)
+        return transition
+
+    def _check(self, delivery_id, new_status, owned_by, expected=None, unassigned=False, force=False):
+        from models import db, Delivery
+
+        current = db.session.execute(
+            select(Delivery.status, Delivery.courier_id).where(Delivery.id == delivery_id)
+        ).first()
+        if current is None:
+            raise TransitionError(f"Delivery {delivery_id} not found", 404)
+        if owned_by is not None and current.courier_id != owned_by:
+            raise TransitionError('Not assigned to you', 403)
+        if unassigned and current.courier_id is not None:
+            raise TransitionError(f"Delivery {delivery_id} was already taken", 409)
+        if expected is not None and current.status != expected:
+            raise TransitionError(f"Delivery {delivery_id} is {current.status}, not {expected}", 409)
+        if not force and not self.allowed(current.status, new_status):
+            raise TransitionError(f"Cannot change status from {current.status} to {new_status}", 400)
+        return current
+
+    def publish(self, transitions):
+        for transition in transitions:
+            for fn in self._subscribers:
+                try:
+                    fn(transition)
+                except Exception as e:
+                    logger.warning(f"Transition subscriber {fn.__name__} failed for delivery "
+                                   f"{transition.delivery_id}: {e}")
+
+
+delivery_state = DeliveryStateMachine()
+
+
+@delivery_state.subscribe
+def _notify_rooms(transition):
+    from extensions import socketio
+
+    payload = {'id': transition.delivery_id, 'status': transition.new_status, 'courier_id': transition.courier_id}
+    socketio.emit('order_update', payload, room='admin_room')
+    if transition.courier_id:
+        socketio.emit('delivery_status_update', {'delivery_id': transition.delivery_id,
+                                                 'status': transition.new_status},
+                      room=f'courier_{transition.courier_id}')
+    if transition.customer_id:
+        socketio.emit('order_status_changed', {'order_id': transition.delivery_id, 'status': transition.new_status},
+                      room=f'customer_{transition.customer_id}')
+
+
+@delivery_state.subscribe
+def _update_counters(transition):
+    old, new = transition.old_status, transition.new_status
+    if old != new:
+        # Revenue per status comes from the invoice: let the snapshot recompute
+        dashboard_cache.publish(status_delta(old, new), stale='delivered' in (old, new))
+    if transition.created_at is not None:
+        daily_rollup.mark_dirty({transition.created_at.date()})
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_transitions(session):
+    transitions = session.info.pop('delivery_transitions', None)
+    if transitions:
+        delivery_state.publish(transitions)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_transitions(session):
+    session.info.pop('delivery_transitions', None)
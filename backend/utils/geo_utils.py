@@ -5,33 +5,40 @@ NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'http://localhost:8080')
 OSRM_URL = os.getenv('OSRM_URL', 'http://localhost:5000')
 
 def get_coords_from_address(address):
-    """הופך טקסט לקואורדינטות. מחזיר dict או None"""
+    """הופך טקסט לקואורדינטות. מחזיר dict או None (דרך ה-geocoding cache, בלי המתנה ל-rate limit)"""
+    from utils.geocoding import geocoder
     try:
-        response = requests.get(
-            f"{NOMINATIM_URL}/search", 
-            params={'q': address, 'format': 'json', 'limit': 1},
-            timeout=5
-        )
-        data = response.json()
-        if data:
-            return {'lat': float(data[0]['lat']), 'lon': float(data[0]['lon'])}
+        coords = geocoder.geocode(address)
+        if coords:
+            return {'lat': coords[0], 'lon': coords[1]}
     except Exception as e:
         print(f"Geocoding error: {e}")
     return None
 
 def get_route_info(pickup_coords, delivery_coords):
-    """מחשב מרחק וזמן בשרת המקומי"""
+    """מחשב מרחק וזמן בשרת המקומי (דרך ה-route cache)"""
+    from utils.route_cache import route_cache
     try:
-        url = f"{OSRM_URL}/route/v1/driving/{pickup_coords['lon']},{pickup_coords['lat']};{delivery_coords['lon']},{delivery_coords['lat']}?overview=false"
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        
-        if data.get('code') == 'Ok':
-            route = data['routes'][0]
+        route = route_cache.get_route(pickup_coords['lat'], pickup_coords['lon'],
+                                      delivery_coords['lat'], delivery_coords['lon'])
+        if route:
             return {
-                'distance_km': route['distance'] / 1000,
-                'duration_min': round(route['duration'] / 60)
+                'distance_km': route['distance_km'],
+                'duration_min': round(route['duration_min'])
             }
     except Exception as e:
         print(f"Routing error: {e}")
-    return None
\ No newline at end of file
+    return None
+
+def get_distance_matrix(sources, destinations):
+    """
+    מטריצת מרחקים/זמנים (OSRM /table, דרך ה-route cache) בין רשימות של {'lat', 'lon'}.
+    מחזיר שורות של {'distance_km', 'duration_min'} (None כשאין מסלול), או None בשגיאה
+    """
+    from utils.route_cache import route_cache
+    try:
+        return route_cache.get_matrix([(p['lat'], p['lon']) for p in sources],
+                                      [(p['lat'], p['lon']) for p in destinations])
+    except Exception as e:
+        print(f"Routing error: {e}")
+    return None
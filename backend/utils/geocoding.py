@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from datetime import datetime, timedelta
+
+import requests
+
+from utils.route_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_QUOTES = str.maketrans({'״': '"', '׳': "'", '`': "'", '’': "'", '‘': "'", '“': '"', '”': '"'})
+_NOISE_WORDS = {'רחוב', 'רח', 'שד', 'street', 'st', 'ישראל', 'israel'}
+_TOKEN_RE = re.compile(r"[\w'\"]+")
+
+
+def normalize_address(*parts):
+    """
+    Canonical form of a free-text address, so that 'רח' הרצל 10, תל-אביב' and
+    'הרצל 10 תל אביב' share a cache entry: NFKC, casefold, niqqud and punctuation
+    stripped, Hebrew geresh/gershayim folded, filler words dropped.
+    """
+    text = ' '.join(str(p) for p in parts if p)
+    text = unicodedata.normalize('NFKC', text).translate(_QUOTES).casefold()
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    tokens = (t.replace("'", '').replace('"', '') for t in _TOKEN_RE.findall(text.replace('-', ' ')))
+    return ' '.join(t for t in tokens if t and t not in _NOISE_WORDS)
+
+
+class TokenBucket:
+    """Rate limiter that never sleeps: callers ask, and get a yes/no answer."""
+
+    def __init__(self, rate_per_sec, capacity=1):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class GeocodingService:
+    """
+    Address -> (lat, lng) with a normalized-address cache (in-process LRU in front
+    of the geocode_cache table), single-flight coalescing of identical lookups, and
+    a token bucket for the provider's rate limit. Request code calls geocode()
+    which never sleeps: when the bucket is empty the lookup is queued for a
+    background worker and None is returned right away.
+    """
+
+    TTL_SECONDS = 30 * 24 * 3600
+    NEGATIVE_TTL_SECONDS = 24 * 3600
+    LRU_SIZE = 10000
+    HTTP_TIMEOUT = 5
+    MAX_QUEUE = 1000
+
+    _NO_MATCH = ()
+
+    def __init__(self, base_url=None, rate_per_sec=None, burst=1, user_agent='TzirDelivery/1.0'):
+        self.base_url = base_url or os.getenv('NOMINATIM_URL', 'http://localhost:8080')
+        self.bucket = TokenBucket(rate_per_sec or float(os.getenv('GEOCODER_RATE_PER_SEC', 1.0)), burst)
+        self.local = LRUCache(self.LRU_SIZE, self.TTL_SECONDS)
+        self.http = requests.Session()
+        self.http.headers['User-Agent'] = user_agent
+        self.stats = {'cache_hits': 0, 'coalesced': 0, 'requests': 0, 'throttled': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._queue = deque()
+        self._queued = set()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._app = None
+
+    @staticmethod
+    def cache_key(normalized):
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def geocode(self, query, wait=False):
+        """
+        Returns (lat, lng) or None. With wait=False (request code) a throttled
+        lookup is queued and returns None immediately; wait=True (CLI, worker)
+        waits for a token instead.
+        """
+        normalized = normalize_address(query)
+        if not normalized:
+            return None
+        key = self.cache_key(normalized)
+
+        cached = self._cached(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached or None
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            # Someone is already asking the provider for this address
+            self.stats['coalesced'] += 1
+            event.wait(self.HTTP_TIMEOUT * 2)
+            return self.local.get(key) or None
+
+        try:
+            if not self.bucket.try_acquire():
+                if not wait:
+                    self.stats['throttled'] += 1
+                    self.enqueue(query)
+                    return None
+                while not self.bucket.try_acquire():
+                    time.sleep(self.bucket.wait_time())
+
+            result = self._fetch(query)
+            if result is not None:
+                self._remember(key, normalized, result)
+            return result or None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def enqueue(self, query, callback=None):
+        """Geocode in the background as soon as the rate limit allows; callback(result) when done."""
+        key = self.cache_key(normalize_address(query))
+        with self._lock:
+            if key in self._queued or len(self._queue) >= self.MAX_QUEUE:
+                return
+            self._queued.add(key)
+            self._queue.append((key, query, callback))
+            self._capture_app()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_queue, name='geocoder', daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def _run_queue(self):
+        while True:
+            self._wakeup.wait()
+            # Clear before draining: an enqueue after this point sets it again
+            # and is picked up by the next pass, never lost
+            self._wakeup.clear()
+            while self._queue:
+                key, query, callback = self._queue.popleft()
+                try:
+                    result = self._in_app_context(self.geocode, query, wait=True)
+                    if callback:
+                        self._in_app_context(callback, result)
+                except Exception as e:
+                    logger.error(f"Queued geocode failed for '{query}': {e}")
+                finally:
+                    with self._lock:
+                        self._queued.discard(key)
+
+    def _capture_app(self):
+        from flask import current_app, has_app_context
+        if has_app_context():
+            self._app = current_app._get_current_object()
+
+    def _in_app_context(self, fn, *args, **kwargs):
+        if self._app is None:
+            return fn(*args, **kwargs)
+        with self._app.app_context():
+            return fn(*args, **kwargs)
+
+    def _fetch(self, query):
+        """(lat, lng), _NO_MATCH, or None on a transport/provider error (not cached)."""
+        self.stats['requests'] += 1
+        try:
+            response = self.http.get(
+                f"{self.base_url}/search",
+                params={'q': query, 'format': 'json', 'limit': 1},
+                timeout=self.HTTP_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+            if data:
+                return float(data[0]['lat']), float(data[0]['lon'])
+            return self._NO_MATCH
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Geocoding error: {e}")
+            return None
+
+    def _cached(self, key):
+        """(lat, lng), _NO_MATCH, or None when not cached."""
+        hit = self.local.get(key)
+        if hit is not None:
+            return hit
+
+        from flask import has_app_context
+        if not has_app_context():
+            return None
+        from models import db, GeocodeCacheEntry
+        table = GeocodeCacheEntry.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().where(table.c.key == key, table.c.expires_at > datetime.utcnow())
+                ).first()
+        except Exception as e:
+            logger.warning(f"Geocode cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        hit = (row.latitude, row.longitude) if row.latitude is not None else self._NO_MATCH
+        self.local.set(key, hit)
+        return hit
+
+    def _remember(self, key, normalized, result):
+        ttl = self.TTL_SECONDS if result else self.NEGATIVE_TTL_SECONDS
+        self.local.set(key, result, ttl)
+
+        from flask import has_app_context
+        if not has_app_context():
+            return
+        from models import db, GeocodeCacheEntry
+        table = GeocodeCacheEntry.__table__
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key))
+                conn.execute(table.insert().values(
+                    key=key, normalized=normalized[:255],
+                    latitude=result[0] if result else None, longitude=result[1] if result else None,
+                    created_at=now, expires_at=now + timedelta(seconds=ttl)
+                ))
+        except Exception as e:
+            logger.warning(f"Geocode cache write failed: {e}")
+
+    def backfill_addresses(self, limit=None, batch_size=100):
+        """
+        Geocode Address rows with NULL lat/lng. Identical addresses are looked up
+        once; waits for the rate limit (CLI use). Returns (rows_updated, lookups).
+        """
+        from models import db, Address
+
+        pending = {}
+        rows = db.session.query(Address.id, Address.street, Address.building_number, Address.city).filter(
+            (Address.latitude.is_(None)) | (Address.longitude.is_(None))
+        ).order_by(Address.id)
+        if limit:
+            rows = rows.limit(limit)
+        for address_id, street, number, city in rows.yield_per(1000):
+            query = f"{street} {number or ''}, {city}"
+            pending.setdefault(normalize_address(query), (query, []))[1].append(address_id)
+
+        updated = lookups = 0
+        for normalized, (query, ids) in pending.items():
+            coords = self.geocode(query, wait=True)
+            lookups += 1
+            if coords:
+                for start in range(0, len(ids), batch_size):
+                    db.session.query(Address).filter(Address.id.in_(ids[start:start + batch_size])).update(
+                        {Address.latitude: coords[0], Address.longitude: coords[1]}, synchronize_session=False
+                    )
+                # Commit before the next lookup writes the cache on its own connection
+                db.session.commit()
+                updated += len(ids)
+            if lookups % batch_size == 0:
+                logger.info(f"Geocode backfill: {lookups}/{len(pending)} lookups, {updated} rows updated")
+        return updated, lookups
+
+
+geocoder = GeocodingService()
@@ -0,0 +1,157 @@
+"""
+Who is making the request, resolved once.
+
+token_required and app.set_db_context (Postgres RLS) both need the caller;
+they share the request's User (kept on `g`) instead of loading it twice, and the
+role facts set_db_context needs are cached per token for a short TTL so a
+cache hit costs no query at all. Changing a user's is_active / user_type /
+admin_role drops their cached entries on commit - in this process only: other
+workers keep serving the old role facts until their entry expires, so a
+change takes up to IdentityCache.TTL_SECONDS (30s) to reach every process.
+"""
+import logging
+import threading
+from collections import namedtuple
+
+from flask import g, request
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from utils.route_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+Identity = namedtuple('Identity', ['user_id', 'user_type', 'admin_role', 'is_active'])
+
+
+class IdentityCache:
+    """token (jti) -> Identity, with per-user invalidation"""
+
+    TTL_SECONDS = 30
+    MAX_ENTRIES = 10000
+
+    def __init__(self, ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self._entries = LRUCache(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self._versions = {}  # user_id -> bumped on invalidate; stale entries then miss
+
+    def get(self, token_key):
+        item = self._entries.get(token_key)
+        if item is None:
+            return None
+        identity, version = item
+        if version != self._versions.get(identity.user_id, 0):
+            return None
+        return identity
+
+    def version(self, user_id):
+        """Read before loading the user: pass it to set() so a concurrent invalidate wins"""
+        return self._versions.get(user_id, 0)
+
+    def set(self, token_key, identity, version):
+        self._entries.set(token_key, (identity, version))
+
+    def invalidate(self, user_id):
+        """Per process; entries cached by other workers expire after TTL_SECONDS"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        logger.debug(f"Identity cache invalidated for user {user_id}")
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._versions.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def _token_key():
+    jwt_data = get_jwt()
+    return jwt_data.get('jti') or f"{jwt_data.get('sub')}:{jwt_data.get('iat')}"
+
+
+def _request_state():
+    # g lives as long as the app context, which spans several requests when one
+    # was already pushed (CLI, tests): tie the state to this request object
+    request_obj = request._get_current_object()
+    state = g.get('_identity_state')
+    if state is None or state[0] is not request_obj:
+        state = g._identity_state = (request_obj, {})
+    return state[1]
+
+
+def current_user():
+    """
+    The request's User, loaded at most once per request (None if anonymous or
+    unknown). Call after verify_jwt_in_request().
+    """
+    state = _request_state()
+    if 'user' not in state:
+        from models import db, User
+
+        user_id = get_jwt_identity()
+        user = None
+        if user_id is not None:
+            # An invalidate committed while the row is being read bumps the
+            # version past this one, so the stale entry is never served
+            version = identity_cache.version(int(user_id))
+            user = db.session.get(User, int(user_id))
+        state['user'] = user
+        if user is not None:
+            identity_cache.set(_token_key(), Identity(user.id, user.user_type, user.admin_role, user.is_active),
+                               version)
+    return state['user']
+
+
+def current_identity():
+    """
+    Identity of the request's JWT, or None when there is no valid token or the
+    user is gone. Served from the cache when possible.
+    """
+    state = _request_state()
+    if 'identity' not in state:
+        identity = None
+        try:
+            verify_jwt_in_request(optional=True)
+            user_id = get_jwt_identity()
+        except Exception as e:
+            logger.debug(f"No usable JWT: {e}")
+            user_id = None
+        if user_id is not None:
+            identity = identity_cache.get(_token_key())
+            if identity is None:
+                user = current_user()
+                if user is not None:
+                    identity = Identity(user.id, user.user_type, user.admin_role, user.is_active)
+        state['identity'] = identity
+    return state['identity']
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_identities(session, flush_context):
+    from models import User
+
+    changed = set()
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            attrs = inspect(obj).attrs
+            if any(attrs[name].history.has_changes() for name in ('is_active', 'user_type', 'admin_role')):
+                changed.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changed.add(obj.id)
+    if changed:
+        session.info.setdefault('changed_identities', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_identities(session):
+    for user_id in session.info.pop('changed_identities', ()):
+        identity_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changed_identities(session):
+    session.info.pop('changed_identities', None)
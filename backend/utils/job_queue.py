@@ -0,0 +1,107 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    In-process background job runner for work that shouldn't hold up an HTTP
+    response. Jobs are plain functions called with JSON-like arguments (ids, not
+    ORM objects) inside an app context on a small worker pool; a job that raises
+    is retried with exponential backoff and, after MAX_ATTEMPTS, kept in
+    `failed` for inspection.
+    """
+
+    WORKERS = int(os.getenv('JOB_WORKERS', 4))
+    MAX_ATTEMPTS = 3
+    RETRY_BACKOFF_SECONDS = 1.0
+    MAX_FAILED = 100
+
+    def __init__(self, workers=WORKERS, max_attempts=MAX_ATTEMPTS, retry_backoff=RETRY_BACKOFF_SECONDS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.failed = deque(maxlen=self.MAX_FAILED)
+        self.stats = {'enqueued': 0, 'succeeded': 0, 'retried': 0, 'failed': 0}
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+
+    def enqueue(self, app, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker inside app's context."""
+        with self._lock:
+            self._pending += 1
+            self.stats['enqueued'] += 1
+            self._start_workers()
+        self._queue.put((app, fn, args, kwargs, 1))
+
+    def pending(self):
+        """Jobs queued, running or waiting for a retry."""
+        return self._pending
+
+    def wait_idle(self, timeout=None):
+        """Block until every enqueued job has succeeded or given up. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _start_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            app, fn, args, kwargs, attempt = self._queue.get()
+            if self._run(app, fn, args, kwargs, attempt):
+                self._done()
+
+    def _run(self, app, fn, args, kwargs, attempt):
+        """Returns True when the job is finished (succeeded or gave up)."""
+        from extensions import db
+
+        name = getattr(fn, '__name__', repr(fn))
+        with app.app_context():
+            try:
+                fn(*args, **kwargs)
+                self.stats['succeeded'] += 1
+                return True
+            except Exception as e:
+                db.session.rollback()
+                if attempt >= self.max_attempts:
+                    self.stats['failed'] += 1
+                    self.failed.append({'job': name, 'args': args, 'error': str(e), 'attempts': attempt})
+                    logger.error(f"Job {name}{args} failed after {attempt} attempts: {e}")
+                    return True
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                self.stats['retried'] += 1
+                logger.warning(f"Job {name}{args} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                timer = threading.Timer(delay, self._queue.put, args=((app, fn, args, kwargs, attempt + 1),))
+                timer.daemon = True
+                timer.start()
+                return False
+            finally:
+                db.session.remove()
+
+    def _done(self):
+        with self._idle:
+            self._pending -= 1
+            if not self._pending:
+                self._idle.notify_all()
+
+
+job_queue = JobQueue()
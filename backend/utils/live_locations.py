@@ -0,0 +1,119 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Keys shared with realtime-engine/pkg/geo/handler.go
+GEO_KEY = 'courier_locations'
+LAST_SEEN_KEY = 'courier:{}:last_seen'
+LAST_SEEN_TTL_SECONDS = 60
+
+
+class LiveLocationStore:
+    """
+    Hot store for live courier positions in a Redis GEO set.
+    The Go realtime-engine and the Python socket handlers write the same keys:
+    GEOADD into courier_locations plus a courier:<id>:last_seen key with a TTL.
+    A courier whose last_seen key has expired is treated as offline and is
+    pruned from the GEO set the next time a search runs into it.
+    """
+
+    def __init__(self, client, ttl_seconds=LAST_SEEN_TTL_SECONDS):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+
+    def update(self, courier_id, lat, lng):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.geoadd(GEO_KEY, (float(lng), float(lat), str(courier_id)))
+        pipe.set(LAST_SEEN_KEY.format(courier_id), int(time.time()), ex=self.ttl_seconds)
+        pipe.execute()
+
+    def remove(self, courier_id):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(GEO_KEY, str(courier_id))
+        pipe.delete(LAST_SEEN_KEY.format(courier_id))
+        pipe.execute()
+
+    def get(self, courier_id):
+        """Return (lat, lng) for a live courier, or None."""
+        if not self.client.exists(LAST_SEEN_KEY.format(courier_id)):
+            return None
+        pos = self.client.geopos(GEO_KEY, str(courier_id))
+        if not pos or pos[0] is None:
+            return None
+        lng, lat = pos[0]
+        return float(lat), float(lng)
+
+    def search(self, lat, lng, radius_km, count=None):
+        """
+        GEOSEARCH around (lat, lng). Returns [(courier_id, distance_km, lat, lng)]
+        ordered by distance, skipping (and pruning) couriers that went stale.
+        """
+        hits = self.client.geosearch(
+            GEO_KEY, longitude=lng, latitude=lat, radius=radius_km, unit='km',
+            withdist=True, withcoord=True, sort='ASC', count=count
+        )
+        if not hits:
+            return []
+
+        pipe = self.client.pipeline(transaction=False)
+        for member, _, _ in hits:
+            pipe.exists(LAST_SEEN_KEY.format(self._decode(member)))
+        alive = pipe.execute()
+
+        result = []
+        stale = []
+        for (member, dist, (m_lng, m_lat)), is_alive in zip(hits, alive):
+            member = self._decode(member)
+            if not is_alive:
+                stale.append(member)
+                continue
+            result.append((int(member), float(dist), float(m_lat), float(m_lng)))
+
+        if stale:
+            self.client.zrem(GEO_KEY, *stale)
+            logger.info(f"Pruned {len(stale)} stale couriers from {GEO_KEY}")
+        return result
+
+    def prune_stale(self, batch_size=500):
+        """Remove every member whose last_seen key expired. Returns the count removed."""
+        removed = 0
+        start = 0
+        while True:
+            names = [self._decode(m) for m in self.client.zrange(GEO_KEY, start, start + batch_size - 1)]
+            if not names:
+                return removed
+            pipe = self.client.pipeline(transaction=False)
+            for name in names:
+                pipe.exists(LAST_SEEN_KEY.format(name))
+            stale = [n for n, alive in zip(names, pipe.execute()) if not alive]
+            dropped = self.client.zrem(GEO_KEY, *stale) if stale else 0
+            removed += dropped
+            # Removed members shift the rest of the set left
+            start += len(names) - dropped
+
+    @staticmethod
+    def _decode(member):
+        return member.decode() if isinstance(member, bytes) else member
+
+
+_store = None
+
+
+def get_live_location_store():
+    """Process-wide store built from REDIS_URL, or None when Redis is not configured."""
+    global _store
+    if _store is None:
+        url = os.environ.get('REDIS_URL')
+        if not url:
+            return None
+        import redis
+        _store = LiveLocationStore(redis.Redis.from_url(url, decode_responses=True))
+    return _store
+
+
+def set_live_location_store(store):
+    """Override the process-wide store (used by tests and custom setups)."""
+    global _store
+    _store = store
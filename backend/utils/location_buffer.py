@@ -0,0 +1,174 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class LocationWriteBuffer:
+    """
+    Write-behind buffer for courier GPS pings.
+    Pings are coalesced per courier (last write wins) and handed to `writer`
+    in one batch every FLUSH_INTERVAL_SECONDS, so the DB sees one bulk UPDATE
+    per interval instead of one transaction per ping. Tracking points (pings
+    that belong to a delivery) are kept in order and appended in the same batch.
+
+    writer(positions, tracking) receives:
+        positions: {courier_id: (lat, lng)}
+        tracking:  [{'courier_id', 'delivery_id', 'latitude', 'longitude', 'speed', 'heading', 'timestamp'}]
+    """
+
+    FLUSH_INTERVAL_SECONDS = 1.0
+    MAX_TRACKING_POINTS = 50000  # Oldest points are dropped beyond this if the DB falls behind
+
+    def __init__(self, writer, max_tracking_points=MAX_TRACKING_POINTS):
+        self.writer = writer
+        self.max_tracking_points = max_tracking_points
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._positions = {}
+        self._tracking = []
+        self._metrics = {
+            'pings_received': 0,
+            'pings_coalesced': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'positions_written': 0,
+            'tracking_written': 0,
+            'tracking_dropped': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def add(self, courier_id, lat, lng, delivery_id=None, speed=None, heading=None, timestamp=None):
+        courier_id, lat, lng = int(courier_id), float(lat), float(lng)
+        with self._lock:
+            self._metrics['pings_received'] += 1
+            if courier_id in self._positions:
+                self._metrics['pings_coalesced'] += 1
+            self._positions[courier_id] = (lat, lng)
+
+            if delivery_id:
+                self._tracking.append({
+                    'courier_id': courier_id,
+                    'delivery_id': int(delivery_id),
+                    'latitude': lat,
+                    'longitude': lng,
+                    'speed': speed,
+                    'heading': heading,
+                    'timestamp': timestamp or datetime.utcnow(),
+                })
+                self._trim_tracking()
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of couriers updated."""
+        with self._flush_lock:
+            with self._lock:
+                positions, self._positions = self._positions, {}
+                tracking, self._tracking = self._tracking, []
+            if not positions and not tracking:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.writer(positions, tracking)
+            except Exception as e:
+                self._requeue(positions, tracking)
+                self._metrics['flush_errors'] += 1
+                logger.error(f"Location flush failed, {len(positions)} positions re-queued: {e}")
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                m = self._metrics
+                m['flushes'] += 1
+                m['positions_written'] += len(positions)
+                m['tracking_written'] += len(tracking)
+                m['last_flush_ms'] = round(elapsed_ms, 2)
+                m['max_flush_ms'] = round(max(m['max_flush_ms'], elapsed_ms), 2)
+                m['total_flush_ms'] += elapsed_ms
+            return len(positions)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['buffer_depth'] = len(self._positions)
+            stats['pending_tracking'] = len(self._tracking)
+        stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / stats['flushes'], 2) if stats['flushes'] else 0.0
+        return stats
+
+    def _requeue(self, positions, tracking):
+        with self._lock:
+            # Pings that arrived during the failed flush are newer, keep them
+            for courier_id, pos in positions.items():
+                self._positions.setdefault(courier_id, pos)
+            self._tracking[:0] = tracking
+            self._trim_tracking()
+
+    def _trim_tracking(self):
+        overflow = len(self._tracking) - self.max_tracking_points
+        if overflow > 0:
+            del self._tracking[:overflow]
+            self._metrics['tracking_dropped'] += overflow
+
+
+def write_courier_locations(positions, tracking):
+    """Flask writer: one executemany UPDATE on couriers plus one INSERT into delivery_tracking."""
+    from sqlalchemy import bindparam, insert, select, update
+    from models import db, Courier, Delivery, DeliveryTracking
+
+    if positions:
+        couriers = Courier.__table__
+        # Core UPDATE: bypasses the ORM events, so location_geog is set explicitly here.
+        # Ids that no longer exist simply match no row.
+        stmt = update(couriers).where(couriers.c.id == bindparam('b_id')).values(
+            current_location_lat=bindparam('b_lat'),
+            current_location_lng=bindparam('b_lng'),
+            location_geog=bindparam('b_geog', type_=couriers.c.location_geog.type),
+        )
+        db.session.execute(stmt, [
+            {'b_id': cid, 'b_lat': lat, 'b_lng': lng, 'b_geog': Courier.location_ewkt(lat, lng)}
+            for cid, (lat, lng) in positions.items()
+        ])
+
+    if tracking:
+        # Only keep points for deliveries actually assigned to the reporting courier
+        owners = dict(db.session.execute(
+            select(Delivery.id, Delivery.courier_id).where(Delivery.id.in_({t['delivery_id'] for t in tracking}))
+        ).all())
+        rows = [t for t in tracking if owners.get(t['delivery_id']) == t['courier_id']]
+        if rows:
+            db.session.execute(insert(DeliveryTracking), rows)
+
+    db.session.commit()
+
+
+location_buffer = LocationWriteBuffer(write_courier_locations)
+_flusher_started = threading.Event()
+
+
+def start_location_flusher(app, buffer=location_buffer):
+    """Start the background flush loop once per process."""
+    if _flusher_started.is_set():
+        return
+    _flusher_started.set()
+
+    from extensions import db, socketio
+
+    def flush_in_context():
+        with app.app_context():
+            try:
+                buffer.flush()
+            finally:
+                db.session.remove()
+
+    def run():
+        while True:
+            socketio.sleep(buffer.FLUSH_INTERVAL_SECONDS)
+            flush_in_context()
+
+    socketio.start_background_task(run)
+    atexit.register(flush_in_context)
@@ -1,9 +1,5 @@
 import sqlite3
-import requests
-from datetime import datetime
-import json
 import os
-import time
 from typing import Optional, Tuple, Dict, List
 
 class DeliveryMapSystem:
@@ -17,7 +13,10 @@ class DeliveryMapSystem:
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
         self.create_tables()
-        self.last_request_time = 0
+        # Shared cache + token bucket for the public Nominatim (1 request / 1.5s), never sleeps
+        from utils.geocoding import GeocodingService
+        self.geocoder = GeocodingService(base_url='https://nominatim.openstreetmap.org',
+                                         rate_per_sec=1 / 1.5, user_agent='DeliveryMapSystem/1.0')
     
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -53,25 +52,6 @@ class DeliveryMapSystem:
             )
         ''')
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS routes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_lat REAL NOT NULL,
-                from_lon REAL NOT NULL,
-                to_lat REAL NOT NULL,
-                to_lon REAL NOT NULL,
-                distance_km REAL,
-                duration_min INTEGER,
-                route_data TEXT,
-                cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_routes_coords 
-            ON routes(from_lat, from_lon, to_lat, to_lon)
-        ''')
-        
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_deliveries_status 
             ON deliveries(status)
@@ -79,47 +59,15 @@ class DeliveryMapSystem:
         
         self.conn.commit()
     
-    def _wait_for_rate_limit(self, wait_seconds=1.5):
-        elapsed = time.time() - self.last_request_time
-        if elapsed < wait_seconds:
-            time.sleep(wait_seconds - elapsed)
-        self.last_request_time = time.time()
-    
     def geocode_address(self, street: str, city: str, country: str = "Israel") -> Tuple[Optional[float], Optional[float]]:
-        self._wait_for_rate_limit()
-        
-        base_url = "https://nominatim.openstreetmap.org/search"
-        
-        params = {
-            'street': street,
-            'city': city,
-            'country': country,
-            'format': 'json',
-            'limit': 1,
-            'addressdetails': 1
-        }
-        
-        headers = {
-            'User-Agent': 'DeliveryMapSystem/1.0'
-        }
-        
-        try:
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data and len(data) > 0:
-                lat = float(data[0]['lat'])
-                lon = float(data[0]['lon'])
-                return lat, lon
-            return None, None
-                
-        except Exception as e:
-            print(f"שגיאה ב-geocoding: {e}")
-            return None, None
+        # Throttled lookups are queued in the background and return (None, None) right away
+        coords = self.geocoder.geocode(f"{street}, {city}, {country}")
+        return coords if coords else (None, None)
     
     def search_addresses(self, query: str, limit: int = 5) -> List[Dict]:
-        self._wait_for_rate_limit()
+        # Autocomplete is only useful right now: over the rate limit, return nothing instead of waiting
+        if not self.geocoder.bucket.try_acquire():
+            return []
         
         base_url = "https://nominatim.openstreetmap.org/search"
         
@@ -131,12 +79,8 @@ class DeliveryMapSystem:
             'addressdetails': 1
         }
         
-        headers = {
-            'User-Agent': 'DeliveryMapSystem/1.0'
-        }
-        
         try:
-            response = requests.get(base_url, params=params, headers=headers, timeout=10)
+            response = self.geocoder.http.get(base_url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -171,61 +115,10 @@ class DeliveryMapSystem:
     
     def calculate_route(self, from_lat: float, from_lon: float, 
                        to_lat: float, to_lon: float) -> Optional[Dict]:
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT distance_km, duration_min, route_data
-            FROM routes
-            WHERE abs(from_lat - ?) < 0.0001 
-            AND abs(from_lon - ?) < 0.0001
-            AND abs(to_lat - ?) < 0.0001 
-            AND abs(to_lon - ?) < 0.0001
-            AND datetime(cached_at) > datetime('now', '-7 days')
-        ''', (from_lat, from_lon, to_lat, to_lon))
-        
-        cached = cursor.fetchone()
-        if cached:
-            return {
-                'distance_km': cached[0],
-                'duration_min': cached[1],
-                'route_data': json.loads(cached[2]) if cached[2] else None
-            }
-        
-        url = f"http://router.project-osrm.org/route/v1/driving/{from_lon},{from_lat};{to_lon},{to_lat}"
-        params = {
-            'overview': 'full',
-            'geometries': 'geojson',
-            'steps': 'true'
-        }
-        
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('code') == 'Ok' and data.get('routes'):
-                route = data['routes'][0]
-                distance_km = route['distance'] / 1000
-                duration_min = route['duration'] / 60
-                
-                cursor.execute('''
-                    INSERT INTO routes 
-                    (from_lat, from_lon, to_lat, to_lon, distance_km, duration_min, route_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (from_lat, from_lon, to_lat, to_lon, distance_km, duration_min, 
-                      json.dumps(route['geometry'])))
-                
-                self.conn.commit()
-                
-                return {
-                    'distance_km': distance_km,
-                    'duration_min': duration_min,
-                    'route_data': route['geometry']
-                }
-            return None
-                
-        except Exception as e:
-            print(f"שגיאה בחישוב מסלול: {e}")
-            return None
+        # Shared route cache (in-process LRU, route_cache table, OSRM); failures are cached briefly too
+        from utils.route_cache import route_cache
+        route = route_cache.get_route(from_lat, from_lon, to_lat, to_lon)
+        return dict(route) if route else None
     
     def calculate_price(self, distance_km: float, size: str = 'small', 
                        base_price: float = 20, price_per_km: float = 10) -> Dict:
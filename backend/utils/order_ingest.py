@@ -0,0 +1,244 @@
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+
+class BulkOrderImporter:
+    """
+    Creates many external orders in one transaction with a handful of
+    statements: existing merchant_order_ids and addresses are looked up in
+    chunks, and new addresses, delivery points and deliveries are inserted with
+    executemany + RETURNING. Idempotent on merchant_order_id per merchant
+    (api_key_id; None for the shared EXTERNAL_API_KEY): an order that merchant
+    already sent is reported back instead of being created again.
+    """
+
+    MAX_ORDERS = 5000
+    CHUNK = 500
+    DEFAULT_PICKUP_POINT_ID = 1  # Main warehouse, as in the single-order endpoint
+    DEFAULT_CUSTOMER_ID = 1
+
+    @classmethod
+    def validate(cls, item):
+        """Error message for an invalid order payload, or None"""
+        if not isinstance(item, dict):
+            return 'order must be an object'
+        if not str(item.get('merchant_order_id') or '').strip():
+            return 'merchant_order_id is required'
+        customer, address = item.get('customer'), item.get('delivery_address')
+        if not isinstance(customer, dict) or not customer.get('name') or not customer.get('phone'):
+            return 'customer.name and customer.phone are required'
+        if not isinstance(address, dict) or not address.get('street') or not address.get('city'):
+            return 'delivery_address.street and delivery_address.city are required'
+        pickup = item.get('pickup_address')
+        if pickup is not None and (not isinstance(pickup, dict) or not pickup.get('street') or not pickup.get('city')):
+            return 'pickup_address.street and pickup_address.city are required'
+        try:
+            float((item.get('package_details') or {}).get('weight', 1.0))
+        except (TypeError, ValueError):
+            return 'package_details.weight must be a number'
+        return None
+
+    @classmethod
+    def ingest(cls, items, api_key_id=None):
+        """Returns one result dict per item, in input order. Commits."""
+        from models import db
+        try:
+            return cls._ingest(items, api_key_id)
+        except IntegrityError:
+            # A concurrent retry inserted some of the same merchant_order_ids first:
+            # run again, they now resolve as existing
+            db.session.rollback()
+            return cls._ingest(items, api_key_id)
+
+    @classmethod
+    def _ingest(cls, items, api_key_id):
+        from models import db, Delivery
+
+        results = [None] * len(items)
+        pending = {}  # merchant_order_id -> index of its first occurrence
+        for i, item in enumerate(items):
+            error = cls.validate(item)
+            if error:
+                results[i] = {'index': i, 'status': 'error', 'error': error}
+                continue
+            merchant_order_id = str(item['merchant_order_id']).strip()
+            if merchant_order_id in pending:
+                results[i] = {'index': i, 'merchant_order_id': merchant_order_id, 'status': 'error',
+                              'error': f"duplicate of item {pending[merchant_order_id]}"}
+                continue
+            pending[merchant_order_id] = i
+
+        # Idempotency: orders already created by an earlier (retried) request
+        ids = list(pending)
+        for start in range(0, len(ids), cls.CHUNK):
+            rows = db.session.query(Delivery.id, Delivery.order_number, Delivery.merchant_order_id).filter(
+                Delivery.api_key_id == api_key_id,
+                Delivery.merchant_order_id.in_(ids[start:start + cls.CHUNK])
+            )
+            for delivery_id, order_number, merchant_order_id in rows:
+                i = pending.pop(merchant_order_id)
+                results[i] = cls._result(i, merchant_order_id, 'exists', delivery_id, order_number)
+
+        if pending:
+            order = sorted(pending.values())
+            created = cls._create([items[i] for i in order], api_key_id)
+            for i, (delivery_id, order_number) in zip(order, created):
+                merchant_order_id = str(items[i]['merchant_order_id']).strip()
+                results[i] = cls._result(i, merchant_order_id, 'created', delivery_id, order_number)
+        db.session.commit()
+        return results
+
+    @staticmethod
+    def _result(index, merchant_order_id, status, delivery_id, order_number):
+        return {
+            'index': index,
+            'merchant_order_id': merchant_order_id,
+            'status': status,
+            'order_id': delivery_id,
+            'order_number': order_number,
+            'tracking_url': f"https://app.tzir.com/track/{order_number}"
+        }
+
+    @classmethod
+    def _create(cls, items, api_key_id=None):
+        """Insert addresses, points and deliveries for valid new items. Returns [(id, order_number)]."""
+        from models import db, Address, Delivery
+        from utils.address_dedup import address_dedup
+
+        addresses, delivery_hashes, pickup_hashes = {}, [], []
+        for item in items:
+            fields = cls._address_fields(item['delivery_address'], '0')
+            address_hash = cls._address_hash(fields)
+            addresses.setdefault(address_hash, fields)
+            delivery_hashes.append(address_hash)
+
+            pickup_hash = None
+            if item.get('pickup_address'):
+                fields = cls._address_fields(item['pickup_address'], '1')
+                pickup_hash = cls._address_hash(fields)
+                addresses.setdefault(pickup_hash, fields)
+            pickup_hashes.append(pickup_hash)
+        address_ids = cls._address_ids(addresses)
+
+        # A store-close batch has one or two pickup addresses: the regular lookup is fine for those
+        pickup_ids = {}
+        for pickup_hash in set(pickup_hashes) - {None}:
+            address = db.session.get(Address, address_ids[pickup_hash])
+            pickup_ids[pickup_hash] = address_dedup.get_or_create_pickup_point(
+                address, contact_name="Merchant Sender", contact_phone="000-0000000"
+            ).id
+
+        point_ids = cls._delivery_point_ids([{
+            'address_id': address_ids[address_hash],
+            'recipient_name': item['customer']['name'],
+            'recipient_phone': item['customer']['phone'],
+            'delivery_instructions': None,
+            'access_code': None,
+            'is_residential': True
+        } for item, address_hash in zip(items, delivery_hashes)])
+
+        delivery_rows = []
+        for item, point_id, pickup_hash in zip(items, point_ids, pickup_hashes):
+            package = item.get('package_details') or {}
+            delivery_rows.append({
+                'order_number': cls._order_number(),
+                'merchant_order_id': str(item['merchant_order_id']).strip(),
+                'api_key_id': api_key_id,
+                'customer_id': cls.DEFAULT_CUSTOMER_ID,
+                'pickup_point_id': pickup_ids[pickup_hash] if pickup_hash else cls.DEFAULT_PICKUP_POINT_ID,
+                'delivery_point_id': point_id,
+                'status': 'pending',
+                'package_description': package.get('description', 'Standard Package'),
+                'package_weight': float(package.get('weight', 1.0)),
+                'notes': item.get('notes')
+            })
+        return cls._insert_returning(Delivery.__table__, delivery_rows, ('id', 'order_number'))
+
+    @staticmethod
+    def _address_fields(data, default_number):
+        return {
+            'street': data.get('street'),
+            'building_number': str(data.get('number', default_number)),
+            'city': data.get('city'),
+            'apartment': data.get('apartment'),
+            'floor': data.get('floor'),
+            'entrance': data.get('entrance'),
+            'latitude': data.get('lat'),
+            'longitude': data.get('lon'),
+            'user_id': None
+        }
+
+    @staticmethod
+    def _address_hash(fields):
+        from models import Address
+        return Address.fingerprint(fields['street'], fields['building_number'], fields['city'], fields['apartment'],
+                                   fields['floor'], fields['entrance'], fields['latitude'], fields['longitude'])
+
+    @classmethod
+    def _address_ids(cls, by_hash):
+        """{address_hash: fields} -> {address_hash: Address.id}, inserting the ones not stored yet"""
+        from models import db, Address
+
+        found = {}
+        hashes = list(by_hash)
+        for start in range(0, len(hashes), cls.CHUNK):
+            rows = db.session.query(Address.address_hash, db.func.min(Address.id)).filter(
+                Address.address_hash.in_(hashes[start:start + cls.CHUNK])
+            ).group_by(Address.address_hash)
+            found.update(rows)
+
+        missing = [dict(fields, address_hash=h) for h, fields in by_hash.items() if h not in found]
+        for address_id, address_hash in cls._insert_returning(Address.__table__, missing, ('id', 'address_hash')):
+            found[address_hash] = address_id
+        return found
+
+    @classmethod
+    def _delivery_point_ids(cls, point_rows):
+        """DeliveryPoint id per row (same order), reusing identical existing points"""
+        from models import db, DeliveryPoint
+
+        def key(row):
+            return (row['address_id'], row['recipient_name'], row['recipient_phone'])
+
+        existing = {}
+        address_ids = sorted({row['address_id'] for row in point_rows})
+        for start in range(0, len(address_ids), cls.CHUNK):
+            rows = db.session.query(
+                DeliveryPoint.id, DeliveryPoint.address_id, DeliveryPoint.recipient_name, DeliveryPoint.recipient_phone
+            ).filter(
+                DeliveryPoint.address_id.in_(address_ids[start:start + cls.CHUNK]),
+                DeliveryPoint.delivery_instructions.is_(None),
+                DeliveryPoint.access_code.is_(None),
+                DeliveryPoint.is_residential.is_(True)
+            ).order_by(DeliveryPoint.id.desc())
+            for point_id, *point_key in rows:
+                existing[tuple(point_key)] = point_id  # Descending, so the lowest id wins
+
+        new_rows = {}
+        for row in point_rows:
+            if key(row) not in existing:
+                new_rows.setdefault(key(row), row)
+        inserted = cls._insert_returning(DeliveryPoint.__table__, list(new_rows.values()), ('id',))
+        existing.update(zip(new_rows, (point_id for (point_id,) in inserted)))
+        return [existing[key(row)] for row in point_rows]
+
+    @classmethod
+    def _insert_returning(cls, table, rows, columns):
+        """executemany INSERT in chunks; RETURNING rows come back in parameter order"""
+        from models import db
+
+        returned = []
+        statement = table.insert().returning(*(table.c[c] for c in columns), sort_by_parameter_order=True)
+        for start in range(0, len(rows), cls.CHUNK):
+            returned.extend(tuple(r) for r in db.session.execute(statement, rows[start:start + cls.CHUNK]))
+        return returned
+
+    @staticmethod
+    def _order_number():
+        # Longer suffix than single API orders: thousands per day must not collide
+        return f"API-{datetime.utcnow().strftime('%m%d')}-{uuid.uuid4().hex[:10].upper()}"
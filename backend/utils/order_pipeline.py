@@ -0,0 +1,100 @@
+"""
+Background stage of order creation.
+
+create_order persists the order and invoice in one transaction and replies;
+everything else runs here on the job queue, each step as its own retryable job
+so a failed push doesn't re-run allocation (and vice versa):
+
+    announce_new_order   admin dashboard socket event
+    push_new_mission     push notification to available couriers
+    allocate_order       AllocationEngine pick + pending->assigned transition
+    audit_order_created  CREATE_ORDER audit entry
+"""
+import logging
+
+from utils.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_order_created(app, delivery_id, order_number, customer_name, total_amount, user_id, ip_address):
+    job_queue.enqueue(app, announce_new_order, delivery_id, order_number, customer_name)
+    job_queue.enqueue(app, push_new_mission, delivery_id, total_amount)
+    job_queue.enqueue(app, allocate_order, delivery_id)
+    job_queue.enqueue(app, audit_order_created, delivery_id, order_number, total_amount, user_id, ip_address)
+
+
+def announce_new_order(delivery_id, order_number, customer_name):
+    from extensions import socketio
+    socketio.emit('new_order', {
+        'id': delivery_id,
+        'order_number': order_number,
+        'status': 'pending',
+        'customer': customer_name
+    }, room='admin_room')
+
+
+def push_new_mission(delivery_id, total_amount):
+    from models import db, Delivery
+    from services.notifications import notify_new_mission
+    delivery = db.session.get(Delivery, delivery_id)
+    if delivery is not None:
+        notify_new_mission(delivery, price=total_amount)
+
+
+def allocate_order(delivery_id):
+    """
+    Assign the best courier unless the order was already taken (batch
+    allocation, manual assignment) in the meantime: the transition only matches
+    a still-pending, unassigned row, so a retry can never double-assign.
+    """
+    from models import db, Delivery
+    from utils.allocation_engine import AllocationEngine
+    from utils.delivery_state import TransitionError, delivery_state
+
+    delivery = db.session.get(Delivery, delivery_id)
+    if delivery is None or delivery.status != 'pending' or delivery.courier_id is not None:
+        return
+
+    logger.info(f"Starting auto-allocation for {delivery.order_number}...")
+    best_courier = AllocationEngine.find_best_courier(delivery)
+    if not best_courier:
+        return
+
+    try:
+        delivery_state.transition(delivery_id, 'assigned', expected='pending', unassigned=True,
+                                  courier_id=best_courier.id)
+    except TransitionError:
+        db.session.rollback()
+        return
+    # Commit publishes order_update, the dashboard counters and the rollup mark
+    db.session.commit()
+    logger.info(f"Auto-assigned {delivery.order_number} to {best_courier.full_name}")
+
+    # The assignment is committed; a socket hiccup must not trigger a retry
+    from extensions import socketio
+    try:
+        db.session.refresh(delivery)
+        socketio.emit('new_assignment', {
+            'order_id': delivery.id,
+            'order_number': delivery.order_number,
+            'pickup_address': delivery.pickup_point.address.street,
+            'delivery_address': delivery.delivery_point.address.street,
+            'package_size': delivery.package_size,
+            'notes': delivery.notes
+        }, room=f"courier_{best_courier.id}")
+    except Exception as e:
+        logger.warning(f"Socket error notify courier: {e}")
+
+
+def audit_order_created(delivery_id, order_number, total_amount, user_id, ip_address):
+    from utils.audit import log_audit
+    log_audit(
+        action='CREATE_ORDER',
+        user_id=user_id,
+        resource_type='Delivery',
+        resource_id=delivery_id,
+        details=f"Order {order_number} created with price {total_amount}",
+        status='SUCCESS',
+        ip_address=ip_address
+    )
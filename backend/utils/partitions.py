@@ -0,0 +1,216 @@
+"""
+Monthly partitions and retention for the append-only tables.
+
+On Postgres, audit_logs and delivery_tracking are range-partitioned on
+"timestamp" into one partition per month (<table>_pYYYYMM) plus a
+<table>_default catch-all. Writers (log_audit, the location buffer) keep
+inserting into the parent table; Postgres routes each row.
+
+Retention exports every month older than its table's window to
+ARCHIVE_DIR/<table>/<table>_YYYYMM.ndjson.gz, checks the exported row count
+against the partition and only then drops it - a DROP is instant and leaves
+nothing to vacuum. Other databases have no partitions: the same months are
+exported and then deleted by timestamp range.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+
+from sqlalchemy import func, select, text
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionManager:
+    """Creates upcoming monthly partitions and archives expired ones."""
+
+    RETENTION_MONTHS = {'audit_logs': 24, 'delivery_tracking': 6}
+    MONTHS_AHEAD = 2
+    EXPORT_BATCH = 5000
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(os.getcwd(), 'archive')
+
+    def __init__(self, archive_dir=None, retention_months=None):
+        self.archive_dir = archive_dir or self.ARCHIVE_DIR
+        self.retention_months = {**self.RETENTION_MONTHS, **(retention_months or {})}
+
+    # --- Months ---
+
+    @staticmethod
+    def add_months(month, n):
+        index = month.year * 12 + month.month - 1 + n
+        return date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def partition_name(table, month):
+        return f"{table}_p{month:%Y%m}"
+
+    def cutoff(self, table, today=None):
+        """First month kept for table; everything before it is expired."""
+        today = today or datetime.utcnow().date()
+        return self.add_months(today.replace(day=1), -self.retention_months[table])
+
+    # --- Partitions (Postgres) ---
+
+    @staticmethod
+    def _is_postgres():
+        from models import db
+        return db.engine.dialect.name == 'postgresql'
+
+    @staticmethod
+    def partitions(table):
+        """{month: partition name} of table's monthly partitions (empty when not partitioned)"""
+        from models import db
+
+        names = db.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ), {'table': table}).scalars()
+        pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})(\d{{2}})$")
+        months = {}
+        for name in names:
+            match = pattern.match(name)
+            if match:
+                months[date(int(match.group(1)), int(match.group(2)), 1)] = name
+        return months
+
+    def ensure_partitions(self, months_ahead=MONTHS_AHEAD, today=None):
+        """Create this month's and the next months_ahead months' partitions where missing. Commits."""
+        from models import db
+
+        if not self._is_postgres():
+            return []
+        this_month = (today or datetime.utcnow().date()).replace(day=1)
+        created = []
+        for table in self.retention_months:
+            existing = self.partitions(table)
+            for n in range(months_ahead + 1):
+                month = self.add_months(this_month, n)
+                if month in existing:
+                    continue
+                try:
+                    self._create_partition(table, month)
+                    db.session.commit()
+                    created.append(self.partition_name(table, month))
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Creating partition {self.partition_name(table, month)} failed: {e}")
+        if created:
+            logger.info(f"Created partitions {', '.join(created)}")
+        return created
+
+    def _create_partition(self, table, month):
+        from models import db
+
+        name, default = self.partition_name(table, month), f"{table}_default"
+        bounds = {'start': month, 'end': self.add_months(month, 1)}
+        # Postgres refuses a new partition while the default one holds rows in
+        # its range: move them over with the default detached
+        stranded = db.session.execute(text(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end)'
+        ), bounds).scalar()
+        if stranded:
+            db.session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+        db.session.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        ))
+        if stranded:
+            db.session.execute(text(
+                f'WITH moved AS (DELETE FROM {default} WHERE "timestamp" >= :start AND "timestamp" < :end '
+                f'RETURNING *) INSERT INTO {table} SELECT * FROM moved'
+            ), bounds)
+            db.session.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+    # --- Retention ---
+
+    def expired_months(self, table, today=None):
+        """Months of table older than its retention window that still hold (or may hold) rows"""
+        from models import db
+
+        cutoff = self.cutoff(table, today)
+        if self._is_postgres():
+            partitions = self.partitions(table)
+            if partitions:
+                return sorted(month for month in partitions if month < cutoff)
+
+        # Hop from one populated month to the next (one indexed min() each)
+        column = db.metadata.tables[table].c.timestamp
+        months, start = [], None
+        while True:
+            query = select(func.min(column)).where(column < cutoff)
+            if start is not None:
+                query = query.where(column >= start)
+            oldest = db.session.execute(query).scalar()
+            if oldest is None:
+                return months
+            months.append(oldest.date().replace(day=1))
+            start = self.add_months(months[-1], 1)
+
+    def archive_month(self, table, month):
+        """
+        Export one month of table to a gzipped NDJSON file, then drop its
+        partition (or delete its rows). Commits. Returns {'table', 'month', 'rows', 'path'}.
+        """
+        from models import db
+
+        model_table = db.metadata.tables[table]
+        start, end = month, self.add_months(month, 1)
+        directory = os.path.join(self.archive_dir, table)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{table}_{month:%Y%m}.ndjson.gz")
+
+        query = select(model_table).where(
+            model_table.c.timestamp >= start, model_table.c.timestamp < end
+        ).order_by(model_table.c.id).execution_options(yield_per=self.EXPORT_BATCH)
+
+        # Write aside and rename, so a crash never leaves a truncated archive behind
+        rows = 0
+        partial = f"{path}.partial"
+        with gzip.open(partial, 'wt', encoding='utf-8') as out:
+            for row in db.session.execute(query).mappings():
+                out.write(json.dumps(dict(row), default=_json_default, ensure_ascii=False) + '\n')
+                rows += 1
+        os.replace(partial, path)
+
+        try:
+            partition = self.partitions(table).get(month) if self._is_postgres() else None
+            if partition:
+                # Nothing may land in an expired month, but check before dropping it
+                current = db.session.execute(text(f"SELECT count(*) FROM {partition}")).scalar()
+                if current != rows:
+                    raise RuntimeError(f"{partition} has {current} rows, archived {rows}")
+                db.session.execute(text(f"DROP TABLE {partition}"))
+            else:
+                db.session.execute(model_table.delete().where(
+                    model_table.c.timestamp >= start, model_table.c.timestamp < end))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        logger.info(f"Archived {rows} rows of {table} for {month:%Y-%m} to {path}")
+        return {'table': table, 'month': f"{month:%Y-%m}", 'rows': rows, 'path': path}
+
+    def run(self, today=None):
+        """Create upcoming partitions, then archive and drop every expired month, one commit per month."""
+        created = self.ensure_partitions(today=today)
+        archived = []
+        for table in self.retention_months:
+            for month in self.expired_months(table, today):
+                try:
+                    archived.append(self.archive_month(table, month))
+                except Exception as e:
+                    logger.error(f"Archiving {table} for {month:%Y-%m} failed: {e}")
+        return {'created': created, 'archived': archived}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+partition_manager = PartitionManager()
@@ -0,0 +1,189 @@
+"""
+Per-request SQL instrumentation.
+
+Engine events count every statement a request executes, time it, and group it
+by shape (literals and IN-lists folded), so an endpoint that runs the same
+shape over and over - the N+1 pattern - shows up by name:
+
+    X-Query-Count / X-DB-Time-Ms   response headers (debug, or QUERY_STATS_HEADER=1)
+    GET /api/admin/perf            per-endpoint summary since startup
+    assert_max_queries(n)          test helper pinning a block's query budget
+"""
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = 5  # Same statement shape this many times in one request
+MAX_SHAPES_PER_ENDPOINT = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_shape(statement):
+    """SQL with literals, numbers and expanded IN lists folded, for grouping"""
+    shape = _STRING_RE.sub('?', statement)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+class RequestQueries:
+    """Statements executed while serving one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        return {shape: n for shape, n in self.shapes.most_common() if n >= threshold}
+
+
+class QueryStats:
+    """Aggregates RequestQueries per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def add(self, endpoint, queries):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries_total': 0, 'queries_max': 0, 'db_ms_total': 0.0, 'db_ms_max': 0.0,
+                'repeated_shapes': {}
+            })
+            db_ms = queries.seconds * 1000
+            stats['requests'] += 1
+            stats['queries_total'] += queries.count
+            stats['queries_max'] = max(stats['queries_max'], queries.count)
+            stats['db_ms_total'] += db_ms
+            stats['db_ms_max'] = max(stats['db_ms_max'], db_ms)
+            shapes = stats['repeated_shapes']
+            for shape, n in queries.repeated().items():
+                shapes[shape] = max(shapes.get(shape, 0), n)
+            if len(shapes) > MAX_SHAPES_PER_ENDPOINT:
+                stats['repeated_shapes'] = dict(Counter(shapes).most_common(MAX_SHAPES_PER_ENDPOINT))
+
+    def summary(self):
+        """Endpoints by total queries, heaviest first"""
+        with self._lock:
+            rows = [dict(stats, endpoint=endpoint,
+                         queries_avg=round(stats['queries_total'] / stats['requests'], 1),
+                         db_ms_avg=round(stats['db_ms_total'] / stats['requests'], 2),
+                         db_ms_total=round(stats['db_ms_total'], 2),
+                         db_ms_max=round(stats['db_ms_max'], 2),
+                         repeated_shapes=dict(stats['repeated_shapes']))
+                    for endpoint, stats in self._endpoints.items()]
+        return sorted(rows, key=lambda r: r['queries_total'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+query_stats = QueryStats()
+
+# Collectors for assert_max_queries blocks, per thread (with or without a request):
+# statements background threads run meanwhile (audit writer, location flusher,
+# geocoder) don't count against the block
+_local = threading.local()
+
+
+def _watchers():
+    if not hasattr(_local, 'watchers'):
+        _local.watchers = []
+    return _local.watchers
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, so a failed statement can't leave a stale start behind
+    if context is not None:
+        context._query_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_stats_start', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    if has_request_context():
+        queries = g.get('request_queries')
+        if queries is not None:
+            queries.record(statement, elapsed)
+    for watcher in _watchers():
+        watcher.record(statement, elapsed)
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_query_stats(app):
+    """Hook the app's engine and collect per-request statement counts."""
+    from extensions import db
+
+    with app.app_context():
+        instrument_engine(db.engine)
+
+    show_header = app.debug or os.getenv('QUERY_STATS_HEADER') == '1'
+
+    @app.before_request
+    def _start_request_queries():
+        g.request_queries = RequestQueries()
+
+    @app.after_request
+    def _finish_request_queries(response):
+        queries = g.pop('request_queries', None)
+        if queries is None or request.endpoint is None:
+            return response
+        query_stats.add(request.endpoint, queries)
+        repeated = queries.repeated()
+        if repeated:
+            shape, n = next(iter(repeated.items()))
+            logger.warning(f"Possible N+1 in {request.endpoint}: {n}x {shape[:200]}")
+        if show_header:
+            response.headers['X-Query-Count'] = str(queries.count)
+            response.headers['X-DB-Time-Ms'] = f"{queries.seconds * 1000:.1f}"
+        return response
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """
+    Fail if the block runs more than `limit` statements on an instrumented
+    engine, counting only the calling thread's statements. Yields the RequestQueries collector for further assertions.
+
+        with assert_max_queries(4):
+            client.get('/api/orders', headers=auth)
+    """
+    from extensions import db
+
+    instrument_engine(db.engine)
+    queries = RequestQueries()
+    _watchers().append(queries)
+    try:
+        yield queries
+    finally:
+        _watchers().remove(queries)
+    if queries.count > limit:
+        listing = '\n'.join(f"  {n}x {shape}" for shape, n in queries.shapes.most_common())
+        raise AssertionError(f"Expected at most {limit} queries, ran {queries.count}:\n{listing}")
@@ -0,0 +1,323 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_NO_ROUTE = {}  # In-process marker for a recently failed lookup
+
+
+def geohash_encode(lat, lng, precision):
+    """Standard geohash of (lat, lng). Precision 7 is a ~150m x 150m cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch, lng_lo = (ch << 1) | 1, mid
+            else:
+                ch, lng_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return ''.join(chars)
+
+
+def geohash_center(geohash):
+    """Center (lat, lng) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _GEOHASH_BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+class LRUCache:
+    """Small thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, maxsize, ttl_seconds):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl_seconds or self.ttl_seconds))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RouteCache:
+    """
+    Single routing cache for order creation, quoting and allocation.
+    Endpoints are quantized to geohash cells, so nearby requests share an entry
+    and OSRM is always asked for the cell centers. Lookups go through an
+    in-process LRU, then the route_cache table, then OSRM. Both tiers expire
+    entries after TTL_SECONDS. Failed lookups (no route, OSRM unreachable) are
+    remembered in-process only, for NEGATIVE_TTL_SECONDS.
+    """
+
+    PRECISION = 7
+    TTL_SECONDS = int(os.getenv('ROUTE_CACHE_TTL', 7 * 24 * 3600))
+    NEGATIVE_TTL_SECONDS = 60
+    LRU_SIZE = 20000
+    HTTP_TIMEOUT = 5
+    MAX_TABLE_LOCATIONS = 100  # OSRM's default --max-table-size
+    MAX_TABLE_DESTINATIONS = 25
+
+    def __init__(self, osrm_url=None, precision=PRECISION, ttl_seconds=TTL_SECONDS, lru_size=LRU_SIZE):
+        # Optional consumers (allocation re-ranking) only call OSRM when it was configured explicitly
+        self.configured = bool(osrm_url or os.getenv('OSRM_URL'))
+        self.osrm_url = osrm_url or os.getenv('OSRM_URL', 'http://localhost:5000')
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(lru_size, ttl_seconds)
+        self.http = requests.Session()  # Keep-alive to OSRM
+        self.stats = {'local_hits': 0, 'persistent_hits': 0, 'misses': 0, 'errors': 0}
+
+    def cell(self, lat, lng):
+        return geohash_encode(float(lat), float(lng), self.precision)
+
+    def key(self, from_cell, to_cell):
+        return f"{from_cell}:{to_cell}"
+
+    def get_route(self, from_lat, from_lng, to_lat, to_lng):
+        """Returns {'distance_km', 'duration_min'} or None if no route could be found."""
+        key = self.key(self.cell(from_lat, from_lng), self.cell(to_lat, to_lng))
+        route = self.lookup(key)
+        if route is _NO_ROUTE:
+            return None
+        if route is not None:
+            return route
+
+        self.stats['misses'] += 1
+        route = self._fetch_route(key)
+        if route is not None:
+            self.put(key, route)
+        else:
+            self.local.set(key, _NO_ROUTE, ttl_seconds=self.NEGATIVE_TTL_SECONDS)
+        return route
+
+    def get_matrix(self, sources, destinations):
+        """
+        Road distance/duration for every (source, destination) pair of (lat, lng)
+        points. Pairs are cached individually, so overlapping matrices reuse each
+        other; whatever is missing is fetched with as few OSRM /table calls as
+        the table size limit allows. Returns rows of {'distance_km', 'duration_min'}
+        (None where OSRM found no route).
+        """
+        src_cells = [self.cell(lat, lng) for lat, lng in sources]
+        dst_cells = [self.cell(lat, lng) for lat, lng in destinations]
+
+        known = {}
+        pairs = {self.key(s, d) for s in src_cells for d in dst_cells}
+        for key in pairs:
+            route = self.local.get(key)
+            if route is not None:
+                known[key] = route
+        self.stats['local_hits'] += len(known)
+
+        missing = pairs - known.keys()
+        if missing:
+            loaded = self._load_many(missing)
+            self.stats['persistent_hits'] += len(loaded)
+            for key, route in loaded.items():
+                self.local.set(key, route)
+            known.update(loaded)
+            missing -= loaded.keys()
+
+        if missing:
+            self.stats['misses'] += len(missing)
+            fetched = self._fetch_table(missing)
+            for key, route in fetched.items():
+                self.local.set(key, route)
+            for key in missing - fetched.keys():
+                self.local.set(key, _NO_ROUTE, ttl_seconds=self.NEGATIVE_TTL_SECONDS)
+            self._store_many(fetched)
+            known.update(fetched)
+
+        known = {key: route for key, route in known.items() if route is not _NO_ROUTE}
+        return [[known.get(self.key(s, d)) for d in dst_cells] for s in src_cells]
+
+    def lookup(self, key):
+        """Cached route for a key from either tier, without calling OSRM (_NO_ROUTE after a recent failure)."""
+        route = self.local.get(key)
+        if route is not None:
+            self.stats['local_hits'] += 1
+            return route
+
+        route = self._load(key)
+        if route is not None:
+            self.stats['persistent_hits'] += 1
+            self.local.set(key, route)
+        return route
+
+    def put(self, key, route):
+        self.local.set(key, route)
+        self._store(key, route)
+
+    def purge_expired(self):
+        """Delete expired rows from the persistent tier. Returns the count removed."""
+        from models import db, RouteCacheEntry
+        table = RouteCacheEntry.__table__
+        with db.engine.begin() as conn:
+            return conn.execute(table.delete().where(table.c.expires_at < datetime.utcnow())).rowcount
+
+    def _fetch_route(self, key):
+        from_cell, to_cell = key.split(':')
+        (from_lat, from_lng), (to_lat, to_lng) = geohash_center(from_cell), geohash_center(to_cell)
+        try:
+            response = self.http.get(
+                f"{self.osrm_url}/route/v1/driving/{from_lng},{from_lat};{to_lng},{to_lat}",
+                params={'overview': 'false'}, timeout=self.HTTP_TIMEOUT
+            )
+            data = response.json()
+            if data.get('code') == 'Ok' and data.get('routes'):
+                route = data['routes'][0]
+                return {'distance_km': route['distance'] / 1000, 'duration_min': route['duration'] / 60}
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"OSRM route lookup failed: {e}")
+        return None
+
+    def _fetch_table(self, keys):
+        """OSRM /table for the given pair keys, chunked to MAX_TABLE_LOCATIONS."""
+        wanted_src = sorted({k.split(':')[0] for k in keys})
+        wanted_dst = sorted({k.split(':')[1] for k in keys})
+        dst_size = min(len(wanted_dst), self.MAX_TABLE_DESTINATIONS)
+        src_size = self.MAX_TABLE_LOCATIONS - dst_size
+
+        result = {}
+        for d0 in range(0, len(wanted_dst), dst_size):
+            dst_chunk = wanted_dst[d0:d0 + dst_size]
+            for s0 in range(0, len(wanted_src), src_size):
+                src_chunk = wanted_src[s0:s0 + src_size]
+                if not any(self.key(s, d) in keys for s in src_chunk for d in dst_chunk):
+                    continue
+                result.update(self._request_table(src_chunk, dst_chunk))
+        return result
+
+    def _request_table(self, src_cells, dst_cells):
+        points = [geohash_center(c) for c in src_cells + dst_cells]
+        coords = ';'.join(f"{lng},{lat}" for lat, lng in points)
+        n = len(src_cells)
+        try:
+            response = self.http.get(
+                f"{self.osrm_url}/table/v1/driving/{coords}",
+                params={
+                    'sources': ';'.join(str(i) for i in range(n)),
+                    'destinations': ';'.join(str(i) for i in range(n, len(points))),
+                    'annotations': 'distance,duration',
+                },
+                timeout=self.HTTP_TIMEOUT
+            )
+            data = response.json()
+            if data.get('code') != 'Ok':
+                raise ValueError(data.get('message') or data.get('code'))
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"OSRM table lookup failed: {e}")
+            return {}
+
+        result = {}
+        for i, s in enumerate(src_cells):
+            for j, d in enumerate(dst_cells):
+                distance, duration = data['distances'][i][j], data['durations'][i][j]
+                if distance is not None and duration is not None:
+                    result[self.key(s, d)] = {'distance_km': distance / 1000, 'duration_min': duration / 60}
+        return result
+
+    # Persistent tier: its own short transaction, never the caller's session
+    def _load_many(self, keys):
+        from flask import has_app_context
+        if not has_app_context():
+            return {}
+        from models import db, RouteCacheEntry
+        table = RouteCacheEntry.__table__
+        keys, found = list(keys), {}
+        try:
+            with db.engine.connect() as conn:
+                for start in range(0, len(keys), 500):
+                    rows = conn.execute(table.select().where(
+                        table.c.key.in_(keys[start:start + 500]), table.c.expires_at > datetime.utcnow()
+                    ))
+                    for row in rows:
+                        found[row.key] = {'distance_km': row.distance_km, 'duration_min': row.duration_min}
+        except Exception as e:
+            logger.warning(f"Route cache read failed: {e}")
+            return {}
+        return found
+
+    def _store_many(self, routes):
+        from flask import has_app_context
+        if not routes or not has_app_context():
+            return
+        from models import db, RouteCacheEntry
+        table = RouteCacheEntry.__table__
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl_seconds)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key.in_(list(routes))))
+                conn.execute(table.insert(), [
+                    {'key': key, 'distance_km': r['distance_km'], 'duration_min': r['duration_min'],
+                     'created_at': now, 'expires_at': expires}
+                    for key, r in routes.items()
+                ])
+        except Exception as e:
+            logger.warning(f"Route cache write failed: {e}")
+
+    def _load(self, key):
+        return self._load_many([key]).get(key)
+
+    def _store(self, key, route):
+        self._store_many({key: route})
+
+
+route_cache = RouteCache()
@@ -0,0 +1,200 @@
+"""
+Compact storage for DeliveryTracking breadcrumbs.
+
+Once a delivery is closed its row-per-point track is rolled up into
+DeliveryTrackSegment rows. Each segment holds up to SEGMENT_POINTS points,
+stored column by column as packed little-endian deltas and zlib-compressed:
+
+    header   <I q i i   point count, first timestamp (epoch ms), first lat/lng (micro-degrees)
+    dt       int32[n-1] millisecond deltas
+    dlat     int32[n-1] micro-degree deltas
+    dlng     int32[n-1] micro-degree deltas
+    speed    int16[n]   tenths of km/h, NULL_I16 when unknown
+    heading  int16[n]   tenths of a degree, NULL_I16 when unknown
+
+Precision is 1e-6 degrees (~11cm), 1ms, 0.1 km/h and 0.1 degree.
+"""
+import logging
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import accumulate, groupby
+
+logger = logging.getLogger(__name__)
+
+ENCODING_V1 = 1
+HEADER = struct.Struct('<Iqii')
+NULL_I16 = -32768
+MICRO = 1_000_000
+EPOCH = datetime(1970, 1, 1)
+
+TrackPoint = namedtuple('TrackPoint', ['timestamp', 'latitude', 'longitude', 'speed', 'heading'])
+
+
+def _pack(typecode, values):
+    arr = array(typecode, values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack(typecode, buf, offset, count):
+    arr = array(typecode)
+    arr.frombytes(buf[offset:offset + count * arr.itemsize])
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr, offset + count * arr.itemsize
+
+
+def _to_i16(value):
+    return NULL_I16 if value is None else int(round(value * 10))
+
+
+def _from_i16(value):
+    return None if value == NULL_I16 else value / 10
+
+
+def _deltas(values):
+    return [b - a for a, b in zip(values, values[1:])]
+
+
+def encode_points(points):
+    """Encode a non-empty, time-ordered sequence of TrackPoint-like tuples to bytes."""
+    ts = [(p[0] - EPOCH) // timedelta(milliseconds=1) for p in points]
+    lats = [int(round(p[1] * MICRO)) for p in points]
+    lngs = [int(round(p[2] * MICRO)) for p in points]
+
+    payload = b''.join([
+        HEADER.pack(len(points), ts[0], lats[0], lngs[0]),
+        _pack('i', _deltas(ts)),
+        _pack('i', _deltas(lats)),
+        _pack('i', _deltas(lngs)),
+        _pack('h', [_to_i16(p[3]) for p in points]),
+        _pack('h', [_to_i16(p[4]) for p in points]),
+    ])
+    return zlib.compress(payload, 9)
+
+
+def decode_points(data):
+    """Yield TrackPoint tuples from a segment produced by encode_points."""
+    buf = zlib.decompress(data)
+    count, t0, lat0, lng0 = HEADER.unpack_from(buf)
+    offset = HEADER.size
+    dt, offset = _unpack('i', buf, offset, count - 1)
+    dlat, offset = _unpack('i', buf, offset, count - 1)
+    dlng, offset = _unpack('i', buf, offset, count - 1)
+    speeds, offset = _unpack('h', buf, offset, count)
+    headings, offset = _unpack('h', buf, offset, count)
+
+    for t, lat, lng, speed, heading in zip(
+        accumulate(dt, initial=t0), accumulate(dlat, initial=lat0), accumulate(dlng, initial=lng0),
+        speeds, headings
+    ):
+        yield TrackPoint(EPOCH + timedelta(milliseconds=t), lat / MICRO, lng / MICRO,
+                         _from_i16(speed), _from_i16(heading))
+
+
+class TrackStorage:
+    """Rolls up closed deliveries' breadcrumbs and streams them back."""
+
+    CLOSED_STATUSES = ('delivered', 'cancelled', 'failed')
+    SEGMENT_POINTS = 3600  # One hour at one ping per second
+    READ_BATCH = 1000
+
+    @classmethod
+    def iter_track(cls, delivery_id):
+        """
+        Stream a delivery's points in time order: compacted segments first,
+        then any raw rows that arrived after (or were never) compacted.
+        """
+        from models import db, DeliveryTrackSegment, DeliveryTracking
+
+        segments = db.session.query(DeliveryTrackSegment.data).filter(
+            DeliveryTrackSegment.delivery_id == delivery_id
+        ).order_by(DeliveryTrackSegment.seq).yield_per(1)
+        for (data,) in segments:
+            yield from decode_points(data)
+
+        rows = db.session.query(
+            DeliveryTracking.timestamp, DeliveryTracking.latitude, DeliveryTracking.longitude,
+            DeliveryTracking.speed, DeliveryTracking.heading
+        ).filter(
+            DeliveryTracking.delivery_id == delivery_id
+        ).order_by(DeliveryTracking.timestamp, DeliveryTracking.id).yield_per(cls.READ_BATCH)
+        for row in rows:
+            yield TrackPoint(*row)
+
+    @classmethod
+    def compact_delivery(cls, delivery_id):
+        """
+        Move a delivery's raw tracking rows into compressed segments (no commit).
+        A segment never spans a courier change (reassignment mid-delivery).
+        Returns the number of points compacted.
+        """
+        from sqlalchemy import func
+        from models import db, DeliveryTrackSegment, DeliveryTracking
+
+        rows = db.session.query(
+            DeliveryTracking.id, DeliveryTracking.courier_id,
+            DeliveryTracking.timestamp, DeliveryTracking.latitude, DeliveryTracking.longitude,
+            DeliveryTracking.speed, DeliveryTracking.heading
+        ).filter(
+            DeliveryTracking.delivery_id == delivery_id
+        ).order_by(DeliveryTracking.timestamp, DeliveryTracking.id).all()
+        if not rows:
+            return 0
+
+        # Late points after an earlier compaction become the next segment
+        seq = db.session.query(func.max(DeliveryTrackSegment.seq)).filter(
+            DeliveryTrackSegment.delivery_id == delivery_id
+        ).scalar()
+        seq = -1 if seq is None else seq
+
+        for courier_id, run in groupby(rows, key=lambda r: r.courier_id):
+            run = list(run)
+            for start in range(0, len(run), cls.SEGMENT_POINTS):
+                chunk = run[start:start + cls.SEGMENT_POINTS]
+                seq += 1
+                db.session.add(DeliveryTrackSegment(
+                    delivery_id=delivery_id,
+                    courier_id=courier_id,
+                    seq=seq,
+                    point_count=len(chunk),
+                    started_at=chunk[0].timestamp,
+                    ended_at=chunk[-1].timestamp,
+                    encoding=ENCODING_V1,
+                    data=encode_points([r[2:] for r in chunk]),
+                ))
+
+        ids = [r.id for r in rows]
+        for start in range(0, len(ids), cls.READ_BATCH):
+            db.session.query(DeliveryTracking).filter(
+                DeliveryTracking.id.in_(ids[start:start + cls.READ_BATCH])
+            ).delete(synchronize_session=False)
+        return len(rows)
+
+    @classmethod
+    def compact_closed(cls, limit=500):
+        """Compact every closed delivery that still has raw tracking rows, one commit per delivery."""
+        from models import db, Delivery, DeliveryTracking
+
+        delivery_ids = [d for (d,) in db.session.query(DeliveryTracking.delivery_id).join(
+            Delivery, Delivery.id == DeliveryTracking.delivery_id
+        ).filter(
+            Delivery.status.in_(cls.CLOSED_STATUSES)
+        ).distinct().limit(limit).all()]
+
+        total = 0
+        for delivery_id in delivery_ids:
+            try:
+                total += cls.compact_delivery(delivery_id)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Track compaction failed for delivery {delivery_id}: {e}")
+
+        logger.info(f"Compacted {total} tracking points from {len(delivery_ids)} deliveries")
+        return len(delivery_ids), total